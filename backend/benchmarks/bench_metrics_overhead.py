@@ -0,0 +1,103 @@
+"""Cost of the metrics subsystem per request and per observation.
+
+Drives a FastAPI app through raw ASGI calls (no HTTP client in the loop, so
+the middleware's share is not hidden by client overhead) with and without
+MetricsMiddleware, and times the primitive operations on their own.
+
+    cd backend && python benchmarks/bench_metrics_overhead.py --requests 50000
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import timeit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import FastAPI
+
+from services import metrics
+
+
+def build_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/payments/stripe/status/{session_id}")
+    async def status(session_id: str):
+        return {"session_id": session_id, "payment_status": "pending"}
+
+    if instrumented:
+        app.add_middleware(metrics.MetricsMiddleware)
+    return app
+
+
+async def drive(app, total: int) -> float:
+    """Seconds per request over `total` sequential requests"""
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def scope(i):
+        path = f"/api/payments/stripe/status/cs_{i % 1000}"
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+            "root_path": "", "query_string": b"", "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 1), "server": ("bench", 80),
+        }
+
+    for i in range(200):  # warm up routing and label children
+        await app(scope(i), receive, send)
+    started = time.perf_counter()
+    for i in range(total):
+        await app(scope(i), receive, send)
+    return (time.perf_counter() - started) / total
+
+
+def primitive_costs() -> dict:
+    counter = metrics.Counter("bench_counter", "bench", ("route",))
+    histogram = metrics.Histogram("bench_histogram", "bench", ("route",))
+    n = 200_000
+    return {
+        "counter_inc_ns": round(timeit.timeit(lambda: counter.labels("/x").inc(), number=n) / n * 1e9),
+        "histogram_observe_ns": round(timeit.timeit(lambda: histogram.labels("/x").observe(0.0123), number=n) / n * 1e9),
+        "render_ms": round(timeit.timeit(metrics.registry.render, number=50) / 50 * 1e3, 3),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    plain, instrumented = build_app(False), build_app(True)
+    baseline, with_metrics = [], []
+    # Interleave rounds so machine noise hits both variants alike
+    for _ in range(args.rounds):
+        baseline.append(await drive(plain, args.requests))
+        with_metrics.append(await drive(instrumented, args.requests))
+
+    base_us = statistics.median(baseline) * 1e6
+    inst_us = statistics.median(with_metrics) * 1e6
+    result = {
+        "requests_per_round": args.requests,
+        "baseline_us_per_request": round(base_us, 2),
+        "instrumented_us_per_request": round(inst_us, 2),
+        "overhead_us_per_request": round(inst_us - base_us, 2),
+        "overhead_pct": round((inst_us - base_us) / base_us * 100, 2),
+        **primitive_costs(),
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
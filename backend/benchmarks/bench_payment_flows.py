@@ -0,0 +1,305 @@
+"""Throughput and tail latency of the checkout and verification flows.
+
+Drives the real app in-process (see harness.py) with concurrent clients and
+writes one JSON file per run, tagged with the git commit, so runs can be
+compared across commits:
+
+    cd backend && python benchmarks/bench_payment_flows.py
+    python benchmarks/bench_payment_flows.py --compare ../test_reports/benchmarks/<baseline>.json
+
+Scenarios: submit_payment, stripe_create_checkout, stripe_status_poll,
+manual_status_poll, razorpay_create_order, razorpay_verify, stripe_webhook,
+razorpay_webhook. Webhook scenarios also report how long the background
+workers take to apply every accepted event.
+"""
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+import uuid
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import harness
+
+RESULTS_DIR = harness.REPO_DIR / "test_reports" / "benchmarks"
+ORIGIN = "http://bench.local"
+# Fraction of webhook deliveries that repeat an earlier event id (gateways retry)
+WEBHOOK_DUPLICATE_RATE = 0.1
+
+
+def _manual_payment(i: int) -> dict:
+    return {
+        "package_id": "starter",
+        "package_name": "Starter",
+        "amount": 2400.0,
+        "payment_method": "upi" if i % 2 else "bank_transfer",
+        "transaction_id": f"UTR{uuid.uuid4().hex[:12].upper()}",
+        "user_name": f"Bench User {i}",
+        "user_email": f"bench{i}@example.com",
+    }
+
+
+async def _create_sessions(client, count: int) -> list:
+    sessions = []
+    for i in range(count):
+        r = await client.post("/api/payments/stripe/create-checkout", json={
+            "package_id": "pro", "origin_url": ORIGIN, "currency": "usd", "user_email": f"s{i}@example.com",
+        })
+        sessions.append(r.json()["session_id"])
+    return sessions
+
+
+async def _create_orders(client, count: int, concurrency: int) -> list:
+    orders = []
+
+    async def send(i):
+        r = await client.post("/api/payments/razorpay/create-order", json={
+            "package_id": "starter", "user_email": f"r{i}@example.com",
+        })
+        orders.append(r.json()["order_id"])
+        return r.status_code
+
+    await harness.run_load(send, count, concurrency)
+    return orders
+
+
+async def _wait_for_webhooks(accepted: int, before: int, timeout: float = 120.0) -> float:
+    """Seconds until the ingestor has applied `accepted` more events"""
+    from services.webhook_ingest import webhook_ingestor
+
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        counters = webhook_ingestor.stats()
+        if counters["processed"] + counters["failed"] - before >= accepted:
+            break
+        await asyncio.sleep(0.01)
+    return round(time.perf_counter() - started, 3)
+
+
+async def scenario_submit_payment(client, n, c):
+    async def send(i):
+        r = await client.post("/api/manual-payments/submit-payment", json=_manual_payment(i))
+        return r.status_code
+    return await harness.run_load(send, n, c)
+
+
+async def scenario_stripe_create_checkout(client, n, c):
+    async def send(i):
+        r = await client.post("/api/payments/stripe/create-checkout", json={
+            "package_id": "starter", "origin_url": ORIGIN, "currency": "usd", "user_email": f"c{i}@example.com",
+        })
+        return r.status_code
+    return await harness.run_load(send, n, c)
+
+
+async def scenario_stripe_status_poll(client, n, c):
+    # Many clients polling a few open sessions, as the success page does
+    sessions = await _create_sessions(client, max(1, c // 4))
+
+    async def send(i):
+        r = await client.get(f"/api/payments/stripe/status/{sessions[i % len(sessions)]}")
+        return r.status_code
+    return await harness.run_load(send, n, c)
+
+
+async def scenario_manual_status_poll(client, n, c):
+    orders = []
+    for i in range(max(1, c)):
+        r = await client.post("/api/manual-payments/submit-payment", json=_manual_payment(i))
+        orders.append(r.json()["order_id"])
+
+    async def send(i):
+        r = await client.get(f"/api/manual-payments/payment-status/{orders[i % len(orders)]}")
+        return r.status_code
+    return await harness.run_load(send, n, c)
+
+
+async def scenario_razorpay_create_order(client, n, c):
+    async def send(i):
+        r = await client.post("/api/payments/razorpay/create-order", json={
+            "package_id": "starter", "user_email": f"o{i}@example.com",
+        })
+        return r.status_code
+    return await harness.run_load(send, n, c)
+
+
+async def scenario_razorpay_verify(client, n, c):
+    orders = await _create_orders(client, n, c)
+
+    async def send(i):
+        order_id = orders[i]
+        payment_id = f"pay_{uuid.uuid4().hex[:14]}"
+        r = await client.post("/api/payments/razorpay/verify", json={
+            "razorpay_order_id": order_id,
+            "razorpay_payment_id": payment_id,
+            "razorpay_signature": harness.razorpay_payment_signature(order_id, payment_id),
+        })
+        return r.status_code
+    return await harness.run_load(send, n, c)
+
+
+async def scenario_stripe_webhook(client, n, c):
+    from services.webhook_ingest import webhook_ingestor
+
+    sessions = await _create_sessions(client, max(1, n // 4))
+    event_ids = [f"evt_{uuid.uuid4().hex}" for _ in range(n)]
+    accepted = 0
+    before = webhook_ingestor.stats()["processed"] + webhook_ingestor.stats()["failed"]
+
+    async def send(i):
+        nonlocal accepted
+        # Repeat an earlier event now and then, like a gateway retry
+        event_index = i - 1 if i and i % int(1 / WEBHOOK_DUPLICATE_RATE) == 0 else i
+        body = json.dumps({
+            "id": event_ids[event_index],
+            "type": "checkout.session.completed",
+            "data": {"object": {"id": sessions[event_index % len(sessions)], "payment_status": "paid"}},
+        }).encode()
+        r = await client.post("/api/payments/stripe/webhook", content=body, headers={
+            "Stripe-Signature": harness.stripe_webhook_signature(body),
+        })
+        if r.status_code == 200 and r.json().get("status") == "success":
+            accepted += 1
+        return r.status_code
+
+    result = await harness.run_load(send, n, c)
+    result["accepted"] = accepted
+    result["drain_seconds"] = await _wait_for_webhooks(accepted, before)
+    return result
+
+
+async def scenario_razorpay_webhook(client, n, c):
+    from services.webhook_ingest import webhook_ingestor
+
+    orders = await _create_orders(client, max(1, n // 4), c)
+    event_ids = [f"evt_{uuid.uuid4().hex[:14]}" for _ in range(n)]
+    accepted = 0
+    before = webhook_ingestor.stats()["processed"] + webhook_ingestor.stats()["failed"]
+
+    async def send(i):
+        nonlocal accepted
+        event_index = i - 1 if i and i % int(1 / WEBHOOK_DUPLICATE_RATE) == 0 else i
+        order_id = orders[event_index % len(orders)]
+        body = json.dumps({
+            "event": "payment.captured",
+            "payload": {"payment": {"entity": {"id": f"pay_{event_index}", "order_id": order_id}}},
+        }).encode()
+        r = await client.post("/api/payments/razorpay/webhook", content=body, headers={
+            "X-Razorpay-Signature": harness.razorpay_webhook_signature(body),
+            "X-Razorpay-Event-Id": event_ids[event_index],
+        })
+        if r.status_code == 200 and r.json().get("status") == "accepted":
+            accepted += 1
+        return r.status_code
+
+    result = await harness.run_load(send, n, c)
+    result["accepted"] = accepted
+    result["drain_seconds"] = await _wait_for_webhooks(accepted, before)
+    return result
+
+
+SCENARIOS = {
+    "submit_payment": scenario_submit_payment,
+    "stripe_create_checkout": scenario_stripe_create_checkout,
+    "stripe_status_poll": scenario_stripe_status_poll,
+    "manual_status_poll": scenario_manual_status_poll,
+    "razorpay_create_order": scenario_razorpay_create_order,
+    "razorpay_verify": scenario_razorpay_verify,
+    "stripe_webhook": scenario_stripe_webhook,
+    "razorpay_webhook": scenario_razorpay_webhook,
+}
+
+# Higher is better for throughput, lower is better for latency
+COMPARED = (("throughput_rps", None, 1), ("latency_ms", "p50", -1), ("latency_ms", "p99", -1))
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> int:
+    """Print per-scenario deltas; returns how many metrics regressed beyond threshold"""
+    regressions = 0
+    base_rev = baseline["meta"]["git"].get("commit", "")[:10]
+    print(f"\nvs baseline {base_rev} ({baseline['meta']['timestamp']}), threshold {threshold:.0%}")
+    for key in ("database", "requests", "concurrency", "gateway_latency_s", "write_behind"):
+        if current["meta"].get(key) != baseline["meta"].get(key):
+            print(f"  warning: {key} differs ({baseline['meta'].get(key)} -> {current['meta'].get(key)})")
+    for name, result in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        cells = []
+        for key, sub, direction in COMPARED:
+            new = result[key][sub] if sub else result[key]
+            old = before[key][sub] if sub else before[key]
+            change = (new - old) / old if old else 0.0
+            regressed = change * direction < -threshold
+            regressions += regressed
+            cells.append(f"{sub or key} {old:g} -> {new:g} ({change:+.1%}){' REGRESSED' if regressed else ''}")
+        print(f"  {name:24s} " + " | ".join(cells))
+    return regressions
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--gateway-latency", type=float, default=0.05, help="Mean simulated gateway latency (s)")
+    parser.add_argument("--write-behind", action="store_true", help="Batch transaction writes (WRITE_BEHIND_ENABLED)")
+    parser.add_argument("--mongo-url", help="Benchmark against a real MongoDB instead of the in-memory stand-in")
+    parser.add_argument("--output", help=f"Result file (default: {RESULTS_DIR.relative_to(harness.REPO_DIR)}/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="Baseline result file to diff against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in names if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    app = harness.load_app(args.mongo_url, args.gateway_latency, write_behind=args.write_behind)
+    git = harness.git_revision()
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git": git,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": "mongodb" if args.mongo_url else "in-memory",
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "gateway_latency_s": args.gateway_latency,
+            "write_behind": args.write_behind,
+        },
+        "scenarios": {},
+    }
+
+    async with harness.running_app(app, args.mongo_url) as client:
+        for name in names:
+            result = await SCENARIOS[name](client, args.requests, args.concurrency)
+            report["scenarios"][name] = result
+            lat = result["latency_ms"]
+            print(
+                f"{name:24s} {result['throughput_rps']:>9.1f} req/s  p50 {lat['p50']:>8.2f} ms  "
+                f"p99 {lat['p99']:>8.2f} ms  errors {result['error_rate']:.2%}"
+                + (f"  drain {result['drain_seconds']}s" if "drain_seconds" in result else "")
+            )
+
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{(git['commit'] or 'nogit')[:10]}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,128 @@
+"""Latency of an unrelated endpoint while Razorpay calls are slow.
+
+Compares calling the blocking SDK inline in the handler (old behaviour) with
+going through RazorpayGateway's bounded executor.
+
+    cd backend && python benchmarks/bench_razorpay_executor.py --gateway-latency 0.3
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import FastAPI
+import httpx
+
+from services.razorpay_gateway import RazorpayGateway
+
+
+class _SlowOrders:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def create(self, data=None, **kwargs):
+        time.sleep(self.latency)
+        return {"id": "order_bench", "amount": data["amount"]}
+
+
+class SlowRazorpayClient:
+    """Stand-in for razorpay.Client whose HTTP round trip takes `latency` seconds"""
+
+    def __init__(self, latency: float):
+        self.order = _SlowOrders(latency)
+
+
+def build_app(mode: str, latency: float) -> FastAPI:
+    client = SlowRazorpayClient(latency)
+    gateway = RazorpayGateway("rzp_bench", "secret", client=client)
+    app = FastAPI()
+    order_data = {"amount": 240000, "currency": "INR"}
+
+    @app.post("/order")
+    async def create_order():
+        if mode == "inline":
+            return client.order.create(data=order_data)
+        return await gateway.create_order(order_data)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    app.state.gateway = gateway
+    return app
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_scenario(mode: str, latency: float, slow_calls: int, pings: int) -> dict:
+    app = build_app(mode, latency)
+    transport = httpx.ASGITransport(app=app)
+    ping_latencies = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Spread the slow calls across the ping window so they overlap with it
+        spacing = pings * 0.005 / max(slow_calls, 1)
+
+        async def slow(i):
+            await asyncio.sleep(i * spacing)
+            await client.post("/order")
+
+        # Open-loop pings at a fixed rate; latency is measured from the intended
+        # send time so time spent waiting behind a blocked loop is counted
+        async def ping(scheduled_at):
+            await asyncio.sleep(max(0.0, scheduled_at - time.perf_counter()))
+            await client.get("/ping")
+            ping_latencies.append(time.perf_counter() - scheduled_at)
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(ping(started + k * 0.005) for k in range(pings)),
+            *(slow(i) for i in range(slow_calls)),
+        )
+        elapsed = time.perf_counter() - started
+
+    app.state.gateway.shutdown()
+    return {
+        "mode": mode,
+        "slow_calls": slow_calls,
+        "gateway_latency_s": latency,
+        "wall_time_s": round(elapsed, 3),
+        "ping_p50_ms": round(statistics.median(ping_latencies) * 1000, 2),
+        "ping_p99_ms": round(percentile(ping_latencies, 99) * 1000, 2),
+        "ping_max_ms": round(max(ping_latencies) * 1000, 2),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--gateway-latency", type=float, default=0.3)
+    parser.add_argument("--slow-calls", type=int, default=8)
+    parser.add_argument("--pings", type=int, default=200)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for mode in ("inline", "gateway"):
+        results.append(await run_scenario(mode, args.gateway_latency, args.slow_calls, args.pings))
+
+    for result in results:
+        print(
+            f"{result['mode']:>8}: ping p50={result['ping_p50_ms']}ms "
+            f"p99={result['ping_p99_ms']}ms max={result['ping_max_ms']}ms "
+            f"(wall {result['wall_time_s']}s)"
+        )
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""Reconciliation throughput and peak memory on a synthetic bank statement.
+
+Writes a CSV with --rows lines (default 1M) to a temp file, builds a pending
+index of --pending records and streams the statement through the Reconciler.
+
+    cd backend && python benchmarks/bench_reconciliation.py --rows 1000000
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.reconciliation import PendingIndex, Reconciler, iter_statement_rows
+
+AMOUNTS = (2400.00, 6500.00)
+START = datetime(2026, 1, 1)
+
+
+def build_index(pending: int, rng: random.Random) -> PendingIndex:
+    index = PendingIndex()
+    for i in range(pending):
+        index.add(
+            f"ORD{i:08X}",
+            f"4{i:011d}" if i % 2 == 0 else None,
+            rng.choice(AMOUNTS),
+            START + timedelta(minutes=rng.randrange(60 * 24 * 90)),
+        )
+    return index.finalize()
+
+
+def write_statement(path: Path, rows: int, pending: int, rng: random.Random):
+    with path.open("w", newline="") as f:
+        f.write("Txn Date,Narration,Ref No.,Credit,Balance\n")
+        for i in range(rows):
+            date = (START + timedelta(days=rng.randrange(90))).strftime("%d/%m/%Y")
+            if i % 10 == 0:
+                ref = f"4{rng.randrange(pending):011d}"  # may hit a pending UTR
+            else:
+                ref = f"X{i:015d}"
+            amount = rng.choice(AMOUNTS) if i % 3 == 0 else round(rng.uniform(10, 50000), 2)
+            f.write(f"{date},UPI/{ref}/PAYMENT,{ref},{amount:.2f},{1000000 + i}.00\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--pending", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        statement = Path(tmp) / "statement.csv"
+        write_statement(statement, args.rows, args.pending, rng)
+        size_mb = statement.stat().st_size / 1e6
+
+        started = time.perf_counter()
+        index = build_index(args.pending, rng)
+        index_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with statement.open("rb") as raw:
+            report = Reconciler(index, timedelta(days=3)).run(iter_statement_rows(raw))
+        elapsed = time.perf_counter() - started
+
+        # Second pass for memory only; tracemalloc slows the loop several times over
+        tracemalloc.start()
+        with statement.open("rb") as raw:
+            Reconciler(index, timedelta(days=3)).run(iter_statement_rows(raw))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    result = {
+        "statement_rows": report["statement_rows"],
+        "statement_mb": round(size_mb, 1),
+        "pending_records": args.pending,
+        "index_build_s": round(index_s, 3),
+        "reconcile_s": round(elapsed, 3),
+        "rows_per_s": int(report["statement_rows"] / elapsed),
+        # Dominated by the match lists in the report, not by the statement size
+        "peak_traced_mb": round(peak / 1e6, 1),
+        "counts": report["counts"],
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
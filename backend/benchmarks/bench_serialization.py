@@ -0,0 +1,151 @@
+"""Serialization cost of a 1k-item pending-payments page.
+
+Serves the same page of projected Mongo rows three ways through raw ASGI calls
+(no HTTP client in the loop) and reports the time per response:
+
+* default: return the dict, FastAPI runs jsonable_encoder + json.dumps
+* response_model: FastAPI validates against PendingPaymentPage, then encodes
+* orjson: the route returns ORJSONResponse(rows) directly (what the app does)
+
+Also reports the body size of the projected page vs whole documents.
+
+    cd backend && python benchmarks/bench_serialization.py --items 1000
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+
+from models.manual_payment import ManualPaymentRecord, PendingPaymentItem, PendingPaymentPage
+from services import pagination
+
+PATH = "/api/manual-payments/pending-payments"
+
+
+def make_documents(count: int) -> list:
+    """Whole manual_payments documents, as stored"""
+    started = datetime(2025, 1, 1)
+    docs = []
+    for i in range(count):
+        docs.append(ManualPaymentRecord(
+            package_id="starter",
+            package_name="Starter",
+            amount=2400.0,
+            currency="INR",
+            payment_method="upi" if i % 2 else "bank_transfer",
+            transaction_id=f"UTR{uuid.uuid4().hex[:12].upper()}",
+            screenshot_id=uuid.uuid4().hex + uuid.uuid4().hex if i % 3 == 0 else None,
+            user_name=f"Bench User {i}",
+            user_email=f"bench{i}@example.com",
+            user_phone="+919800000000",
+            notes="Paid from the office account, please verify soon. " * 4,
+            created_at=started + timedelta(minutes=i),
+        ).model_dump())
+    return docs
+
+
+def project(docs: list) -> list:
+    """Apply the list projection the route sends to Mongo"""
+    projection = pagination.projection_for(PendingPaymentItem, computed=("screenshot_thumbnail_url",))
+    rows = []
+    for doc in docs:
+        row = {key: doc[key] for key in projection if key != "_id" and key in doc}
+        if row.get("screenshot_id"):
+            row["screenshot_thumbnail_url"] = f"/api/manual-payments/screenshots/{row['screenshot_id']}/thumbnail"
+        rows.append(row)
+    return rows
+
+
+def build_app(variant: str, rows: list) -> FastAPI:
+    app = FastAPI()
+    page = lambda: {"count": len(rows), "payments": rows, "next_cursor": None}
+
+    if variant == "default":
+        @app.get(PATH)
+        async def pending():
+            return page()
+    elif variant == "response_model":
+        @app.get(PATH, response_model=PendingPaymentPage)
+        async def pending():
+            return page()
+    else:
+        @app.get(PATH, response_model=PendingPaymentPage)
+        async def pending():
+            return ORJSONResponse(page())
+    return app
+
+
+async def drive(app, total: int) -> tuple:
+    """(seconds per request, body bytes) over `total` sequential requests"""
+    body_size = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal body_size
+        if message["type"] == "http.response.body":
+            body_size = len(message.get("body", b""))
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": PATH, "raw_path": PATH.encode(),
+        "root_path": "", "query_string": b"", "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    for _ in range(3):
+        await app(dict(scope), receive, send)
+    started = time.perf_counter()
+    for _ in range(total):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - started) / total, body_size
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=1000, help="Rows per page")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    docs = make_documents(args.items)
+    rows = project(docs)
+    variants = ("default", "response_model", "orjson")
+    apps = {variant: build_app(variant, rows) for variant in variants}
+    timings = {variant: [] for variant in variants}
+    sizes = {}
+    # Interleave rounds so machine noise hits every variant alike
+    for _ in range(args.rounds):
+        for variant in variants:
+            seconds, sizes[variant] = await drive(apps[variant], args.requests)
+            timings[variant].append(seconds)
+
+    default_ms = statistics.median(timings["default"]) * 1e3
+    result = {"items": args.items, "variants": {}}
+    for variant in variants:
+        ms = statistics.median(timings[variant]) * 1e3
+        result["variants"][variant] = {
+            "ms_per_response": round(ms, 3),
+            "speedup_vs_default": round(default_ms / ms, 2),
+            "body_bytes": sizes[variant],
+        }
+    whole = json.dumps({"payments": docs}, default=str).encode()
+    result["whole_document_page_bytes"] = len(whole)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,161 @@
+"""Cold-start cost of one backend worker: `import server` in fresh interpreters.
+
+Each run starts a new Python process with `-X importtime`, imports the app the
+way uvicorn does and reports wall time (process spawn to app imported and
+`import server` alone) plus where the import time went, summed per top-level
+package. The run fails when:
+
+* the median `import server` time exceeds --budget-ms, or
+* a module listed in --forbid (gateway SDKs and other heavy stacks that must
+  stay lazy) was imported at boot.
+
+    cd backend && python benchmarks/bench_startup.py --runs 7 --budget-ms 1500
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import harness
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = harness.REPO_DIR / "test_reports" / "benchmarks"
+# Must only load on first use (see GATEWAY_SDK_PRELOAD)
+DEFAULT_FORBID = "stripe,razorpay,emergentintegrations,litellm,openai,google.genai,google.generativeai,boto3,PIL,pandas,tiktoken"
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import server
+seconds = time.perf_counter() - started
+print(json.dumps({"seconds": seconds, "payments_enabled": server.PAYMENTS_ENABLED, "modules": sorted(sys.modules)}))
+"""
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Self time in microseconds, summed per top-level package"""
+    per_package = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, self_us, _cumulative, name = (part.strip() for part in line.replace("import time:", "|", 1).split("|"))
+        per_package[name.split(".")[0]] += int(self_us)
+    return per_package
+
+
+def run_once(env: dict) -> dict:
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    wall = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise SystemExit(f"`import server` failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["wall_seconds"] = wall
+    result["packages_us"] = parse_importtime(proc.stderr)
+    return result
+
+
+def forbidden_imports(modules: list, forbid: list) -> list:
+    loaded = set(modules)
+    return [name for name in forbid if name in loaded]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to start")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="Max median `import server` time")
+    parser.add_argument("--forbid", default=DEFAULT_FORBID, help="Comma-separated modules that must not load at boot")
+    parser.add_argument("--top", type=int, default=15, help="Heaviest packages to print")
+    parser.add_argument("--output", help=f"Result file (default: {RESULTS_DIR.relative_to(harness.REPO_DIR)}/startup-<time>-<commit>.json)")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # Importing must not need a database; these are only read at connect time
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "sdwrite_startup_bench")
+    env.setdefault("PAYMENT_GATEWAY_MODE", "live")
+
+    # One throwaway run so the first measured one does not pay for a cold disk cache
+    run_once(env)
+    runs = [run_once(env) for _ in range(args.runs)]
+
+    import_ms = sorted(r["seconds"] * 1e3 for r in runs)
+    wall_ms = sorted(r["wall_seconds"] * 1e3 for r in runs)
+    packages = defaultdict(list)
+    for r in runs:
+        for name, us in r["packages_us"].items():
+            packages[name].append(us)
+    heaviest = sorted(
+        ((name, statistics.median(values) / 1e3) for name, values in packages.items()),
+        key=lambda item: item[1], reverse=True,
+    )[:args.top]
+    forbid = [name.strip() for name in args.forbid.split(",") if name.strip()]
+    forbidden = sorted({name for r in runs for name in forbidden_imports(r["modules"], forbid)})
+
+    git = harness.git_revision()
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git": git,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "runs": args.runs,
+            "gateway_mode": env["PAYMENT_GATEWAY_MODE"],
+        },
+        "payments_enabled": all(r["payments_enabled"] for r in runs),
+        "import_server_ms": {
+            "median": round(statistics.median(import_ms), 1),
+            "min": round(import_ms[0], 1),
+            "max": round(import_ms[-1], 1),
+        },
+        "process_wall_ms": {
+            "median": round(statistics.median(wall_ms), 1),
+            "min": round(wall_ms[0], 1),
+            "max": round(wall_ms[-1], 1),
+        },
+        "heaviest_packages_ms": {name: round(ms, 1) for name, ms in heaviest},
+        "budget_ms": args.budget_ms,
+        "forbidden_imports": forbidden,
+    }
+
+    print(f"import server   median {report['import_server_ms']['median']:8.1f} ms  "
+          f"(min {report['import_server_ms']['min']:.1f}, max {report['import_server_ms']['max']:.1f})")
+    print(f"process wall    median {report['process_wall_ms']['median']:8.1f} ms")
+    if not report["payments_enabled"]:
+        print("WARNING: payment routes failed to import; the numbers exclude them")
+    print("\nHeaviest packages (self time, median):")
+    for name, ms in heaviest:
+        print(f"  {name:28s} {ms:8.1f} ms")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"startup-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{(git['commit'] or 'nogit')[:10]}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nResults written to {output}")
+
+    failed = False
+    if report["import_server_ms"]["median"] > args.budget_ms:
+        print(f"\nOVER BUDGET: median import {report['import_server_ms']['median']:.1f} ms > {args.budget_ms:g} ms")
+        failed = True
+    if forbidden:
+        print(f"\nLOADED AT BOOT (must stay lazy): {', '.join(forbidden)}")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
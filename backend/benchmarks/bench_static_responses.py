@@ -0,0 +1,110 @@
+"""Requests/sec for the config endpoints (/packages, /bank-details, /upi-details).
+
+Compares building and serializing the payload per request (old behaviour) with
+the precomputed StaticResponseRegistry bytes, and with conditional requests
+that come back as 304 Not Modified.
+
+    cd backend && python benchmarks/bench_static_responses.py --requests 20000
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import FastAPI, Request
+import httpx
+
+from models.payment import PRICING_PACKAGES
+from routes.manual_payments import _bank_details_payload, _upi_details_payload
+from services.static_responses import StaticResponseRegistry
+
+
+def _packages_payload():
+    return {"packages": PRICING_PACKAGES, "available_gateways": {"stripe": True, "razorpay": True}}
+
+
+BUILDERS = {
+    "packages": _packages_payload,
+    "bank-details": _bank_details_payload,
+    "upi-details": _upi_details_payload,
+}
+
+
+def build_app(mode: str) -> FastAPI:
+    app = FastAPI()
+    registry = StaticResponseRegistry()
+    for name, builder in BUILDERS.items():
+        registry.register(name, builder)
+
+    def add(name, builder):
+        if mode == "per_request":
+            async def handler():
+                return builder()
+        else:
+            async def handler(request: Request):
+                return registry.respond(name, request)
+        app.add_api_route(f"/{name}", handler, methods=["GET"])
+
+    for name, builder in BUILDERS.items():
+        add(name, builder)
+    return app
+
+
+async def run(mode: str, total: int, concurrency: int) -> dict:
+    app = build_app("per_request" if mode == "per_request" else "precomputed")
+    transport = httpx.ASGITransport(app=app)
+    names = list(BUILDERS)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        etags = {}
+        if mode == "conditional":
+            for name in names:
+                etags[name] = (await client.get(f"/{name}")).headers["etag"]
+
+        counter = iter(range(total))
+        statuses = {}
+        body_bytes = 0
+
+        async def worker():
+            nonlocal body_bytes
+            for i in counter:
+                name = names[i % len(names)]
+                headers = {"If-None-Match": etags[name]} if name in etags else None
+                response = await client.get(f"/{name}", headers=headers)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                body_bytes += len(response.content)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": total,
+        "seconds": round(elapsed, 3),
+        "requests_per_s": int(total / elapsed),
+        "statuses": statuses,
+        "body_bytes": body_bytes,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("per_request", "precomputed", "conditional"):
+        results[mode] = await run(mode, args.requests, args.concurrency)
+        print(f"{mode:12s} {results[mode]['requests_per_s']:>8d} req/s  {results[mode]['body_bytes']:>10d} body bytes  {results[mode]['statuses']}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
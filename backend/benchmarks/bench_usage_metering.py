@@ -0,0 +1,126 @@
+"""Throughput of usage metering: in-memory aggregation vs a Mongo write per request.
+
+* record: UsageMeter.record() increments spread over many users and tools
+* meter: full quota-checked UsageMeter.meter() calls (plan and flushed totals cached)
+* flush: one batched $inc flush of every pending user
+* per_request_inc: the naive design, one update_one($inc) per increment
+
+Runs against mongomock-motor by default; pass --mongo-url for a real server
+(a throwaway database is created and dropped).
+
+    cd backend && python benchmarks/bench_usage_metering.py --increments 200000 --users 5000
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.usage_metering import UsageMeter, usage_id, current_month
+
+TOOLS = ("blog_writer", "rewriter", "summarizer", "email_writer", "ad_copy", "grammar")
+
+
+def open_db(mongo_url):
+    if mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(mongo_url)
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        client = AsyncMongoMockClient()
+    return client, client[f"bench_usage_{uuid.uuid4().hex[:8]}"]
+
+
+async def bench_record(meter: UsageMeter, users: list, increments: int) -> dict:
+    rng = random.Random(1)
+    calls = [(rng.choice(users), rng.choice(TOOLS), rng.randint(50, 800)) for _ in range(increments)]
+    started = time.perf_counter()
+    for email, tool, words in calls:
+        meter.record(email, tool, words, words * 4 // 3)
+    seconds = time.perf_counter() - started
+    return {"increments": increments, "seconds": round(seconds, 4), "ops_per_second": round(increments / seconds)}
+
+
+async def bench_meter(meter: UsageMeter, db, users: list, calls: int) -> dict:
+    rng = random.Random(2)
+    # Warm the plan and flushed-total caches the way steady traffic would
+    for email in users:
+        await meter.meter(db, email, TOOLS[0], words=1, tokens=1, enforce=False)
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(calls):
+        call_started = time.perf_counter()
+        await meter.meter(db, rng.choice(users), rng.choice(TOOLS), words=rng.randint(50, 800), tokens=100, enforce=False)
+        latencies.append(time.perf_counter() - call_started)
+    seconds = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "calls": calls,
+        "ops_per_second": round(calls / seconds),
+        "p50_us": round(statistics.median(latencies) * 1e6, 1),
+        "p99_us": round(latencies[int(len(latencies) * 0.99) - 1] * 1e6, 1),
+    }
+
+
+async def bench_flush(meter: UsageMeter) -> dict:
+    users = len(meter._pending)
+    started = time.perf_counter()
+    await meter.flush()
+    return {"users": users, "seconds": round(time.perf_counter() - started, 4)}
+
+
+async def bench_per_request(db, users: list, requests: int) -> dict:
+    rng = random.Random(3)
+    month = current_month()
+    started = time.perf_counter()
+    for _ in range(requests):
+        email, tool, words = rng.choice(users), rng.choice(TOOLS), rng.randint(50, 800)
+        await db.usage_naive.update_one(
+            {"_id": usage_id((email, month))},
+            {"$inc": {"words": words, "requests": 1, f"tools.{tool}.words": words}},
+            upsert=True,
+        )
+    seconds = time.perf_counter() - started
+    return {"increments": requests, "seconds": round(seconds, 4), "ops_per_second": round(requests / seconds)}
+
+
+async def main(args):
+    client, db = open_db(args.mongo_url)
+    users = [f"user{i}@example.com" for i in range(args.users)]
+    meter = UsageMeter(flush_seconds=3600)
+    meter._db = db
+    result = {"backend": "mongodb" if args.mongo_url else "mongomock"}
+    try:
+        result["record"] = await bench_record(meter, users, args.increments)
+        result["flush"] = await bench_flush(meter)
+        result["meter"] = await bench_meter(meter, db, users, args.meter_calls)
+        await meter.flush()
+        result["per_request_inc"] = await bench_per_request(db, users, args.baseline_requests)
+    finally:
+        if args.mongo_url:
+            await client.drop_database(db.name)
+
+    print(f"record           {result['record']['ops_per_second']:>10,} increments/s")
+    print(f"meter            {result['meter']['ops_per_second']:>10,} calls/s  "
+          f"p50 {result['meter']['p50_us']} us  p99 {result['meter']['p99_us']} us")
+    print(f"flush            {result['flush']['users']:>10,} users in {result['flush']['seconds']} s (one bulk write)")
+    print(f"per_request_inc  {result['per_request_inc']['ops_per_second']:>10,} increments/s ({result['backend']})")
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--increments", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--meter-calls", type=int, default=50000)
+    parser.add_argument("--baseline-requests", type=int, default=2000, help="Increments for the one-write-per-request baseline")
+    parser.add_argument("--mongo-url", help="Real MongoDB instead of mongomock-motor")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    asyncio.run(main(parser.parse_args()))
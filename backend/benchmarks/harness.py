@@ -0,0 +1,180 @@
+"""Shared plumbing for the in-process benchmark suite.
+
+Boots the real FastAPI app (routers, lifespan, webhook workers, caches) against
+either an in-memory MongoDB stand-in (mongomock-motor) or a real server, with
+PAYMENT_GATEWAY_MODE=simulated (services/gateway_simulators.py). Only the
+network edge of each gateway is simulated: StripeGateway, RazorpayGateway and
+its bounded executor stay in the measured path, and webhooks carry real
+signatures.
+
+The stand-in is pinned in requirements.txt; pass --mongo-url to use a
+real MongoDB instead (a throwaway database is created and dropped). The
+stand-in has no indexes, so lookups get slower as a scenario inserts rows;
+compare runs made against the same backend only.
+"""
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+REPO_DIR = BACKEND_DIR.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def razorpay_payment_signature(order_id: str, payment_id: str) -> str:
+    from services import gateway_simulators
+    message = f"{order_id}|{payment_id}".encode()
+    return hmac.new(gateway_simulators.RAZORPAY_SIM_KEY_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+
+def razorpay_webhook_signature(body: bytes) -> str:
+    from services import gateway_simulators
+    return gateway_simulators.razorpay_signature(body)
+
+
+def stripe_webhook_signature(body: bytes) -> str:
+    from services import gateway_simulators
+    return gateway_simulators.stripe_signature_header(body)
+
+
+def _prepare_environment(mongo_url: Optional[str], gateway_latency: float, write_behind: bool):
+    # Gateways run on the in-process simulators; customers never pay on their own,
+    # so every webhook a scenario sees is one it sent
+    os.environ["PAYMENT_GATEWAY_MODE"] = "simulated"
+    os.environ["GATEWAY_SIM_LATENCY"] = f"uniform:{gateway_latency * 500:g},{gateway_latency * 1500:g}"
+    os.environ["GATEWAY_SIM_ERROR_RATE"] = "0"
+    os.environ["GATEWAY_SIM_HANG_RATE"] = "0"
+    os.environ["GATEWAY_SIM_PAY_RATE"] = "0"
+    os.environ["GATEWAY_SIM_SEED"] = "1"
+    os.environ["STATUS_CHANGE_STREAMS"] = "off"
+    os.environ["WRITE_BEHIND_ENABLED"] = "true" if write_behind else "false"
+    # Every simulated customer shares one client address
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+    if mongo_url:
+        os.environ["MONGO_URL"] = mongo_url
+        os.environ["DB_NAME"] = f"sdwrite_bench_{os.getpid()}"
+    else:
+        os.environ.setdefault("MONGO_URL", "mongodb://in-memory")
+        os.environ["DB_NAME"] = "sdwrite_bench"
+        # mongomock ignores partialFilterExpression, so the unique gateway-id indexes would collide
+        os.environ["MONGO_AUTO_INDEXES"] = "false"
+
+
+def load_app(
+    mongo_url: Optional[str] = None,
+    gateway_latency: float = 0.05,
+    log_level: str = "WARNING",
+    write_behind: bool = False,
+):
+    """Import the app with the stand-in database and simulated gateways wired in"""
+    _prepare_environment(mongo_url, gateway_latency, write_behind)
+
+    import database
+    if not mongo_url:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("In-memory MongoDB needs mongomock-motor (pip install -r requirements.txt, or pass --mongo-url)")
+        client = AsyncMongoMockClient()
+        database._client = client
+        database._db = client[os.environ["DB_NAME"]]
+        database.connect = lambda: database._db
+
+    import server
+    if not server.PAYMENTS_ENABLED:
+        raise SystemExit("Payment routes failed to import; see the warning above")
+
+    # The app logs every payment at INFO, which would dominate the measurement
+    logging.getLogger().setLevel(log_level)
+    return server.app
+
+
+@asynccontextmanager
+async def running_app(app, mongo_url: Optional[str] = None):
+    """Run the app lifespan (indexes, webhook workers) around an httpx client"""
+    import httpx
+    import database
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            try:
+                yield client
+            finally:
+                if mongo_url:
+                    await database.get_client().drop_database(os.environ["DB_NAME"])
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def run_load(
+    send: Callable[[int], Awaitable[int]],
+    total: int,
+    concurrency: int,
+) -> Dict:
+    """Closed-loop load: `concurrency` workers issue `total` requests via send(i) -> status"""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                status = str(await send(i))
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1),
+        "error_rate": round(1 - ok / total, 4) if total else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1e3, 3),
+            "p50": round(percentile(latencies, 50) * 1e3, 3),
+            "p90": round(percentile(latencies, 90) * 1e3, 3),
+            "p99": round(percentile(latencies, 99) * 1e3, 3),
+            "max": round(latencies[-1] * 1e3, 3),
+        },
+        "statuses": statuses,
+    }
+
+
+def git_revision() -> Dict:
+    def git(*args):
+        try:
+            return subprocess.run(
+                ["git", *args], cwd=REPO_DIR, capture_output=True, text=True, timeout=10
+            ).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "branch": git("rev-parse", "--abbrev-ref", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+    }
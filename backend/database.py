@@ -0,0 +1,163 @@
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
+from collections import Counter
+from typing import Optional
+import os
+import logging
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Pool settings (one pool per worker process, shared by every router)
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '60000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Counts connection pool events so the pool can be inspected at runtime"""
+
+    def __init__(self):
+        self.events = Counter()
+        self.open_connections = 0
+        self.checked_out = 0
+
+    def pool_created(self, event):
+        self.events["pool_created"] += 1
+
+    def pool_ready(self, event):
+        self.events["pool_ready"] += 1
+
+    def pool_cleared(self, event):
+        self.events["pool_cleared"] += 1
+
+    def pool_closed(self, event):
+        self.events["pool_closed"] += 1
+
+    def connection_created(self, event):
+        self.events["connections_created"] += 1
+        self.open_connections += 1
+
+    def connection_ready(self, event):
+        self.events["connections_ready"] += 1
+
+    def connection_closed(self, event):
+        self.events["connections_closed"] += 1
+        self.open_connections = max(0, self.open_connections - 1)
+
+    def connection_check_out_started(self, event):
+        self.events["checkouts_started"] += 1
+
+    def connection_check_out_failed(self, event):
+        self.events["checkouts_failed"] += 1
+
+    def connection_checked_out(self, event):
+        self.events["checkouts"] += 1
+        self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self.events["checkins"] += 1
+        self.checked_out = max(0, self.checked_out - 1)
+
+
+pool_stats = PoolStatsListener()
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Feeds driver-reported command durations into the metrics histogram"""
+
+    def __init__(self):
+        # request_id -> collection, only known when the command starts
+        self._collections = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        self._collections[event.request_id] = target if isinstance(target, str) else ""
+
+    def _observe(self, event, outcome: str):
+        collection = self._collections.pop(event.request_id, "")
+        metrics.mongo_command_duration.labels(event.command_name, collection, outcome).observe(
+            event.duration_micros / 1e6
+        )
+
+    def succeeded(self, event):
+        self._observe(event, "ok")
+
+    def failed(self, event):
+        self._observe(event, "error")
+
+
+command_metrics = CommandMetricsListener()
+metrics.registry.gauge(
+    "mongo_pool_checked_out_connections", "Connections currently checked out of the pool"
+).set_function(lambda: pool_stats.checked_out)
+
+_client: Optional[AsyncIOMotorClient] = None
+_db: Optional[AsyncIOMotorDatabase] = None
+
+
+def connect() -> AsyncIOMotorDatabase:
+    """Create the process-wide MongoDB client (idempotent)"""
+    global _client, _db
+    if _db is not None:
+        return _db
+
+    mongo_url = os.environ['MONGO_URL']
+    db_name = os.environ.get('DB_NAME', 'sdwrite')
+
+    _client = AsyncIOMotorClient(
+        mongo_url,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        event_listeners=[pool_stats, command_metrics] if metrics.METRICS_ENABLED else [pool_stats],
+    )
+    _db = _client[db_name]
+
+    logger.info(
+        f"MongoDB pool created (db={db_name}, maxPoolSize={MONGO_MAX_POOL_SIZE}, "
+        f"minPoolSize={MONGO_MIN_POOL_SIZE})"
+    )
+    return _db
+
+
+def close():
+    """Close the shared client; called once from the app lifespan"""
+    global _client, _db
+    if _client is not None:
+        _client.close()
+        logger.info("MongoDB pool closed")
+    _client = None
+    _db = None
+
+
+def get_client() -> AsyncIOMotorClient:
+    if _client is None:
+        connect()
+    return _client
+
+
+def get_db() -> AsyncIOMotorDatabase:
+    """Shared database handle, usable directly or as a FastAPI dependency"""
+    if _db is None:
+        return connect()
+    return _db
+
+
+def get_pool_stats() -> dict:
+    """Snapshot of pool configuration and connection counters"""
+    return {
+        "connected": _client is not None,
+        "config": {
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            "max_idle_time_ms": MONGO_MAX_IDLE_TIME_MS,
+            "server_selection_timeout_ms": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        },
+        "open_connections": pool_stats.open_connections,
+        "checked_out": pool_stats.checked_out,
+        "events": dict(pool_stats.events),
+    }
@@ -0,0 +1,194 @@
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime, timezone
+from typing import Dict, List
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Create indexes at boot (disable when indexes are managed out of band)
+MONGO_AUTO_INDEXES = os.environ.get('MONGO_AUTO_INDEXES', 'true').lower() == 'true'
+
+# Optional TTL for abandoned pending gateway transactions (0 = keep forever)
+PENDING_TRANSACTION_TTL_HOURS = int(os.environ.get('PENDING_TRANSACTION_TTL_HOURS', '0'))
+
+# Only index gateway ids that are actually set (Stripe rows have no order_id and
+# Razorpay rows have no session_id, so a plain unique index would collide on null)
+_STRING = {"$type": "string"}
+# Paid/verified payments whose plan grant has not been applied yet (see services/entitlements.py);
+# only a handful at a time, so the index stays tiny
+_ENTITLEMENT_PENDING = IndexModel(
+    [("entitlement_pending", ASCENDING)],
+    name="entitlement_pending",
+    partialFilterExpression={"entitlement_pending": True},
+)
+
+
+def declared_indexes() -> Dict[str, List[IndexModel]]:
+    """Index declarations per collection"""
+    transactions = [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("session_id", ASCENDING)],
+            name="session_id_unique",
+            unique=True,
+            partialFilterExpression={"session_id": _STRING},
+        ),
+        IndexModel(
+            [("order_id", ASCENDING)],
+            name="order_id_unique",
+            unique=True,
+            partialFilterExpression={"order_id": _STRING},
+        ),
+        # Status-filtered listings page on (created_at, id); see services/pagination.py.
+        # The expiry sweeper walks the pending range of the same index
+        IndexModel(
+            [("payment_status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="payment_status_created_at_id",
+        ),
+        IndexModel(
+            [("created_at", DESCENDING), ("id", DESCENDING)],
+            name="created_at_id",
+        ),
+        _ENTITLEMENT_PENDING,
+    ]
+    if PENDING_TRANSACTION_TTL_HOURS > 0:
+        transactions.append(
+            IndexModel(
+                [("created_at", ASCENDING)],
+                name="pending_created_at_ttl",
+                expireAfterSeconds=PENDING_TRANSACTION_TTL_HOURS * 3600,
+                partialFilterExpression={"payment_status": "pending"},
+            )
+        )
+
+    return {
+        "payment_transactions": transactions,
+        "manual_payments": [
+            IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+            IndexModel([("order_id", ASCENDING)], name="order_id_unique", unique=True),
+            IndexModel(
+                [("status", ASCENDING), ("created_at", DESCENDING), ("order_id", DESCENDING)],
+                name="status_created_at_order_id",
+            ),
+            IndexModel(
+                [("transaction_id", ASCENDING)],
+                name="transaction_id",
+                partialFilterExpression={"transaction_id": _STRING},
+            ),
+            _ENTITLEMENT_PENDING,
+        ],
+        # _id is "<gateway>:<event_id>", which already gives O(1) duplicate rejection
+        "webhook_events": [
+            IndexModel(
+                [("status", ASCENDING), ("received_at", ASCENDING)],
+                name="status_received_at",
+            ),
+        ],
+        "status_checks": [
+            IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+            # GET /api/status pages on (timestamp, id), optionally per client
+            IndexModel(
+                [("timestamp", DESCENDING), ("id", DESCENDING)],
+                name="timestamp_id",
+            ),
+            IndexModel(
+                [("client_name", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+                name="client_name_timestamp_id",
+            ),
+        ],
+        # _id is "<route>:<Idempotency-Key>"; stored responses expire at expires_at
+        "idempotency_keys": [
+            IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        ],
+        # _id is "<day>|<source>|<package_id>|<currency>"; analytics reads day ranges
+        "revenue_daily": [
+            IndexModel([("day", ASCENDING), ("source", ASCENDING)], name="day_source"),
+        ],
+    }
+
+
+# Result of the last ensure_indexes() run, exposed through the admin API
+last_report: Dict = {}
+
+
+async def _update_ttl(db: AsyncIOMotorDatabase, collection: str, index: IndexModel):
+    """Apply a changed expireAfterSeconds to an existing TTL index"""
+    doc = index.document
+    await db.command({
+        "collMod": collection,
+        "index": {"name": doc["name"], "expireAfterSeconds": doc["expireAfterSeconds"]},
+    })
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> Dict:
+    """Create all declared indexes; safe to run on every boot"""
+    global last_report
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "collections": {},
+    }
+
+    for collection, indexes in declared_indexes().items():
+        results = {}
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                await db[collection].create_indexes([index])
+                results[name] = "ok"
+            except OperationFailure as e:
+                # IndexOptionsConflict: only the TTL value is allowed to drift
+                if e.code == 85 and "expireAfterSeconds" in index.document:
+                    try:
+                        await _update_ttl(db, collection, index)
+                        results[name] = "ttl_updated"
+                        continue
+                    except PyMongoError as ttl_error:
+                        e = ttl_error
+                logger.error(f"Index {collection}.{name} not created: {e}")
+                results[name] = f"error: {e}"
+            except PyMongoError as e:
+                logger.error(f"Index {collection}.{name} not created: {e}")
+                results[name] = f"error: {e}"
+        report["collections"][collection] = results
+
+    report["finished_at"] = datetime.now(timezone.utc).isoformat()
+    last_report = report
+
+    failed = [
+        f"{c}.{n}" for c, r in report["collections"].items()
+        for n, status in r.items() if status.startswith("error")
+    ]
+    if failed:
+        logger.warning(f"Index bootstrap finished with errors: {', '.join(failed)}")
+    else:
+        logger.info("Index bootstrap complete")
+    return report
+
+
+async def describe_indexes(db: AsyncIOMotorDatabase) -> Dict:
+    """Declared vs existing indexes per collection"""
+    collections = {}
+    for collection, indexes in declared_indexes().items():
+        existing = {}
+        try:
+            async for info in db[collection].list_indexes():
+                existing[info["name"]] = {k: v for k, v in info.items() if k not in ("v", "ns")}
+        except PyMongoError as e:
+            existing = {"error": str(e)}
+
+        declared = [index.document["name"] for index in indexes]
+        collections[collection] = {
+            "declared": declared,
+            "missing": [name for name in declared if name not in existing],
+            "existing": existing,
+        }
+
+    return {
+        "auto_create": MONGO_AUTO_INDEXES,
+        "pending_transaction_ttl_hours": PENDING_TRANSACTION_TTL_HOURS,
+        "collections": collections,
+        "last_bootstrap": last_report,
+    }
@@ -0,0 +1,82 @@
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Tuple
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Run data migrations at boot (each one is idempotent and a no-op once applied)
+MONGO_AUTO_MIGRATE = os.environ.get('MONGO_AUTO_MIGRATE', 'true').lower() == 'true'
+MIGRATION_BATCH_SIZE = int(os.environ.get('MIGRATION_BATCH_SIZE', '1000'))
+
+
+def _parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+async def migrate_status_timestamps(db: AsyncIOMotorDatabase, batch_size: int = MIGRATION_BATCH_SIZE) -> Dict:
+    """Rewrite ISO-string status_checks.timestamp values as BSON dates, one batch at a time"""
+    converted = 0
+    unparsable: List = []
+    while True:
+        query = {"timestamp": {"$type": "string"}}
+        if unparsable:
+            query["_id"] = {"$nin": unparsable}
+        rows = await db.status_checks.find(query, {"_id": 1, "timestamp": 1}).limit(batch_size).to_list(batch_size)
+        if not rows:
+            break
+
+        ops = []
+        for row in rows:
+            try:
+                timestamp = _parse_timestamp(row["timestamp"])
+            except ValueError:
+                unparsable.append(row["_id"])
+                continue
+            # Match the old value too, so a concurrent rewrite of the row is not clobbered
+            ops.append(UpdateOne(
+                {"_id": row["_id"], "timestamp": row["timestamp"]},
+                {"$set": {"timestamp": timestamp}}
+            ))
+        if ops:
+            result = await db.status_checks.bulk_write(ops, ordered=False)
+            converted += result.modified_count
+
+    if unparsable:
+        logger.warning(f"{len(unparsable)} status_checks timestamps could not be parsed and were left as strings")
+    return {"converted": converted, "unparsable": len(unparsable)}
+
+
+MIGRATIONS: List[Tuple[str, Callable[[AsyncIOMotorDatabase], Awaitable[Dict]]]] = [
+    ("status_checks_timestamp_to_date", migrate_status_timestamps),
+]
+
+# Result of the last run_migrations() call, exposed through the admin API
+last_report: Dict = {}
+
+
+async def run_migrations(db: AsyncIOMotorDatabase) -> Dict:
+    """Apply every migration in order; safe to run on every boot"""
+    global last_report
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "migrations": {},
+    }
+
+    for name, migration in MIGRATIONS:
+        try:
+            report["migrations"][name] = await migration(db)
+        except PyMongoError as e:
+            logger.error(f"Migration {name} failed: {e}")
+            report["migrations"][name] = {"error": str(e)}
+
+    report["finished_at"] = datetime.now(timezone.utc).isoformat()
+    last_report = report
+    logger.info(f"Migrations complete: {report['migrations']}")
+    return report
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Literal, Optional
 from datetime import datetime
 import uuid
 
@@ -11,6 +11,7 @@ class ManualPaymentRequest(BaseModel):
     payment_method: str  # "bank_transfer" or "upi"
     transaction_id: Optional[str] = None
     payment_screenshot_url: Optional[str] = None
+    screenshot_id: Optional[str] = None  # From /upload-screenshot
     user_name: str
     user_email: str
     user_phone: Optional[str] = None
@@ -26,15 +27,40 @@ class ManualPaymentRecord(BaseModel):
     payment_method: str
     transaction_id: Optional[str] = None
     payment_screenshot_url: Optional[str] = None
+    screenshot_id: Optional[str] = None
     user_name: str
     user_email: str
     user_phone: Optional[str] = None
     notes: Optional[str] = None
-    status: str = "pending"  # pending, verified, rejected
+    status: str = "pending"  # pending, verified, rejected, expired
     created_at: datetime = Field(default_factory=datetime.utcnow)
     verified_at: Optional[datetime] = None
     verified_by: Optional[str] = None
 
+# Lean shapes for the admin review list (also drive the Mongo projection)
+class PendingPaymentItem(BaseModel):
+    order_id: str
+    package_id: str
+    package_name: str
+    amount: float
+    currency: str
+    payment_method: str
+    transaction_id: Optional[str] = None
+    payment_screenshot_url: Optional[str] = None
+    screenshot_id: Optional[str] = None
+    screenshot_thumbnail_url: Optional[str] = None
+    user_name: str
+    user_email: str
+    user_phone: Optional[str] = None
+    status: str
+    created_at: datetime
+    verified_at: Optional[datetime] = None
+
+class PendingPaymentPage(BaseModel):
+    count: int
+    payments: List[PendingPaymentItem]
+    next_cursor: Optional[str] = None
+
 class BankDetails(BaseModel):
     account_name: str
     account_number: str
@@ -47,3 +73,12 @@ class UPIDetails(BaseModel):
     upi_id: str
     upi_name: str
     qr_code_url: Optional[str] = None
+
+class BulkReviewItem(BaseModel):
+    order_id: str
+    action: Literal["verify", "reject"]
+    reason: Optional[str] = None
+
+class BulkReviewRequest(BaseModel):
+    items: List[BulkReviewItem] = Field(..., min_length=1, max_length=1000)
+    reviewed_by: str = "admin"
@@ -1,27 +1,31 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from datetime import datetime
 import uuid
 
 # Pricing packages (FIXED - Never accept from frontend)
+# "limits" is what a paid plan entitles to (None = unlimited); see services/entitlements.py
 PRICING_PACKAGES = {
     "starter": {
         "name": "Starter",
         "amount_usd": 29.00,
         "amount_inr": 2400.00,
-        "features": ["10,000 words/month", "5 AI tools", "Basic templates", "Email support"]
+        "features": ["10,000 words/month", "5 AI tools", "Basic templates", "Email support"],
+        "limits": {"words_per_month": 10000, "ai_tools": 5, "team_collaboration": False}
     },
     "pro": {
         "name": "Pro",
         "amount_usd": 79.00,
         "amount_inr": 6500.00,
-        "features": ["100,000 words/month", "20+ AI tools", "Priority support", "Team collaboration"]
+        "features": ["100,000 words/month", "20+ AI tools", "Priority support", "Team collaboration"],
+        "limits": {"words_per_month": 100000, "ai_tools": None, "team_collaboration": True}
     },
     "enterprise": {
         "name": "Enterprise",
         "amount_usd": None,  # Custom pricing
         "amount_inr": None,
-        "features": ["Unlimited words", "All features", "Dedicated support", "Custom AI training"]
+        "features": ["Unlimited words", "All features", "Dedicated support", "Custom AI training"],
+        "limits": {"words_per_month": None, "ai_tools": None, "team_collaboration": True}
     }
 }
 
@@ -64,3 +68,22 @@ class CheckoutStatusResponse(BaseModel):
     currency: str
     package_name: str
     payment_gateway: str
+
+# Lean shapes for list pages (also drive the Mongo projections)
+class TransactionListItem(BaseModel):
+    id: str
+    session_id: Optional[str] = None
+    order_id: Optional[str] = None
+    package_id: str
+    package_name: str
+    amount: float
+    currency: str
+    payment_gateway: str
+    payment_status: str
+    user_email: Optional[str] = None
+    created_at: datetime
+
+class TransactionPage(BaseModel):
+    count: int
+    transactions: List[TransactionListItem]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,11 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class UsageMeterRequest(BaseModel):
+    # Stored as a field name in the monthly usage document
+    tool: str = Field(pattern=r"^[a-z0-9_-]{1,40}$")
+    # Always counted server-side (words, and tokens with tiktoken) when present;
+    # words/tokens are only used for callers that cannot send the text
+    text: Optional[str] = None
+    words: Optional[int] = Field(default=None, ge=0)
+    tokens: Optional[int] = Field(default=None, ge=0)
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import logging
+import database
+import indexes
+import migrations
+from database import get_db
+
+logger = logging.getLogger(__name__)
+
+# Core endpoints only; payment admin endpoints live in routes/payments_admin.py
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+@router.get("/db/pool-stats")
+async def get_pool_stats():
+    """Get MongoDB connection pool configuration and counters"""
+    # TODO: Add authentication/authorization for admin only
+    return database.get_pool_stats()
+
+@router.get("/indexes")
+async def get_indexes(db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Get declared vs existing indexes and the last bootstrap report"""
+    return await indexes.describe_indexes(db)
+
+@router.post("/indexes/ensure")
+async def ensure_indexes(db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Re-run the idempotent index bootstrap"""
+    return await indexes.ensure_indexes(db)
+
+@router.get("/migrations")
+async def get_migrations():
+    """Get the last data-migration report"""
+    return migrations.last_report
+
+@router.post("/migrations/run")
+async def run_migrations(db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Re-run the idempotent data migrations"""
+    return await migrations.run_migrations(db)
@@ -0,0 +1,119 @@
+from fastapi import APIRouter, Depends, HTTPException
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+import logging
+from database import get_db
+from services import revenue_rollups as rollups
+from services.revenue_rollups import revenue_rollups
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/admin/analytics", tags=["analytics"])
+
+GROUP_FIELDS = ("day", "source", "package_id")
+DEFAULT_RANGE_DAYS = 30
+
+def _range(date_from: Optional[date], date_to: Optional[date]) -> Dict:
+    date_to = date_to or datetime.now(timezone.utc).date()
+    date_from = date_from or date_to - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from is after date_to")
+    return {"$gte": date_from.strftime(rollups.DAY_FORMAT), "$lte": date_to.strftime(rollups.DAY_FORMAT)}
+
+def _group_keys(group_by: str, always: List[str]) -> List[str]:
+    keys = [key.strip() for key in group_by.split(",") if key.strip()]
+    unknown = [key for key in keys if key not in GROUP_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot group by {', '.join(unknown)} (use {', '.join(GROUP_FIELDS)})")
+    return keys + [key for key in always if key not in keys]
+
+async def _summarize(db: AsyncIOMotorDatabase, match: Dict, keys: List[str], fields: List[str]) -> List[Dict]:
+    """Sum rollup fields over `match`, grouped by `keys` (reads rollups only, never raw payments)"""
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {key: f"${key}" for key in keys},
+            **{field: {"$sum": f"${field}"} for field in fields},
+        }},
+        {"$sort": {f"_id.{key}": 1 for key in keys}},
+    ]
+    rows = await db[rollups.COLLECTION].aggregate(pipeline).to_list(None)
+    return [{**row["_id"], **{field: row.get(field, 0) for field in fields}} for row in rows]
+
+@router.get("/revenue")
+async def get_revenue(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    group_by: str = "day",
+    source: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Revenue and paid counts by day/source/package (always split by currency)"""
+    # TODO: Add authentication/authorization for admin only
+    keys = _group_keys(group_by, ["currency"])
+    match = {"day": _range(date_from, date_to)}
+    if source:
+        match["source"] = source
+    rows = await _summarize(db, match, keys, ["revenue", "paid"])
+    for row in rows:
+        row["revenue"] = round(row["revenue"], 2)
+    return {"group_by": keys, "rows": rows}
+
+@router.get("/conversion")
+async def get_conversion(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    group_by: str = "source",
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Pending-to-paid conversion of payments created in the range"""
+    # TODO: Add authentication/authorization for admin only
+    keys = _group_keys(group_by, [])
+    fields = ["created", "paid", "failed", "expired", "rejected"]
+    rows = await _summarize(db, {"day": _range(date_from, date_to)}, keys, fields)
+    for row in rows:
+        row["conversion_rate"] = round(row["paid"] / row["created"], 4) if row["created"] else None
+    return {"group_by": keys, "rows": rows}
+
+@router.get("/verification-turnaround")
+async def get_verification_turnaround(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    group_by: str = "day",
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Manual payments: time from submission to admin verify/reject"""
+    # TODO: Add authentication/authorization for admin only
+    keys = _group_keys(group_by, [])
+    match = {"day": _range(date_from, date_to), "source": "manual"}
+    rows = await _summarize(db, match, keys, ["created", "paid", "rejected", "reviewed", "review_seconds"])
+    for row in rows:
+        seconds = row.pop("review_seconds")
+        row["avg_turnaround_hours"] = round(seconds / row["reviewed"] / 3600, 2) if row["reviewed"] else None
+    return {"group_by": keys, "rows": rows}
+
+@router.post("/backfill")
+async def backfill_rollups(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Rebuild daily rollups from payment_transactions and manual_payments (whole history by default)"""
+    # TODO: Add authentication/authorization for admin only
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from is after date_to")
+    try:
+        return await rollups.backfill(
+            db,
+            date_from.strftime(rollups.DAY_FORMAT) if date_from else None,
+            date_to.strftime(rollups.DAY_FORMAT) if date_to else None
+        )
+    except Exception as e:
+        logger.error(f"Revenue rollup backfill error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/rollups")
+async def get_rollup_stats():
+    """Get rollup writer counters (buffered transitions, flushes)"""
+    return revenue_rollups.stats()
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import ORJSONResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import logging
+from database import get_db
+from services.entitlements import entitlements
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/entitlements", tags=["entitlements"])
+
+@router.get("/{user_email}")
+async def get_entitlement(user_email: str, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Get a user's current plan, limits and expiry (free plan when none is active)"""
+    # TODO: Add authentication/authorization
+    return ORJSONResponse(await entitlements.lookup(db, user_email))
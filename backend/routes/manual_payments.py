@@ -1,26 +1,37 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, Request, Header
+from fastapi.responses import ORJSONResponse, StreamingResponse, FileResponse, RedirectResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
 import os
 import logging
 from datetime import datetime
+from typing import Optional
 from models.manual_payment import (
     ManualPaymentRequest,
     ManualPaymentRecord,
     BankDetails,
-    UPIDetails
+    UPIDetails,
+    BulkReviewRequest,
+    PendingPaymentItem,
+    PendingPaymentPage
 )
 from models.payment import PRICING_PACKAGES
+from database import get_db
+from services import payment_events
+from services.entitlements import PENDING_FIELD
+from services import pagination
+from services import manual_review
+from services import reconciliation
+from services.static_responses import static_responses
+from services.screenshot_storage import screenshot_store, InvalidScreenshot, ScreenshotTooLarge
+from services.write_behind import write_behind
+from services.idempotency import idempotency_store
+from services.rate_limit import payment_write_guard
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/manual-payments", tags=["manual-payments"])
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL')
-db_name = os.environ.get('DB_NAME', 'sdwrite')
-mongo_client = AsyncIOMotorClient(mongo_url)
-db = mongo_client[db_name]
-
 # Bank and UPI details (Real account details)
 BANK_DETAILS = BankDetails(
     account_name="RUBI SHARMA",
@@ -37,11 +48,9 @@ UPI_DETAILS = UPIDetails(
     qr_code_url=None  # You can add QR code image URL later
 )
 
-@router.get("/bank-details")
-async def get_bank_details():
-    """Get bank account details for manual transfer"""
+def _bank_details_payload():
     return {
-        "bank_details": BANK_DETAILS.dict(),
+        "bank_details": BANK_DETAILS.model_dump(),
         "instructions": [
             "Transfer the exact amount to the above bank account",
             "Use your Order ID as reference/remark",
@@ -51,11 +60,9 @@ async def get_bank_details():
         ]
     }
 
-@router.get("/upi-details")
-async def get_upi_details():
-    """Get UPI details for payment"""
+def _upi_details_payload():
     return {
-        "upi_details": UPI_DETAILS.dict(),
+        "upi_details": UPI_DETAILS.model_dump(),
         "instructions": [
             "Open any UPI app (PhonePe, GPay, Paytm, etc.)",
             "Pay to the above UPI ID or scan QR code",
@@ -67,9 +74,89 @@ async def get_upi_details():
         ]
     }
 
-@router.post("/submit-payment")
-async def submit_manual_payment(payment: ManualPaymentRequest):
-    """Submit manual payment details for verification"""
+static_responses.register("bank-details", _bank_details_payload)
+static_responses.register("upi-details", _upi_details_payload)
+
+@router.get("/bank-details")
+async def get_bank_details(request: Request):
+    """Get bank account details for manual transfer"""
+    return static_responses.respond("bank-details", request)
+
+@router.get("/upi-details")
+async def get_upi_details(request: Request):
+    """Get UPI details for payment"""
+    return static_responses.respond("upi-details", request)
+
+# Multipart boundaries and headers on top of the image itself
+UPLOAD_OVERHEAD_BYTES = 16 * 1024
+
+def _screenshot_url(screenshot_id: str, thumbnail: bool = False) -> str:
+    url = f"{router.prefix}/screenshots/{screenshot_id}"
+    return url + "/thumbnail" if thumbnail else url
+
+@router.post("/upload-screenshot")
+async def upload_screenshot(request: Request, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Upload a payment screenshot (multipart field "screenshot": PNG, JPEG or WebP)"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and \
+            int(content_length) > screenshot_store.max_bytes + UPLOAD_OVERHEAD_BYTES:
+        raise HTTPException(status_code=413, detail="Screenshot is too large")
+    
+    try:
+        stored = await screenshot_store.save(db, request)
+    except ScreenshotTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidScreenshot as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Screenshot upload error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Screenshot upload failed")
+    
+    return {
+        "success": True,
+        **stored,
+        "screenshot_url": _screenshot_url(stored["screenshot_id"]),
+        "thumbnail_url": _screenshot_url(stored["screenshot_id"], thumbnail=True)
+    }
+
+async def _serve_screenshot(db: AsyncIOMotorDatabase, screenshot_id: str, thumbnail: bool):
+    found = await screenshot_store.resolve(db, screenshot_id, thumbnail)
+    if not found:
+        raise HTTPException(status_code=404, detail="Screenshot not found")
+    key, content_type = found
+    url = screenshot_store.objects.url(key)
+    if url:
+        return RedirectResponse(url)
+    # Content-addressed, so the bytes behind a key never change
+    return FileResponse(
+        screenshot_store.objects.path(key),
+        media_type=content_type,
+        headers={"Cache-Control": "private, max-age=31536000, immutable"}
+    )
+
+@router.get("/screenshots/{screenshot_id}")
+async def get_screenshot(screenshot_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Get an uploaded payment screenshot"""
+    return await _serve_screenshot(db, screenshot_id, thumbnail=False)
+
+@router.get("/screenshots/{screenshot_id}/thumbnail")
+async def get_screenshot_thumbnail(screenshot_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Get a screenshot thumbnail (the original until the thumbnail is ready)"""
+    return await _serve_screenshot(db, screenshot_id, thumbnail=True)
+
+@router.post("/submit-payment", dependencies=[Depends(payment_write_guard("manual_payment"))])
+async def submit_manual_payment(
+    payment: ManualPaymentRequest,
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Submit manual payment details for verification (retries with the same Idempotency-Key get the first order back)"""
+    return await idempotency_store.run(
+        db, "manual_payment", idempotency_key, payment.model_dump(),
+        lambda: _submit_manual_payment(payment, db)
+    )
+
+async def _submit_manual_payment(payment: ManualPaymentRequest, db: AsyncIOMotorDatabase):
     try:
         # Validate package
         if payment.package_id not in PRICING_PACKAGES:
@@ -85,6 +172,12 @@ async def submit_manual_payment(payment: ManualPaymentRequest):
                 detail=f"Amount mismatch. Expected: ₹{expected_amount}, Received: ₹{payment.amount}"
             )
         
+        screenshot_url = payment.payment_screenshot_url
+        if payment.screenshot_id:
+            if not await screenshot_store.resolve(db, payment.screenshot_id):
+                raise HTTPException(status_code=400, detail="Unknown screenshot_id; upload the screenshot first")
+            screenshot_url = _screenshot_url(payment.screenshot_id)
+        
         # Create payment record
         payment_record = ManualPaymentRecord(
             package_id=payment.package_id,
@@ -93,7 +186,8 @@ async def submit_manual_payment(payment: ManualPaymentRequest):
             currency=payment.currency,
             payment_method=payment.payment_method,
             transaction_id=payment.transaction_id,
-            payment_screenshot_url=payment.payment_screenshot_url,
+            payment_screenshot_url=screenshot_url,
+            screenshot_id=payment.screenshot_id,
             user_name=payment.user_name,
             user_email=payment.user_email,
             user_phone=payment.user_phone,
@@ -101,8 +195,10 @@ async def submit_manual_payment(payment: ManualPaymentRequest):
             status="pending"
         )
         
-        # Save to database
-        result = await db.manual_payments.insert_one(payment_record.dict())
+        # Save to database (batched when write-behind is on)
+        payment_doc = payment_record.model_dump()
+        await write_behind.insert_one(db.manual_payments, payment_doc)
+        payment_events.manual_payment_created(payment_doc)
         
         logger.info(f"Manual payment submitted: {payment_record.order_id} by {payment.user_email}")
         
@@ -122,16 +218,53 @@ async def submit_manual_payment(payment: ManualPaymentRequest):
         logger.error(f"Manual payment submission error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _find_payment(db: AsyncIOMotorDatabase, order_id: str) -> Optional[dict]:
+    payment = await db.manual_payments.find_one({"order_id": order_id})
+    if payment is None:
+        # A just-submitted payment may still be buffered
+        await write_behind.flush("manual_payments")
+        payment = await db.manual_payments.find_one({"order_id": order_id})
+    return payment
+
 @router.get("/payment-status/{order_id}")
-async def get_payment_status(order_id: str):
+async def get_payment_status(order_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Check manual payment verification status"""
-    payment = await db.manual_payments.find_one({"order_id": order_id})
+    payment = await _find_payment(db, order_id)
     
     if not payment:
         raise HTTPException(status_code=404, detail="Payment record not found")
     
+    return _payment_status_payload(payment)
+
+@router.get("/payment-status/{order_id}/stream")
+async def stream_payment_status(order_id: str, timeout: int = 25, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Server-Sent Events: push one status event when the payment is verified or rejected"""
+    async def load_current():
+        payment = await _find_payment(db, order_id)
+        return _payment_status_payload(payment) if payment else None
+    
+    current = await load_current()
+    if not current:
+        raise HTTPException(status_code=404, detail="Payment record not found")
+    
+    if _payment_status_final(current):
+        body = iter([payment_events.format_sse("status", current)])
+    else:
+        body = payment_events.status_events(
+            payment_events.manual_payment_topic(order_id),
+            load_current,
+            _payment_status_payload,
+            _payment_status_final,
+            timeout
+        )
+    return StreamingResponse(body, media_type="text/event-stream", headers=payment_events.SSE_HEADERS)
+
+def _payment_status_final(status: dict) -> bool:
+    return status["status"] in ("verified", "rejected", "expired")
+
+def _payment_status_payload(payment: dict) -> dict:
     return {
-        "order_id": order_id,
+        "order_id": payment["order_id"],
         "status": payment["status"],
         "package_name": payment["package_name"],
         "amount": payment["amount"],
@@ -141,50 +274,84 @@ async def get_payment_status(order_id: str):
         "message": {
             "pending": "Your payment is under verification. You'll receive an email once verified.",
             "verified": "Payment verified! Your subscription is now active.",
-            "rejected": "Payment verification failed. Please contact support."
+            "rejected": "Payment verification failed. Please contact support.",
+            "expired": "This payment request has expired. Please contact support if you have already paid."
         }.get(payment["status"], "Unknown status")
     }
 
-@router.get("/pending-payments")
-async def get_pending_payments(skip: int = 0, limit: int = 50):
-    """Get all pending payments for admin verification"""
+# Fields the admin review list needs (keeps _id and bulky notes out of the page)
+ADMIN_LIST_PROJECTION = pagination.projection_for(PendingPaymentItem, computed=("screenshot_thumbnail_url",))
+
+@router.get("/pending-payments", response_model=PendingPaymentPage)
+async def get_pending_payments(
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    status: str = "pending",
+    method: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get payments for admin verification (pending by default), newest first.
+    Pass the returned next_cursor to fetch the following page."""
     # TODO: Add authentication/authorization for admin only
     
-    payments = await db.manual_payments.find(
-        {"status": "pending"}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    limit = pagination.clamp_limit(limit)
+    base = {"status": status}
+    if method:
+        base["payment_method"] = method
     
-    return {
+    try:
+        query = pagination.keyset_query(base, "order_id", cursor, date_from, date_to)
+    except pagination.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    rows = await db.manual_payments.find(query, ADMIN_LIST_PROJECTION).sort(
+        pagination.keyset_sort("order_id")
+    ).limit(limit + 1).to_list(limit + 1)
+    payments, next_cursor = pagination.split_page(rows, "order_id", limit)
+    for payment in payments:
+        if payment.get("screenshot_id"):
+            payment["screenshot_thumbnail_url"] = _screenshot_url(payment["screenshot_id"], thumbnail=True)
+    
+    # Rows are already the PendingPaymentPage shape; skip re-validation and jsonable_encoder
+    return ORJSONResponse({
         "count": len(payments),
-        "payments": payments
-    }
+        "payments": payments,
+        "next_cursor": next_cursor
+    })
 
 @router.post("/verify-payment/{order_id}")
-async def verify_payment(order_id: str, verified_by: str = "admin"):
+async def verify_payment(order_id: str, verified_by: str = "admin", db: AsyncIOMotorDatabase = Depends(get_db)):
     """Admin endpoint to verify payment"""
     # TODO: Add authentication/authorization
     
-    result = await db.manual_payments.update_one(
-        {"order_id": order_id, "status": "pending"},
+    await write_behind.flush("manual_payments")
+    payment = await db.manual_payments.find_one_and_update(
+        {"order_id": order_id, "status": manual_review.REVIEWABLE},
         {
             "$set": {
                 "status": "verified",
                 "verified_at": datetime.utcnow(),
-                "verified_by": verified_by
+                "verified_by": verified_by,
+                PENDING_FIELD: True
             }
-        }
+        },
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.modified_count == 0:
+    if not payment:
         raise HTTPException(status_code=404, detail="Payment not found or already verified")
     
+    payment_events.manual_payment_updated(payment)
+    
+    # The plan itself is granted from the transition (see services/entitlements.py)
     # TODO: Send confirmation email to user
-    # TODO: Activate user subscription
     
     return {"success": True, "message": "Payment verified successfully"}
 
 @router.post("/reject-payment/{order_id}")
-async def reject_payment(order_id: str, reason: str = None):
+async def reject_payment(order_id: str, reason: str = None, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Admin endpoint to reject payment"""
     # TODO: Add authentication/authorization
     
@@ -195,14 +362,84 @@ async def reject_payment(order_id: str, reason: str = None):
     if reason:
         update_data["rejection_reason"] = reason
     
-    result = await db.manual_payments.update_one(
-        {"order_id": order_id, "status": "pending"},
-        {"$set": update_data}
+    await write_behind.flush("manual_payments")
+    payment = await db.manual_payments.find_one_and_update(
+        {"order_id": order_id, "status": manual_review.REVIEWABLE},
+        {"$set": update_data},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.modified_count == 0:
+    if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
     
+    payment_events.manual_payment_updated(payment)
+    
     # TODO: Send rejection email to user
     
     return {"success": True, "message": "Payment rejected"}
+
+@router.post("/bulk-review")
+async def bulk_review_payments(request: BulkReviewRequest, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Admin endpoint to verify/reject many payments in one call"""
+    # TODO: Add authentication/authorization
+    
+    results = await manual_review.apply_reviews(
+        db,
+        ((item.order_id, item.action, item.reason) for item in request.items),
+        request.reviewed_by
+    )
+    
+    summary = {}
+    for result in results:
+        summary[result["result"]] = summary.get(result["result"], 0) + 1
+    
+    return {"success": True, "summary": summary, "results": results}
+
+@router.post("/bulk-verify-statement")
+async def bulk_verify_statement(
+    statement: UploadFile = File(...),
+    verified_by: str = Form("admin"),
+    amount_tolerance: float = Form(1.0),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Admin endpoint to verify pending payments matching a bank statement CSV
+    (columns: transaction_id, amount)"""
+    # TODO: Add authentication/authorization
+    
+    try:
+        report = await manual_review.verify_from_statement(
+            db, statement.file, verified_by, amount_tolerance
+        )
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"success": True, **report}
+
+@router.post("/reconcile-statement")
+async def reconcile_statement(
+    statement: UploadFile = File(...),
+    date_window_days: int = Form(3),
+    amount_tolerance: float = Form(1.0),
+    auto_verify: bool = Form(False),
+    include_amount_date: bool = Form(False),
+    verified_by: str = Form("reconciliation"),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Admin endpoint to match a bank/UPI statement CSV against pending payments.
+    Rows match by transaction id/UTR, or by exact amount within the date window."""
+    # TODO: Add authentication/authorization
+    
+    try:
+        report = await reconciliation.reconcile_statement(
+            db,
+            statement.file,
+            date_window_days=date_window_days,
+            amount_tolerance=amount_tolerance,
+            auto_verify=auto_verify,
+            include_amount_date=include_amount_date,
+            verified_by=verified_by
+        )
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"success": True, **report}
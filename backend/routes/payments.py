@@ -1,45 +1,56 @@
-from fastapi import APIRouter, HTTPException, Request, Header
-from motor.motor_asyncio import AsyncIOMotorClient
-from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionRequest
-import razorpay
-import hmac
+from fastapi import APIRouter, HTTPException, Request, Header, Depends
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
 import hashlib
+import json
 import os
 import logging
+from datetime import datetime
+from typing import Optional
 from models.payment import (
     PRICING_PACKAGES,
     PaymentTransaction,
     CreateCheckoutRequest,
     RazorpayOrderRequest,
     RazorpayVerifyRequest,
-    CheckoutStatusResponse
+    CheckoutStatusResponse,
+    TransactionListItem,
+    TransactionPage
 )
+from database import get_db
+from services.razorpay_gateway import razorpay_gateway, GatewayUnavailable, GatewayTimeout
+from services.stripe_gateway import stripe_gateway
+from services.status_cache import stripe_status_cache
+from services import payment_events
+from services.entitlements import PENDING_FIELD
+from services.webhook_ingest import webhook_ingestor
+from services import pagination
+from services.static_responses import static_responses
+from services.write_behind import write_behind
+from services.expiry_sweeper import expiry_sweeper
+from services.idempotency import idempotency_store
+from services.rate_limit import payment_write_guard
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/payments", tags=["payments"])
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL')
-db_name = os.environ.get('DB_NAME', 'sdwrite')
-mongo_client = AsyncIOMotorClient(mongo_url)
-db = mongo_client[db_name]
-
-# Payment gateway clients
-STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY', 'sk_test_emergent')
-RAZORPAY_KEY_ID = os.environ.get('RAZORPAY_KEY_ID', '')
-RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET', '')
-
-# Initialize Razorpay client only if keys are available
-razorpay_client = None
-if RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET:
-    razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
-
 # ==================== STRIPE INTEGRATION ====================
 
-@router.post("/stripe/create-checkout")
-async def create_stripe_checkout(request: CreateCheckoutRequest):
-    """Create Stripe checkout session"""
+@router.post("/stripe/create-checkout", dependencies=[Depends(payment_write_guard("stripe_checkout"))])
+async def create_stripe_checkout(
+    request: CreateCheckoutRequest,
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Create Stripe checkout session (retries with the same Idempotency-Key get the first session back)"""
+    return await idempotency_store.run(
+        db, "stripe_checkout", idempotency_key, request.model_dump(),
+        lambda: _create_stripe_checkout(request, db)
+    )
+
+async def _create_stripe_checkout(request: CreateCheckoutRequest, db: AsyncIOMotorDatabase):
     try:
         # Validate package
         if request.package_id not in PRICING_PACKAGES:
@@ -60,13 +71,8 @@ async def create_stripe_checkout(request: CreateCheckoutRequest):
         success_url = f"{request.origin_url}/payment-success?session_id={{CHECKOUT_SESSION_ID}}"
         cancel_url = f"{request.origin_url}/payment-cancelled"
         
-        # Initialize Stripe
-        host_url = request.origin_url
-        webhook_url = f"{host_url}/api/payments/stripe/webhook"
-        stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
-        
         # Create checkout session
-        checkout_request = CheckoutSessionRequest(
+        checkout_request = stripe_gateway.session_request(
             amount=amount,
             currency=request.currency,
             success_url=success_url,
@@ -78,7 +84,7 @@ async def create_stripe_checkout(request: CreateCheckoutRequest):
             }
         )
         
-        session = await stripe_checkout.create_checkout_session(checkout_request)
+        session = await stripe_gateway.create_checkout_session(request.origin_url, checkout_request)
         
         # Create transaction record
         transaction = PaymentTransaction(
@@ -96,7 +102,9 @@ async def create_stripe_checkout(request: CreateCheckoutRequest):
             }
         )
         
-        await db.payment_transactions.insert_one(transaction.dict())
+        transaction_doc = transaction.model_dump()
+        await write_behind.insert_one(db.payment_transactions, transaction_doc)
+        payment_events.transaction_created(transaction_doc)
         
         logger.info(f"Stripe checkout created: {session.session_id}")
         
@@ -111,90 +119,188 @@ async def create_stripe_checkout(request: CreateCheckoutRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/stripe/status/{session_id}")
-async def get_stripe_status(session_id: str):
+async def get_stripe_status(session_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get Stripe payment status"""
     try:
-        # Check if already processed
-        existing = await db.payment_transactions.find_one(
-            {"session_id": session_id, "payment_status": "paid"}
+        # Concurrent polls for the same session share one lookup
+        status = await stripe_status_cache.get_or_load(
+            session_id,
+            lambda: _load_stripe_status(db, session_id)
         )
+        return CheckoutStatusResponse(**status)
         
-        if existing:
-            return CheckoutStatusResponse(
-                status="complete",
-                payment_status="paid",
-                amount=existing["amount"],
-                currency=existing["currency"],
-                package_name=existing["package_name"],
-                payment_gateway="stripe"
-            )
-        
-        # Query Stripe
-        stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url="")
-        checkout_status = await stripe_checkout.get_checkout_status(session_id)
-        
-        # Update transaction
-        update_data = {
-            "payment_status": checkout_status.payment_status,
-            "status": checkout_status.status
-        }
-        
-        await db.payment_transactions.update_one(
-            {"session_id": session_id},
+    except Exception as e:
+        logger.error(f"Stripe status error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _load_stripe_status(db: AsyncIOMotorDatabase, session_id: str) -> dict:
+    """Resolve Stripe status from the DB, falling back to a live Stripe query"""
+    # Check if already processed
+    existing = await db.payment_transactions.find_one(
+        {"session_id": session_id, "payment_status": "paid"}
+    )
+    
+    if existing:
+        return CheckoutStatusResponse(
+            status="complete",
+            payment_status="paid",
+            amount=existing["amount"],
+            currency=existing["currency"],
+            package_name=existing["package_name"],
+            payment_gateway="stripe"
+        ).model_dump()
+    
+    # Query Stripe
+    checkout_status = await stripe_gateway.get_checkout_status(session_id)
+    
+    # Update transaction
+    update_data = {
+        "payment_status": checkout_status.payment_status,
+        "status": checkout_status.status
+    }
+    
+    if checkout_status.payment_status == "paid":
+        # Paid state is written synchronously, after any buffered insert of this session
+        await write_behind.flush("payment_transactions")
+        paid = await db.payment_transactions.find_one_and_update(
+            {"session_id": session_id, "payment_status": {"$ne": "paid"}},
+            {"$set": {**update_data, PENDING_FIELD: True}},
+            return_document=ReturnDocument.AFTER
+        )
+        if paid:
+            payment_events.transaction_updated(paid)
+    else:
+        # A late poll must not reopen a session the expiry sweeper already closed
+        await write_behind.update_one(
+            db.payment_transactions,
+            {"session_id": session_id, "payment_status": {"$nin": ["paid", "expired"]}},
             {"$set": update_data}
         )
-        
+    
+    transaction = await db.payment_transactions.find_one({"session_id": session_id})
+    if transaction is None:
+        # The checkout insert may still be buffered
+        await write_behind.flush("payment_transactions")
         transaction = await db.payment_transactions.find_one({"session_id": session_id})
-        
-        return CheckoutStatusResponse(
-            status=checkout_status.status,
-            payment_status=checkout_status.payment_status,
-            amount=transaction["amount"],
-            currency=transaction["currency"],
-            package_name=transaction["package_name"],
-            payment_gateway="stripe"
+    
+    return CheckoutStatusResponse(
+        status=checkout_status.status,
+        payment_status=checkout_status.payment_status,
+        amount=transaction["amount"],
+        currency=transaction["currency"],
+        package_name=transaction["package_name"],
+        payment_gateway="stripe"
+    ).model_dump()
+
+def _stripe_status_payload(transaction: dict) -> dict:
+    paid = transaction.get("payment_status") == "paid"
+    return CheckoutStatusResponse(
+        status="complete" if paid else (transaction.get("status") or "open"),
+        payment_status=transaction["payment_status"],
+        amount=transaction["amount"],
+        currency=transaction["currency"],
+        package_name=transaction["package_name"],
+        payment_gateway="stripe"
+    ).model_dump()
+
+def _stripe_status_final(status: dict) -> bool:
+    return status["payment_status"] == "paid" or status["status"] in ("complete", "expired")
+
+@router.get("/stripe/status/{session_id}/stream")
+async def stream_stripe_status(session_id: str, timeout: int = 25, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Server-Sent Events: push one status event when the checkout changes"""
+    async def load_current():
+        return await stripe_status_cache.get_or_load(
+            session_id,
+            lambda: _load_stripe_status(db, session_id)
         )
-        
+    
+    try:
+        current = await load_current()
     except Exception as e:
-        logger.error(f"Stripe status error: {str(e)}")
+        logger.error(f"Stripe status stream error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    
+    if _stripe_status_final(current):
+        body = iter([payment_events.format_sse("status", current)])
+    else:
+        body = payment_events.status_events(
+            f"stripe:{session_id}",
+            load_current,
+            _stripe_status_payload,
+            _stripe_status_final,
+            timeout
+        )
+    return StreamingResponse(body, media_type="text/event-stream", headers=payment_events.SSE_HEADERS)
 
 @router.post("/stripe/webhook")
-async def stripe_webhook(request: Request):
-    """Handle Stripe webhooks"""
+async def stripe_webhook(request: Request, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Handle Stripe webhooks (logged, deduplicated, applied in the background)"""
     try:
         payload = await request.body()
         sig_header = request.headers.get("Stripe-Signature")
         
-        stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url="")
-        webhook_response = await stripe_checkout.handle_webhook(payload, sig_header)
-        
-        # Update transaction based on webhook event
-        if webhook_response.payment_status == "paid":
-            await db.payment_transactions.update_one(
-                {"session_id": webhook_response.session_id, "payment_status": {"$ne": "paid"}},
-                {
-                    "$set": {
-                        "payment_status": "paid",
-                        "payment_id": webhook_response.event_id
-                    }
-                }
-            )
-            logger.info(f"Payment confirmed via webhook: {webhook_response.session_id}")
+        webhook_response = await stripe_gateway.handle_webhook(payload, sig_header)
+        
+        result = await webhook_ingestor.ingest(
+            db,
+            "stripe",
+            webhook_response.event_id,
+            webhook_response.event_type,
+            {
+                "event_id": webhook_response.event_id,
+                "session_id": webhook_response.session_id,
+                "payment_status": webhook_response.payment_status
+            }
+        )
         
-        return {"status": "success"}
+        return {"status": "success" if result == "accepted" else result}
         
     except Exception as e:
         logger.error(f"Stripe webhook error: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+async def _apply_stripe_event(db: AsyncIOMotorDatabase, event: dict):
+    """Update transaction based on a logged Stripe webhook event"""
+    if event["payment_status"] != "paid":
+        return
+    
+    await write_behind.flush("payment_transactions")
+    transaction = await db.payment_transactions.find_one_and_update(
+        {"session_id": event["session_id"], "payment_status": {"$ne": "paid"}},
+        {
+            "$set": {
+                "payment_status": "paid",
+                "payment_id": event["event_id"],
+                PENDING_FIELD: True
+            }
+        },
+        return_document=ReturnDocument.AFTER
+    )
+    await stripe_status_cache.invalidate(event["session_id"])
+    if transaction:
+        payment_events.transaction_updated(transaction)
+    logger.info(f"Payment confirmed via webhook: {event['session_id']}")
+
+webhook_ingestor.register("stripe", _apply_stripe_event)
+
 # ==================== RAZORPAY INTEGRATION ====================
 
-@router.post("/razorpay/create-order")
-async def create_razorpay_order(request: RazorpayOrderRequest):
-    """Create Razorpay order"""
+@router.post("/razorpay/create-order", dependencies=[Depends(payment_write_guard("razorpay_order"))])
+async def create_razorpay_order(
+    request: RazorpayOrderRequest,
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Create Razorpay order (retries with the same Idempotency-Key get the first order back)"""
+    return await idempotency_store.run(
+        db, "razorpay_order", idempotency_key, request.model_dump(),
+        lambda: _create_razorpay_order(request, db)
+    )
+
+async def _create_razorpay_order(request: RazorpayOrderRequest, db: AsyncIOMotorDatabase):
     try:
-        if not razorpay_client:
+        if not razorpay_gateway.configured:
             raise HTTPException(
                 status_code=503, 
                 detail="Razorpay is not configured. Please add RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET to .env file"
@@ -228,7 +334,7 @@ async def create_razorpay_order(request: RazorpayOrderRequest):
             }
         }
         
-        razorpay_order = razorpay_client.order.create(data=order_data)
+        razorpay_order = await razorpay_gateway.create_order(order_data)
         
         # Create transaction record
         transaction = PaymentTransaction(
@@ -246,7 +352,9 @@ async def create_razorpay_order(request: RazorpayOrderRequest):
             }
         )
         
-        await db.payment_transactions.insert_one(transaction.dict())
+        transaction_doc = transaction.model_dump()
+        await write_behind.insert_one(db.payment_transactions, transaction_doc)
+        payment_events.transaction_created(transaction_doc)
         
         logger.info(f"Razorpay order created: {razorpay_order['id']}")
         
@@ -254,35 +362,40 @@ async def create_razorpay_order(request: RazorpayOrderRequest):
             "order_id": razorpay_order["id"],
             "amount": amount_paise,
             "currency": "INR",
-            "key_id": RAZORPAY_KEY_ID,
+            "key_id": razorpay_gateway.key_id,
             "package_name": package["name"],
             "payment_gateway": "razorpay"
         }
         
+    except HTTPException:
+        raise
+    except GatewayUnavailable as e:
+        logger.warning(f"Razorpay order rejected: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except GatewayTimeout as e:
+        logger.error(f"Razorpay order timeout: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Razorpay order error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/razorpay/verify")
-async def verify_razorpay_payment(request: RazorpayVerifyRequest):
+async def verify_razorpay_payment(request: RazorpayVerifyRequest, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Verify Razorpay payment signature"""
     try:
-        if not razorpay_client:
+        if not razorpay_gateway.configured:
             raise HTTPException(status_code=503, detail="Razorpay is not configured")
         
-        # Verify signature
-        params_dict = {
-            'razorpay_order_id': request.razorpay_order_id,
-            'razorpay_payment_id': request.razorpay_payment_id,
-            'razorpay_signature': request.razorpay_signature
-        }
-        
-        try:
-            razorpay_client.utility.verify_payment_signature(params_dict)
-        except:
+        # Verify signature (local HMAC, no SDK round trip)
+        if not razorpay_gateway.verify_payment_signature(
+            request.razorpay_order_id,
+            request.razorpay_payment_id,
+            request.razorpay_signature
+        ):
             raise HTTPException(status_code=400, detail="Invalid payment signature")
         
-        # Check if already processed
+        # Check if already processed (the order insert may still be buffered)
+        await write_behind.flush("payment_transactions")
         existing = await db.payment_transactions.find_one(
             {"order_id": request.razorpay_order_id, "payment_status": "paid"}
         )
@@ -290,20 +403,27 @@ async def verify_razorpay_payment(request: RazorpayVerifyRequest):
         if existing:
             return {"status": "success", "message": "Payment already processed"}
         
-        # Update transaction
-        result = await db.payment_transactions.update_one(
-            {"order_id": request.razorpay_order_id},
+        # Update transaction (only if not already paid, so the transition is counted once)
+        transaction = await db.payment_transactions.find_one_and_update(
+            {"order_id": request.razorpay_order_id, "payment_status": {"$ne": "paid"}},
             {
                 "$set": {
                     "payment_id": request.razorpay_payment_id,
-                    "payment_status": "paid"
+                    "payment_status": "paid",
+                    PENDING_FIELD: True
                 }
-            }
+            },
+            return_document=ReturnDocument.AFTER
         )
         
-        if result.modified_count == 0:
+        if not transaction:
+            # A webhook may have marked it paid since the check above
+            if await db.payment_transactions.find_one({"order_id": request.razorpay_order_id}, {"_id": 1}):
+                return {"status": "success", "message": "Payment already processed"}
             raise HTTPException(status_code=404, detail="Transaction not found")
         
+        payment_events.transaction_updated(transaction)
+        
         logger.info(f"Razorpay payment verified: {request.razorpay_payment_id}")
         
         return {"status": "success", "message": "Payment verified successfully"}
@@ -315,74 +435,158 @@ async def verify_razorpay_payment(request: RazorpayVerifyRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/razorpay/webhook")
-async def razorpay_webhook(request: Request):
-    """Handle Razorpay webhooks"""
+async def razorpay_webhook(request: Request, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Handle Razorpay webhooks (logged, deduplicated, applied in the background)"""
     try:
-        if not razorpay_client:
+        if not razorpay_gateway.configured:
             raise HTTPException(status_code=503, detail="Razorpay is not configured")
         
         payload = await request.body()
         signature = request.headers.get('X-Razorpay-Signature', '')
-        webhook_secret = os.environ.get('RAZORPAY_WEBHOOK_SECRET', '')
+        webhook_secret = razorpay_gateway.webhook_secret
         
         if not webhook_secret:
             logger.warning("Razorpay webhook secret not configured")
             return {"status": "ignored"}
         
         # Verify webhook signature
-        razorpay_client.utility.verify_webhook_signature(
-            payload.decode(),
-            signature,
-            webhook_secret
-        )
+        if not razorpay_gateway.verify_webhook_signature(payload, signature, webhook_secret):
+            raise HTTPException(status_code=400, detail="Invalid webhook signature")
         
-        # Process webhook event
-        import json
-        event_data = json.loads(payload)
+        # Razorpay sends a unique id per event; fall back to the body hash
+        event_id = request.headers.get('X-Razorpay-Event-Id') or hashlib.sha256(payload).hexdigest()
         
+        event_data = json.loads(payload)
         event = event_data.get('event')
         payment_entity = event_data.get('payload', {}).get('payment', {}).get('entity', {})
         
-        if event == 'payment.captured':
-            order_id = payment_entity.get('order_id')
-            payment_id = payment_entity.get('id')
-            
-            # Update transaction (only if not already paid)
-            await db.payment_transactions.update_one(
-                {"order_id": order_id, "payment_status": {"$ne": "paid"}},
-                {
-                    "$set": {
-                        "payment_id": payment_id,
-                        "payment_status": "paid"
-                    }
-                }
-            )
-            
-            logger.info(f"Razorpay payment captured via webhook: {payment_id}")
+        result = await webhook_ingestor.ingest(
+            db,
+            "razorpay",
+            event_id,
+            event,
+            {
+                "event": event,
+                "order_id": payment_entity.get('order_id'),
+                "payment_id": payment_entity.get('id')
+            }
+        )
         
-        return {"status": "processed"}
+        return {"status": "accepted" if result == "accepted" else result}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Razorpay webhook error: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+async def _apply_razorpay_event(db: AsyncIOMotorDatabase, event: dict):
+    """Update transaction based on a logged Razorpay webhook event"""
+    if event["event"] != 'payment.captured':
+        return
+    
+    await write_behind.flush("payment_transactions")
+    
+    # Update transaction (only if not already paid)
+    transaction = await db.payment_transactions.find_one_and_update(
+        {"order_id": event["order_id"], "payment_status": {"$ne": "paid"}},
+        {
+            "$set": {
+                "payment_id": event["payment_id"],
+                "payment_status": "paid",
+                PENDING_FIELD: True
+            }
+        },
+        return_document=ReturnDocument.AFTER
+    )
+    if transaction:
+        payment_events.transaction_updated(transaction)
+    
+    logger.info(f"Razorpay payment captured via webhook: {event['payment_id']}")
+
+webhook_ingestor.register("razorpay", _apply_razorpay_event)
+
+# ==================== EXPIRY RECONCILIATION ====================
+
+async def _stripe_gateway_status(transaction: dict) -> str:
+    """Ask Stripe about a stale pending session before the sweeper expires it"""
+    if not transaction.get("session_id"):
+        return "expired"
+    checkout_status = await stripe_gateway.get_checkout_status(transaction["session_id"])
+    if checkout_status.payment_status == "paid":
+        return "paid"
+    return "pending" if checkout_status.status == "open" else "expired"
+
+async def _razorpay_gateway_status(transaction: dict) -> str:
+    """Ask Razorpay about a stale pending order before the sweeper expires it"""
+    if not transaction.get("order_id") or not razorpay_gateway.configured:
+        return "expired"
+    order = await razorpay_gateway.fetch_order(transaction["order_id"])
+    return "paid" if order.get("status") == "paid" else "expired"
+
+expiry_sweeper.register("stripe", _stripe_gateway_status)
+expiry_sweeper.register("razorpay", _razorpay_gateway_status)
+
 # ==================== COMMON ENDPOINTS ====================
 
-@router.get("/packages")
-async def get_pricing_packages():
-    """Get all pricing packages"""
+def _packages_payload():
     return {
         "packages": PRICING_PACKAGES,
         "available_gateways": {
             "stripe": True,
-            "razorpay": razorpay_client is not None
+            "razorpay": razorpay_gateway.configured
         }
     }
 
-@router.get("/transaction/{transaction_id}")
-async def get_transaction(transaction_id: str):
+static_responses.register("packages", _packages_payload)
+
+@router.get("/packages")
+async def get_pricing_packages(request: Request):
+    """Get all pricing packages"""
+    return static_responses.respond("packages", request)
+
+TRANSACTION_LIST_PROJECTION = pagination.projection_for(TransactionListItem)
+
+@router.get("/transactions", response_model=TransactionPage)
+async def list_transactions(
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    status: Optional[str] = None,
+    gateway: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """List gateway transactions newest first, with keyset pagination"""
+    # TODO: Add authentication/authorization for admin only
+    limit = pagination.clamp_limit(limit)
+    base = {}
+    if status:
+        base["payment_status"] = status
+    if gateway:
+        base["payment_gateway"] = gateway
+    
+    try:
+        query = pagination.keyset_query(base, "id", cursor, date_from, date_to)
+    except pagination.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    rows = await db.payment_transactions.find(query, TRANSACTION_LIST_PROJECTION).sort(
+        pagination.keyset_sort("id")
+    ).limit(limit + 1).to_list(limit + 1)
+    transactions, next_cursor = pagination.split_page(rows, "id", limit)
+    
+    # Rows are already the TransactionPage shape; skip re-validation and jsonable_encoder
+    return ORJSONResponse({
+        "count": len(transactions),
+        "transactions": transactions,
+        "next_cursor": next_cursor
+    })
+
+@router.get("/transaction/{transaction_id}", response_model=PaymentTransaction)
+async def get_transaction(transaction_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get transaction details"""
-    transaction = await db.payment_transactions.find_one({"id": transaction_id})
+    transaction = await db.payment_transactions.find_one({"id": transaction_id}, {"_id": 0})
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
-    return transaction
+    return ORJSONResponse(transaction)
@@ -0,0 +1,105 @@
+from fastapi import APIRouter, Depends, HTTPException
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import logging
+from database import get_db
+from services.webhook_ingest import webhook_ingestor, COLLECTION as WEBHOOK_EVENTS
+from services.static_responses import static_responses
+from services.screenshot_storage import screenshot_store
+from services import gateway_simulators
+from services.write_behind import write_behind
+from services.expiry_sweeper import expiry_sweeper
+from services.idempotency import idempotency_store
+from services.rate_limit import rate_limiter, admission_gate
+from services.entitlements import entitlements
+from services.usage_metering import usage_meter
+
+logger = logging.getLogger(__name__)
+
+# Only included when the payment stack imports (PAYMENTS_ENABLED in server.py)
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+@router.get("/webhooks")
+async def get_webhook_stats(db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Get webhook ingestion counters and event-log totals per status"""
+    by_status = await db[WEBHOOK_EVENTS].aggregate([
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    return {
+        "ingestor": webhook_ingestor.stats(),
+        "events_by_status": {row["_id"]: row["count"] for row in by_status}
+    }
+
+@router.post("/webhooks/{event_key}/replay")
+async def replay_webhook(event_key: str):
+    """Re-run a logged webhook event (e.g. "stripe:evt_123")"""
+    if not await webhook_ingestor.replay(event_key):
+        raise HTTPException(status_code=404, detail="Event not found or still in progress")
+    return {"success": True, "event_key": event_key}
+
+@router.get("/static-responses")
+async def get_static_responses():
+    """Get precomputed config responses, their ETags and 304 counters"""
+    return static_responses.stats()
+
+@router.post("/static-responses/refresh")
+async def refresh_static_responses():
+    """Rebuild precomputed config responses after a pricing/bank/UPI change"""
+    return {"success": True, "etags": static_responses.refresh()}
+
+@router.get("/screenshots")
+async def get_screenshot_stats():
+    """Get screenshot upload, dedup and thumbnail counters"""
+    return screenshot_store.stats()
+
+@router.get("/gateway-simulator")
+async def get_gateway_simulator_stats():
+    """Get simulated gateway call, fault and webhook delivery counters"""
+    return gateway_simulators.stats()
+
+@router.get("/write-behind")
+async def get_write_behind_stats():
+    """Get write-behind buffer depth and batch counters"""
+    return write_behind.stats()
+
+@router.get("/expiry-sweeper")
+async def get_expiry_sweeper_stats():
+    """Get expiry sweeper settings, counters and the last sweep report"""
+    return expiry_sweeper.stats()
+
+@router.post("/expiry-sweeper/run")
+async def run_expiry_sweep(db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Run one expiry sweep now (paced like the scheduled ones)"""
+    if expiry_sweeper.running:
+        raise HTTPException(status_code=409, detail="An expiry sweep is already running")
+    report = await expiry_sweeper.sweep(db)
+    if report is None:
+        raise HTTPException(status_code=409, detail="Another worker is running the expiry sweep")
+    return report
+
+@router.get("/idempotency")
+async def get_idempotency_stats():
+    """Get Idempotency-Key replay, coalescing and conflict counters"""
+    return idempotency_store.stats()
+
+@router.get("/rate-limits")
+async def get_rate_limit_stats():
+    """Get rate-limiter and admission-control decisions for this worker"""
+    return {"rate_limiter": rate_limiter.stats(), "admission": admission_gate.stats()}
+
+@router.get("/entitlements")
+async def get_entitlement_stats():
+    """Get plan-cache hit/miss counters and grants made by this worker"""
+    return entitlements.stats()
+
+@router.post("/entitlements/{user_email}/rebuild")
+async def rebuild_entitlement(user_email: str, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Recompute a user's plan from their paid transactions and verified manual payments"""
+    try:
+        return await entitlements.rebuild(db, user_email)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/usage")
+async def get_usage_stats():
+    """Get usage-metering counters: pending users, flushes and quota rejections (this worker)"""
+    return usage_meter.stats()
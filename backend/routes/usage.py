@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import ORJSONResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Optional
+import logging
+from database import get_db
+from models.usage import UsageMeterRequest
+from services.entitlements import entitlements, normalize_email
+from services import usage_metering
+from services.usage_metering import usage_meter
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/usage", tags=["usage"])
+
+def require_service_token(x_service_token: Optional[str] = Header(None)):
+    """Metering writes come from the tool backends, never from browsers"""
+    if not usage_metering.USAGE_SERVICE_TOKEN:
+        raise HTTPException(status_code=403, detail="Usage metering endpoint is disabled (USAGE_SERVICE_TOKEN not set)")
+    if not usage_metering.service_token_valid(x_service_token):
+        raise HTTPException(status_code=401, detail="Invalid service token")
+
+@router.post("/{user_email}/meter", dependencies=[Depends(require_service_token)])
+async def meter_usage(user_email: str, request: UsageMeterRequest, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Count words/tokens for one tool run against the monthly quota (402 when over it)"""
+    if request.text is None and request.words is None:
+        raise HTTPException(status_code=400, detail="Send the text or its word count")
+    return ORJSONResponse(await usage_meter.meter(
+        db, user_email, request.tool, text=request.text, words=request.words, tokens=request.tokens
+    ))
+
+@router.get("/{user_email}")
+async def get_usage(user_email: str, month: Optional[str] = None, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Get month-to-date words, tokens and requests per tool, with the plan's word quota"""
+    # TODO: Add authentication/authorization
+    email = normalize_email(user_email)
+    if email is None:
+        raise HTTPException(status_code=400, detail="A user email is required")
+    usage = await usage_meter.usage(db, email, month)
+    plan = await entitlements.lookup(db, email)
+    limit = plan["limits"].get("words_per_month")
+    return ORJSONResponse({
+        **usage,
+        "plan": plan["plan"],
+        "limit": limit,
+        "remaining": None if limit is None else max(limit - usage["words"], 0),
+    })
@@ -1,13 +1,18 @@
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from contextlib import asynccontextmanager
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List
+from typing import List, Optional
 import uuid
+import asyncio
+import orjson
+import time
 from datetime import datetime, timezone
 import sys
 
@@ -17,15 +22,38 @@ sys.path.insert(0, str(Path(__file__).parent))
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection (single shared pool, opened/closed by the app lifespan)
+import database
+import indexes
+import migrations
+from database import get_db
+from routes.admin import router as admin_router
+from services import metrics
+from services import pagination
 
 # Import payment routes after environment is loaded
 try:
     from routes.payments import router as payments_router
     from routes.manual_payments import router as manual_payments_router
+    from routes.analytics import router as analytics_router
+    from routes.entitlements import router as entitlements_router
+    from routes.usage import router as usage_router
+    from routes.payments_admin import router as payments_admin_router
+    from services import razorpay_gateway as razorpay_sdk
+    from services import stripe_gateway as stripe_sdk
+    from services.razorpay_gateway import razorpay_gateway
+    from services.stripe_gateway import stripe_gateway
+    from services.status_cache import stripe_status_cache
+    from services.rate_limit import rate_limiter
+    from services import payment_events
+    from services.webhook_ingest import webhook_ingestor
+    from services.screenshot_storage import screenshot_store
+    from services import gateway_simulators
+    from services.write_behind import write_behind
+    from services.revenue_rollups import revenue_rollups
+    from services import expiry_sweeper
+    from services.entitlements import entitlements
+    from services import usage_metering
     PAYMENTS_ENABLED = True
 except Exception as e:
     logger = logging.getLogger(__name__)
@@ -33,9 +61,72 @@ except Exception as e:
     PAYMENTS_ENABLED = False
     payments_router = None
     manual_payments_router = None
+    analytics_router = None
+    entitlements_router = None
+    usage_router = None
+    payments_admin_router = None
+
+# Gateway SDKs are not imported at boot: "background" loads them on a thread once the
+# worker is up, "startup" before it serves, "off" on the first payment that needs them
+GATEWAY_SDK_PRELOAD = os.environ.get('GATEWAY_SDK_PRELOAD', 'background').lower()
+
+def preload_gateway_sdks():
+    """Import the Stripe and Razorpay SDK stacks (blocking)"""
+    started = time.perf_counter()
+    try:
+        stripe_sdk.preload_sdks()
+        razorpay_sdk.preload_sdks()
+    except ImportError as e:
+        logger.error(f"Gateway SDK preload failed: {e}")
+        return
+    logger.info(f"Gateway SDKs loaded in {time.perf_counter() - started:.2f}s")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db = database.connect()
+    if indexes.MONGO_AUTO_INDEXES:
+        await indexes.ensure_indexes(db)
+    background_tasks = []
+    if migrations.MONGO_AUTO_MIGRATE:
+        background_tasks.append(asyncio.create_task(migrations.run_migrations(db)))
+    if PAYMENTS_ENABLED:
+        background_tasks.append(asyncio.create_task(payment_events.watch_changes(db)))
+        webhook_ingestor.start(db)
+        write_behind.start()
+        revenue_rollups.start(db)
+        entitlements.start(db)
+        if usage_metering.USAGE_METERING_ENABLED:
+            usage_metering.usage_meter.start(db)
+        if expiry_sweeper.EXPIRY_SWEEP_ENABLED:
+            expiry_sweeper.expiry_sweeper.start(db)
+        if gateway_simulators.SIMULATED:
+            gateway_simulators.start(app)
+        elif GATEWAY_SDK_PRELOAD == "startup":
+            preload_gateway_sdks()
+        elif GATEWAY_SDK_PRELOAD == "background":
+            background_tasks.append(asyncio.create_task(asyncio.to_thread(preload_gateway_sdks)))
+    yield
+    if PAYMENTS_ENABLED:
+        await expiry_sweeper.expiry_sweeper.stop()
+        await gateway_simulators.stop()
+        await webhook_ingestor.stop()
+        await write_behind.stop()
+        await revenue_rollups.stop()
+        await usage_metering.usage_meter.stop()
+        await entitlements.stop()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    if PAYMENTS_ENABLED:
+        razorpay_gateway.shutdown()
+        stripe_gateway.close()
+        await stripe_status_cache.close()
+        await rate_limiter.close()
+        await screenshot_store.close()
+    database.close()
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -58,35 +149,88 @@ async def root():
     return {"message": "Hello World"}
 
 @api_router.post("/status", response_model=StatusCheck)
-async def create_status_check(input: StatusCheckCreate):
+async def create_status_check(input: StatusCheckCreate, db: AsyncIOMotorDatabase = Depends(get_db)):
     status_dict = input.model_dump()
     status_obj = StatusCheck(**status_dict)
     
-    # Convert to dict and serialize datetime to ISO string for MongoDB
-    doc = status_obj.model_dump()
-    doc['timestamp'] = doc['timestamp'].isoformat()
-    
-    _ = await db.status_checks.insert_one(doc)
+    # Stored as a BSON date so range filters and the timestamp index work
+    _ = await db.status_checks.insert_one(status_obj.model_dump())
     return status_obj
 
+STATUS_PAGE_SIZE = 1000
+STATUS_PROJECTION = {"_id": 0, "id": 1, "client_name": 1, "timestamp": 1}
+
+def _status_query(client_name: Optional[str], since: Optional[datetime], until: Optional[datetime], cursor: Optional[str] = None) -> dict:
+    base = {"client_name": client_name} if client_name else {}
+    try:
+        return pagination.keyset_query(base, "id", cursor, since, until, time_field="timestamp")
+    except pagination.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _as_utc(check: dict) -> dict:
+    # Rows written before the timestamp migration ran may still hold ISO strings
+    timestamp = check['timestamp']
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    check['timestamp'] = timestamp
+    return check
+
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    # Exclude MongoDB's _id field from the query results
-    status_checks = await db.status_checks.find({}, {"_id": 0}).to_list(1000)
+async def get_status_checks(
+    client_name: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = STATUS_PAGE_SIZE,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Status checks newest first; the next page's cursor is in the X-Next-Cursor header"""
+    limit = max(1, min(limit, STATUS_PAGE_SIZE))
+    query = _status_query(client_name, since, until, cursor)
+    rows = await db.status_checks.find(query, STATUS_PROJECTION).sort(
+        pagination.keyset_sort("id", time_field="timestamp")
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    checks, next_cursor = pagination.split_page([_as_utc(row) for row in rows], "id", limit, time_field="timestamp")
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return ORJSONResponse(checks, headers=headers)
+
+@api_router.get("/status/export")
+async def export_status_checks(
+    client_name: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Stream every matching status check as NDJSON (newest first, constant memory)"""
+    query = _status_query(client_name, since, until)
     
-    # Convert ISO string timestamps back to datetime objects
-    for check in status_checks:
-        if isinstance(check['timestamp'], str):
-            check['timestamp'] = datetime.fromisoformat(check['timestamp'])
+    async def rows():
+        cursor = db.status_checks.find(query, STATUS_PROJECTION).sort(
+            pagination.keyset_sort("id", time_field="timestamp")
+        ).batch_size(STATUS_PAGE_SIZE)
+        async for row in cursor:
+            yield orjson.dumps(_as_utc(row)) + b"\n"
     
-    return status_checks
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
 
 # Include the router in the main app
 app.include_router(api_router)
+app.include_router(admin_router)
 if PAYMENTS_ENABLED and payments_router:
     app.include_router(payments_router)
 if PAYMENTS_ENABLED and manual_payments_router:
     app.include_router(manual_payments_router)
+if PAYMENTS_ENABLED and analytics_router:
+    app.include_router(analytics_router)
+if PAYMENTS_ENABLED and payments_admin_router:
+    app.include_router(payments_admin_router)
+if PAYMENTS_ENABLED and entitlements_router:
+    app.include_router(entitlements_router)
+if PAYMENTS_ENABLED and usage_router and usage_metering.USAGE_METERING_ENABLED:
+    app.include_router(usage_router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -96,13 +240,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def get_metrics():
+        """Prometheus scrape endpoint (per worker process)"""
+        return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
-logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+logger = logging.getLogger(__name__)
\ No newline at end of file
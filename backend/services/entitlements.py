@@ -0,0 +1,385 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import os
+import re
+import time
+import logging
+
+from models.payment import PRICING_PACKAGES
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "entitlements"
+# How long one paid package keeps a plan active; paying again for the same plan stacks
+ENTITLEMENT_PERIOD_DAYS = float(os.environ.get('ENTITLEMENT_PERIOD_DAYS', '30'))
+ENTITLEMENT_CACHE_SIZE = int(os.environ.get('ENTITLEMENT_CACHE_SIZE', '50000'))
+# Upper bound on how stale another worker's cached plan can be when change streams are unavailable
+ENTITLEMENT_CACHE_TTL_SECONDS = float(os.environ.get('ENTITLEMENT_CACHE_TTL_SECONDS', '60'))
+# Users without an active paid plan
+FREE_WORDS_PER_MONTH = int(os.environ.get('FREE_WORDS_PER_MONTH', '2000'))
+# How often each worker finishes grants whose worker died before applying them
+ENTITLEMENT_RESUME_INTERVAL_SECONDS = float(os.environ.get('ENTITLEMENT_RESUME_INTERVAL_SECONDS', '300'))
+
+FREE_PLAN = {
+    "plan": "free",
+    "plan_name": "Free",
+    "limits": {"words_per_month": FREE_WORDS_PER_MONTH, "ai_tools": 1, "team_collaboration": False},
+}
+# Payment refs already applied to an entitlement, so a replayed transition does not extend it twice
+GRANT_HISTORY = 50
+GRANT_RETRIES = 5
+# Set in the same update that marks a payment paid/verified and cleared once its plan is granted,
+# so a grant lost with its worker is finished by resume_pending()
+PENDING_FIELD = "entitlement_pending"
+# Payment collections that grant plans: (collection, id field, granting status field and value)
+PAYMENT_SOURCES = {
+    "payment_transactions": ("id", "payment_status", "paid"),
+    "manual_payments": ("order_id", "status", "verified"),
+}
+LOOKUP_PROJECTION = {"plan": 1, "plan_name": 1, "limits": 1, "starts_at": 1, "expires_at": 1, "source": 1}
+
+entitlement_lookups = metrics.registry.counter(
+    "entitlement_lookups", "Plan lookups by cache result", ("result",)
+)
+entitlement_grants = metrics.registry.counter(
+    "entitlement_grants", "Plans granted from payment transitions", ("source", "outcome")
+)
+
+_MISS = object()
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    if not isinstance(email, str):
+        return None
+    email = email.strip().lower()
+    # Stripe checkouts without an email are recorded for "guest"
+    if not email or email == "guest":
+        return None
+    return email
+
+
+def _granted_fields(current: Optional[dict], package_id: str, source: str, source_id: str, at: datetime) -> dict:
+    """The plan after one more paid package_id: same active plan stacks, anything else starts over"""
+    package = PRICING_PACKAGES[package_id]
+    period = timedelta(days=ENTITLEMENT_PERIOD_DAYS)
+    if current and current.get("plan") == package_id and current.get("expires_at") and current["expires_at"] > at:
+        starts_at, expires_at = current["starts_at"], current["expires_at"] + period
+    else:
+        starts_at, expires_at = at, at + period
+    return {
+        "plan": package_id,
+        "plan_name": package["name"],
+        # Snapshot, so later changes to PRICING_PACKAGES do not alter plans already sold
+        "limits": dict(package.get("limits") or {}),
+        "status": "active",
+        "starts_at": starts_at,
+        "expires_at": expires_at,
+        "source": source,
+        "source_id": source_id,
+        "updated_at": datetime.utcnow(),
+    }
+
+
+class Entitlements:
+    """Plans bought by users, read through a bounded LRU/TTL cache.
+
+    Paid transactions and verified manual payments grant plans (see payment_events);
+    every transition drops the user's cached entry, so plan checks on hot paths
+    normally cost no database round trip. Grants run in the background; payments
+    still carrying PENDING_FIELD are granted again by resume_pending().
+    """
+
+    def __init__(self, cache_size: int = ENTITLEMENT_CACHE_SIZE, ttl_seconds: float = ENTITLEMENT_CACHE_TTL_SECONDS):
+        self.cache_size = cache_size
+        self.ttl_seconds = ttl_seconds
+        # email -> (entitlement doc or None, monotonic expiry)
+        self._cache: "OrderedDict[str, Tuple[Optional[dict], float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Bumped on every invalidation; a read that raced with one is not cached
+        self._invalidations = 0
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._resumer: Optional[asyncio.Task] = None
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0, "granted": 0, "grant_errors": 0, "skipped": 0, "resumed": 0}
+
+    # ---- cache ----
+
+    def _cached(self, email: str):
+        entry = self._cache.get(email)
+        if entry is None:
+            return _MISS
+        if entry[1] < time.monotonic():
+            self._cache.pop(email, None)
+            return _MISS
+        self._cache.move_to_end(email)
+        return entry[0]
+
+    def _remember(self, email: str, doc: Optional[dict]):
+        self._cache[email] = (doc, time.monotonic() + self.ttl_seconds)
+        self._cache.move_to_end(email)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def invalidate(self, email: Optional[str]):
+        email = normalize_email(email)
+        if email is None:
+            return
+        self._invalidations += 1
+        self.counters["invalidations"] += 1
+        self._cache.pop(email, None)
+
+    def invalidate_doc(self, doc: dict):
+        """Change-stream relay: an entitlement was written by another worker"""
+        self.invalidate(doc.get("_id"))
+
+    # ---- reads ----
+
+    @staticmethod
+    def view(email: str, doc: Optional[dict], now: Optional[datetime] = None) -> dict:
+        """Effective plan: the stored one while it is active, the free plan otherwise"""
+        now = now or datetime.utcnow()
+        if doc and doc.get("expires_at") and doc["expires_at"] > now:
+            return {
+                "user_email": email,
+                "plan": doc["plan"],
+                "plan_name": doc["plan_name"],
+                "limits": doc["limits"],
+                "active": True,
+                "starts_at": doc["starts_at"],
+                "expires_at": doc["expires_at"],
+                "source": doc.get("source"),
+            }
+        return {
+            "user_email": email,
+            **FREE_PLAN,
+            "active": False,
+            # When the last paid plan ran out, if there was one
+            "expired_at": doc.get("expires_at") if doc else None,
+        }
+
+    async def _load(self, db: AsyncIOMotorDatabase, email: str) -> Optional[dict]:
+        inflight = self._inflight.get(email)
+        if inflight is not None:
+            self.counters["coalesced"] += 1
+            entitlement_lookups.labels("coalesced").inc()
+            return await asyncio.shield(inflight)
+
+        self.counters["misses"] += 1
+        entitlement_lookups.labels("miss").inc()
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[email] = future
+        invalidations = self._invalidations
+        try:
+            doc = await db[COLLECTION].find_one({"_id": email}, LOOKUP_PROJECTION)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(email, None)
+        if invalidations == self._invalidations:
+            self._remember(email, doc)
+        future.set_result(doc)
+        return doc
+
+    async def lookup(self, db: AsyncIOMotorDatabase, email: Optional[str]) -> dict:
+        """Current plan, limits and expiry for a user (free plan when none is active)"""
+        email = normalize_email(email)
+        if email is None:
+            return self.view(email, None)
+        doc = self._cached(email)
+        if doc is _MISS:
+            doc = await self._load(db, email)
+        else:
+            self.counters["hits"] += 1
+            entitlement_lookups.labels("hit").inc()
+        return self.view(email, doc)
+
+    # ---- writes ----
+
+    async def grant(
+        self,
+        db: AsyncIOMotorDatabase,
+        email: Optional[str],
+        package_id: Optional[str],
+        source: str,
+        source_id: str,
+        at: Optional[datetime] = None,
+    ) -> Optional[dict]:
+        """Apply one paid package to the user's plan; applying the same payment again is a no-op"""
+        email = normalize_email(email)
+        if email is None or package_id not in PRICING_PACKAGES:
+            self.counters["skipped"] += 1
+            entitlement_grants.labels(source, "skipped").inc()
+            return None
+        grant_id = f"{source}:{source_id}"
+        collection = db[COLLECTION]
+        for _ in range(GRANT_RETRIES):
+            current = await collection.find_one({"_id": email})
+            if current and grant_id in current.get("grants", ()):
+                return current
+            fields = _granted_fields(current, package_id, source, source_id, at or datetime.utcnow())
+            try:
+                if current is None:
+                    doc = {"_id": email, "user_email": email, **fields, "grants": [grant_id], "version": 1, "created_at": fields["updated_at"]}
+                    await collection.insert_one(doc)
+                else:
+                    # Optimistic: another worker granting at the same time makes this retry on fresh state
+                    doc = await collection.find_one_and_update(
+                        {"_id": email, "version": current.get("version")},
+                        {
+                            "$set": fields,
+                            "$inc": {"version": 1},
+                            "$push": {"grants": {"$each": [grant_id], "$slice": -GRANT_HISTORY}},
+                        },
+                        return_document=ReturnDocument.AFTER
+                    )
+                    if doc is None:
+                        continue
+            except DuplicateKeyError:
+                continue
+            self.invalidate(email)
+            self.counters["granted"] += 1
+            entitlement_grants.labels(source, "granted").inc()
+            logger.info(f"Plan {package_id} active for {email} until {doc['expires_at'].isoformat()} ({grant_id})")
+            return doc
+        raise RuntimeError(f"Entitlement for {email} kept changing, {grant_id} not applied")
+
+    async def _grant_payment(self, db: AsyncIOMotorDatabase, collection: str, doc: dict) -> bool:
+        """Grant the plan one payment document pays for, then clear its pending marker"""
+        id_field = PAYMENT_SOURCES[collection][0]
+        source = "manual" if collection == "manual_payments" else doc.get("payment_gateway") or "unknown"
+        source_id = doc.get(id_field)
+        try:
+            await self.grant(db, doc.get("user_email"), doc.get("package_id"), source, source_id)
+            await db[collection].update_one({id_field: source_id}, {"$unset": {PENDING_FIELD: ""}})
+        except Exception as e:
+            # The payment keeps its marker, so the next resume_pending() pass tries again
+            self.counters["grant_errors"] += 1
+            entitlement_grants.labels(source, "error").inc()
+            logger.error(f"Could not grant {doc.get('package_id')} to {doc.get('user_email')} for {source}:{source_id}: {e}")
+            return False
+        return True
+
+    def _spawn(self, collection: str, doc: dict):
+        if self._db is None:
+            self.counters["skipped"] += 1
+            return
+        task = asyncio.create_task(self._grant_payment(self._db, collection, doc))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def transaction_updated(self, doc: dict):
+        self.invalidate(doc.get("user_email"))
+        if doc.get("payment_status") == "paid":
+            self._spawn("payment_transactions", doc)
+
+    def manual_payment_updated(self, doc: dict):
+        self.invalidate(doc.get("user_email"))
+        if doc.get("status") == "verified":
+            self._spawn("manual_payments", doc)
+
+    async def resume_pending(self, db: AsyncIOMotorDatabase) -> int:
+        """Grant every paid/verified payment still marked pending (its worker stopped before the grant)"""
+        resumed = 0
+        for collection, (_, status_field, status) in PAYMENT_SOURCES.items():
+            async for doc in db[collection].find({PENDING_FIELD: True, status_field: status}):
+                if await self._grant_payment(db, collection, doc):
+                    resumed += 1
+        self.counters["resumed"] += resumed
+        if resumed:
+            logger.info(f"Resumed {resumed} pending plan grants")
+        return resumed
+
+    async def _resume_loop(self, db: AsyncIOMotorDatabase):
+        # Grants are idempotent per payment, so workers resuming the same one at once is harmless
+        while True:
+            try:
+                await self.resume_pending(db)
+            except PyMongoError as e:
+                logger.warning(f"Resuming pending plan grants failed: {e}")
+            await asyncio.sleep(ENTITLEMENT_RESUME_INTERVAL_SECONDS)
+
+    async def rebuild(self, db: AsyncIOMotorDatabase, email: str) -> dict:
+        """Recompute a user's plan from every paid transaction and verified manual payment"""
+        email = normalize_email(email)
+        if email is None:
+            raise ValueError("A user email is required")
+        # Emails are stored as entered
+        matches_email = {"$regex": f"^{re.escape(email)}$", "$options": "i"}
+        payments: List[Tuple[datetime, str, str, str]] = []
+        async for row in db.payment_transactions.find(
+            {"user_email": matches_email, "payment_status": "paid"},
+            {"_id": 0, "id": 1, "package_id": 1, "payment_gateway": 1, "updated_at": 1, "created_at": 1}
+        ):
+            payments.append((row.get("updated_at") or row["created_at"], row.get("package_id"), row.get("payment_gateway") or "unknown", row["id"]))
+        async for row in db.manual_payments.find(
+            {"user_email": matches_email, "status": "verified"},
+            {"_id": 0, "order_id": 1, "package_id": 1, "verified_at": 1, "created_at": 1}
+        ):
+            payments.append((row.get("verified_at") or row["created_at"], row.get("package_id"), "manual", row["order_id"]))
+        payments.sort(key=lambda payment: payment[0])
+
+        doc = None
+        grants = []
+        for paid_at, package_id, source, source_id in payments:
+            if package_id not in PRICING_PACKAGES:
+                continue
+            doc = _granted_fields(doc, package_id, source, source_id, paid_at)
+            grants.append(f"{source}:{source_id}")
+
+        if doc is None:
+            await db[COLLECTION].delete_one({"_id": email})
+        else:
+            now = datetime.utcnow()
+            await db[COLLECTION].update_one(
+                {"_id": email},
+                {
+                    "$set": {**doc, "user_email": email, "grants": grants[-GRANT_HISTORY:], "updated_at": now},
+                    "$inc": {"version": 1},
+                    "$setOnInsert": {"created_at": now},
+                },
+                upsert=True
+            )
+        self.invalidate(email)
+        return {"payments": len(payments), "entitlement": self.view(email, doc)}
+
+    # ---- lifecycle ----
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._db = db
+        self._resumer = asyncio.create_task(self._resume_loop(db))
+
+    async def stop(self):
+        """Let grants already started finish"""
+        if self._resumer is not None:
+            self._resumer.cancel()
+            await asyncio.gather(self._resumer, return_exceptions=True)
+            self._resumer = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "cache_size": self.cache_size,
+            "ttl_seconds": self.ttl_seconds,
+            "period_days": ENTITLEMENT_PERIOD_DAYS,
+            "grants_in_progress": len(self._tasks),
+            **self.counters,
+        }
+
+
+entitlements = Entitlements()
+metrics.registry.gauge(
+    "entitlement_cache_entries", "Plans held in this process's entitlement cache"
+).set_function(lambda: len(entitlements._cache))
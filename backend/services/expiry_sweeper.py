@@ -0,0 +1,347 @@
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+import asyncio
+import os
+import random
+import socket
+import time
+import uuid
+import logging
+
+from services import metrics
+from services import payment_events
+from services.entitlements import PENDING_FIELD
+from services.status_cache import stripe_status_cache
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_SWEEP_ENABLED = os.environ.get('EXPIRY_SWEEP_ENABLED', 'true').lower() == 'true'
+# Pending rows older than this are expired (0 = never expire that collection)
+TRANSACTION_EXPIRY_HOURS = float(os.environ.get('TRANSACTION_EXPIRY_HOURS', '24'))
+MANUAL_PAYMENT_EXPIRY_HOURS = float(os.environ.get('MANUAL_PAYMENT_EXPIRY_HOURS', '720'))
+EXPIRY_SWEEP_INTERVAL_SECONDS = float(os.environ.get('EXPIRY_SWEEP_INTERVAL_SECONDS', '300'))
+EXPIRY_SWEEP_BATCH_SIZE = int(os.environ.get('EXPIRY_SWEEP_BATCH_SIZE', '200'))
+# Rows examined per second at most, so a large backlog drains slowly instead of competing with live traffic
+EXPIRY_SWEEP_MAX_PER_SECOND = float(os.environ.get('EXPIRY_SWEEP_MAX_PER_SECOND', '100'))
+# Ask the gateway before expiring a transaction (catches payments whose webhook never arrived)
+EXPIRY_SWEEP_RECONCILE = os.environ.get('EXPIRY_SWEEP_RECONCILE', 'true').lower() == 'true'
+EXPIRY_SWEEP_GATEWAY_CONCURRENCY = int(os.environ.get('EXPIRY_SWEEP_GATEWAY_CONCURRENCY', '2'))
+# Pause between batches while this worker is serving at least this many requests (0 = never pause)
+EXPIRY_SWEEP_BUSY_REQUESTS = int(os.environ.get('EXPIRY_SWEEP_BUSY_REQUESTS', '50'))
+# One worker sweeps at a time: it holds a lease document, renewed after every batch,
+# that another worker may take over once it is this old (e.g. its holder died)
+EXPIRY_SWEEP_LEASE_SECONDS = float(os.environ.get('EXPIRY_SWEEP_LEASE_SECONDS', '120'))
+LEASE_COLLECTION = "job_leases"
+LEASE_ID = "expiry_sweep"
+
+# A reconciler returns the gateway's view of a pending transaction:
+# "paid", "pending" (still payable, leave it) or anything else (safe to expire)
+Reconciler = Callable[[dict], Awaitable[str]]
+
+swept_rows = metrics.registry.counter(
+    "expiry_sweep_rows", "Stale pending rows handled by the expiry sweeper", ("collection", "outcome")
+)
+sweep_batch_duration = metrics.registry.histogram(
+    "expiry_sweep_batch_duration_seconds", "Expiry sweeper time per batch (excluding pacing)", ("collection", "outcome")
+)
+
+
+class _Target(NamedTuple):
+    status_field: str
+    # Statuses of a payment that was never completed
+    open_statuses: Tuple[str, ...]
+    # Second sort key; (status, created_at, key) is the index the sweep walks
+    key: str
+    hours: float
+    reconcile: bool
+
+
+TARGETS = {
+    # A Stripe status poll of an open checkout writes "unpaid"
+    "payment_transactions": _Target("payment_status", ("pending", "unpaid"), "id", TRANSACTION_EXPIRY_HOURS, True),
+    "manual_payments": _Target("status", ("pending",), "order_id", MANUAL_PAYMENT_EXPIRY_HOURS, False),
+}
+OPEN_TRANSACTION = {"$in": list(TARGETS["payment_transactions"].open_statuses)}
+
+
+class _LeaseLost(Exception):
+    """Another worker took over the sweep lease"""
+
+
+class ExpirySweeper:
+    """Expires abandoned pending payments in small, paced batches, one worker at a time"""
+
+    def __init__(
+        self,
+        interval: float = EXPIRY_SWEEP_INTERVAL_SECONDS,
+        batch_size: int = EXPIRY_SWEEP_BATCH_SIZE,
+        max_per_second: float = EXPIRY_SWEEP_MAX_PER_SECOND,
+        reconcile: bool = EXPIRY_SWEEP_RECONCILE,
+        gateway_concurrency: int = EXPIRY_SWEEP_GATEWAY_CONCURRENCY,
+        busy_requests: int = EXPIRY_SWEEP_BUSY_REQUESTS,
+        lease_seconds: float = EXPIRY_SWEEP_LEASE_SECONDS,
+    ):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_per_second = max_per_second
+        self.reconcile = reconcile
+        self.gateway_concurrency = gateway_concurrency
+        self.busy_requests = busy_requests
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._reconcilers: Dict[str, Reconciler] = {}
+        self._lock = asyncio.Lock()
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {
+            "sweeps": 0,
+            "examined": 0,
+            "expired": 0,
+            "reconciled_paid": 0,
+            "still_open": 0,
+            "gateway_errors": 0,
+            "busy_pauses": 0,
+            "lease_busy": 0,
+            "lease_lost": 0,
+            "errors": 0,
+        }
+        self.last_report: Dict = {}
+
+    def register(self, gateway: str, reconciler: Reconciler):
+        """Set the function that asks a gateway about a pending transaction"""
+        self._reconcilers[gateway] = reconciler
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def _sleep(self, seconds: float) -> bool:
+        """Sleep, waking early on stop; True when the sweeper is stopping"""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=max(seconds, 0))
+        except asyncio.TimeoutError:
+            pass
+        return self._stopping.is_set()
+
+    async def _pace(self, rows: int, elapsed: float) -> bool:
+        """Hold the examine rate under max_per_second and yield while the worker is busy"""
+        delay = rows / self.max_per_second - elapsed if self.max_per_second > 0 else 0
+        if await self._sleep(delay):
+            return True
+        while self.busy_requests and metrics.http_in_flight.get() >= self.busy_requests:
+            self.counters["busy_pauses"] += 1
+            if await self._sleep(1):
+                return True
+        return False
+
+    async def _acquire_lease(self, db: AsyncIOMotorDatabase) -> bool:
+        """Take or renew the sweep lease; False while another worker holds it"""
+        now = datetime.utcnow()
+        try:
+            lease = await db[LEASE_COLLECTION].find_one_and_update(
+                {"_id": LEASE_ID, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.lease_seconds), "renewed_at": now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # The lease exists, is held by someone else and has not run out
+            return False
+        return lease is not None and lease["owner"] == self.owner
+
+    async def _release_lease(self, db: AsyncIOMotorDatabase):
+        try:
+            await db[LEASE_COLLECTION].delete_one({"_id": LEASE_ID, "owner": self.owner})
+        except PyMongoError as e:
+            # It runs out on its own
+            logger.warning(f"Could not release the expiry sweep lease: {e}")
+
+    async def _gateway_status(self, doc: dict, semaphore: asyncio.Semaphore) -> str:
+        reconciler = self._reconcilers.get(doc.get("payment_gateway"))
+        if reconciler is None:
+            return "expired"
+        async with semaphore:
+            try:
+                return await reconciler(doc)
+            except Exception as e:
+                logger.warning(f"Expiry check of {doc.get('payment_gateway')} transaction {doc.get('id')} failed: {e}")
+                return "error"
+
+    async def _mark_paid(self, db: AsyncIOMotorDatabase, doc: dict) -> bool:
+        paid = await db.payment_transactions.find_one_and_update(
+            {"id": doc["id"], "payment_status": OPEN_TRANSACTION},
+            {"$set": {"payment_status": "paid", "status": "complete", "updated_at": datetime.utcnow(), PENDING_FIELD: True}},
+            return_document=ReturnDocument.AFTER
+        )
+        if doc.get("session_id"):
+            # Same as a webhook: pollers must not keep getting the cached "pending"
+            await stripe_status_cache.invalidate(doc["session_id"])
+        if paid:
+            payment_events.transaction_updated(paid)
+        return paid is not None
+
+    async def _expire(self, db: AsyncIOMotorDatabase, name: str, target: _Target, rows: List[dict]) -> int:
+        """Expire rows that are still pending; announces exactly the ones this call changed"""
+        if not rows:
+            return 0
+        now = datetime.utcnow()
+        fields = {target.status_field: "expired", "expired_at": now}
+        if name == "payment_transactions":
+            fields.update(status="expired", updated_at=now)
+        keys = [row[target.key] for row in rows]
+        result = await db[name].update_many(
+            {target.key: {"$in": keys}, target.status_field: {"$in": list(target.open_statuses)}},
+            {"$set": fields}
+        )
+        if result.modified_count == len(rows):
+            expired = [{**row, **fields} for row in rows]
+        else:
+            # Some rows changed under us (paid/reviewed meanwhile); expired_at marks ours
+            expired = await db[name].find(
+                {target.key: {"$in": keys}, "expired_at": now}, {"_id": 0}
+            ).to_list(len(keys))
+        announce = payment_events.transaction_updated if name == "payment_transactions" else payment_events.manual_payment_updated
+        for doc in expired:
+            if doc.get("session_id"):
+                await stripe_status_cache.invalidate(doc["session_id"])
+            announce(doc)
+        return len(expired)
+
+    async def _sweep_collection(self, db: AsyncIOMotorDatabase, name: str, target: _Target) -> Dict:
+        report = {"examined": 0, "expired": 0, "reconciled_paid": 0, "still_open": 0, "gateway_errors": 0}
+        cutoff = datetime.utcnow() - timedelta(hours=target.hours)
+        reconcile = self.reconcile and target.reconcile and bool(self._reconcilers)
+        semaphore = asyncio.Semaphore(max(self.gateway_concurrency, 1))
+        last = None
+        while not self._stopping.is_set():
+            started = time.perf_counter()
+            query = {target.status_field: {"$in": list(target.open_statuses)}, "created_at": {"$lt": cutoff}}
+            if last is not None:
+                # Keyset walk, so rows left pending (still open, gateway errors) are not re-read
+                query["$or"] = [
+                    {"created_at": {"$gt": last[0]}},
+                    {"created_at": last[0], target.key: {"$gt": last[1]}},
+                ]
+            with metrics.time_outcome(sweep_batch_duration, name):
+                rows = await db[name].find(query, {"_id": 0}).sort(
+                    [("created_at", 1), (target.key, 1)]
+                ).limit(self.batch_size).to_list(self.batch_size)
+                if not rows:
+                    break
+                last = (rows[-1]["created_at"], rows[-1][target.key])
+
+                outcomes = {"reconciled_paid": 0, "still_open": 0, "gateway_errors": 0}
+                to_expire = rows
+                if reconcile:
+                    statuses = await asyncio.gather(*(self._gateway_status(row, semaphore) for row in rows))
+                    to_expire = []
+                    for row, status in zip(rows, statuses):
+                        if status == "paid":
+                            if await self._mark_paid(db, row):
+                                outcomes["reconciled_paid"] += 1
+                        elif status == "pending":
+                            outcomes["still_open"] += 1
+                        elif status == "error":
+                            outcomes["gateway_errors"] += 1
+                        else:
+                            to_expire.append(row)
+                outcomes["expired"] = await self._expire(db, name, target, to_expire)
+
+            report["examined"] += len(rows)
+            for outcome, count in outcomes.items():
+                report[outcome] += count
+                if count:
+                    swept_rows.labels(name, outcome).inc(count)
+            if len(rows) < self.batch_size:
+                break
+            if await self._pace(len(rows), time.perf_counter() - started):
+                break
+            if not await self._acquire_lease(db):
+                raise _LeaseLost()
+        return report
+
+    async def sweep(self, db: AsyncIOMotorDatabase) -> Optional[Dict]:
+        """One pass over every target collection; returns what it did, or None when another worker is sweeping"""
+        async with self._lock:
+            if not await self._acquire_lease(db):
+                self.counters["lease_busy"] += 1
+                return None
+            started = time.perf_counter()
+            report = {"started_at": datetime.utcnow().isoformat(), "owner": self.owner, "collections": {}}
+            try:
+                for name, target in TARGETS.items():
+                    if target.hours <= 0:
+                        continue
+                    try:
+                        totals = await self._sweep_collection(db, name, target)
+                    except PyMongoError as e:
+                        self.counters["errors"] += 1
+                        logger.error(f"Expiry sweep of {name} failed: {e}")
+                        totals = {"error": str(e)}
+                    report["collections"][name] = totals
+                    for field, value in totals.items():
+                        if field in self.counters:
+                            self.counters[field] += value
+            except _LeaseLost:
+                # Stalled past the lease; the new holder picks up where the index walk left off
+                self.counters["lease_lost"] += 1
+                report["lease_lost"] = True
+                logger.warning("Expiry sweep lease taken over by another worker, stopping this sweep")
+            else:
+                await self._release_lease(db)
+            report["seconds"] = round(time.perf_counter() - started, 3)
+            self.counters["sweeps"] += 1
+            self.last_report = report
+            expired = sum(c.get("expired", 0) for c in report["collections"].values())
+            if expired:
+                logger.info(f"Expiry sweep expired {expired} stale pending payments: {report['collections']}")
+            return report
+
+    async def _run(self, db: AsyncIOMotorDatabase):
+        # Workers start together; spread their sweeps out
+        if await self._sleep(random.uniform(0, self.interval)):
+            return
+        while True:
+            try:
+                await self.sweep(db)
+            except Exception as e:
+                self.counters["errors"] += 1
+                logger.error(f"Expiry sweep error: {e}")
+            if await self._sleep(self.interval):
+                return
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self):
+        """Finish the current batch, then stop"""
+        self._stopping.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": EXPIRY_SWEEP_ENABLED,
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "batch_size": self.batch_size,
+            "max_per_second": self.max_per_second,
+            "reconcile": self.reconcile,
+            "reconcilers": sorted(self._reconcilers),
+            "lease_seconds": self.lease_seconds,
+            "owner": self.owner,
+            "expiry_hours": {name: target.hours for name, target in TARGETS.items()},
+            **self.counters,
+            "last_sweep": self.last_report,
+        }
+
+
+expiry_sweeper = ExpirySweeper()
+metrics.registry.gauge(
+    "expiry_sweep_running", "1 while an expiry sweep is in progress in this process"
+).set_function(lambda: 1 if expiry_sweeper.running else 0)
@@ -0,0 +1,395 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import hmac
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# "live" talks to Stripe/Razorpay; "simulated" swaps in the local simulators below
+PAYMENT_GATEWAY_MODE = os.environ.get('PAYMENT_GATEWAY_MODE', 'live').lower()
+SIMULATED = PAYMENT_GATEWAY_MODE == 'simulated'
+
+# Latency specs: fixed:MS | uniform:MIN,MAX | exponential:MEAN | lognormal:MEDIAN,P99 (milliseconds)
+GATEWAY_SIM_LATENCY = os.environ.get('GATEWAY_SIM_LATENCY', 'lognormal:120,800')
+GATEWAY_SIM_ERROR_RATE = float(os.environ.get('GATEWAY_SIM_ERROR_RATE', '0'))
+# Calls that hang (to exercise our timeouts) and for how long
+GATEWAY_SIM_HANG_RATE = float(os.environ.get('GATEWAY_SIM_HANG_RATE', '0'))
+GATEWAY_SIM_HANG_SECONDS = float(os.environ.get('GATEWAY_SIM_HANG_SECONDS', '60'))
+# Simulated customers: share of checkouts/orders that get paid, and when
+GATEWAY_SIM_PAY_RATE = float(os.environ.get('GATEWAY_SIM_PAY_RATE', '0.9'))
+GATEWAY_SIM_PAY_AFTER = os.environ.get('GATEWAY_SIM_PAY_AFTER', 'uniform:2000,8000')
+# Webhook delivery behaviour
+GATEWAY_SIM_WEBHOOK_LATENCY = os.environ.get('GATEWAY_SIM_WEBHOOK_LATENCY', 'uniform:50,500')
+GATEWAY_SIM_WEBHOOK_DUPLICATE_RATE = float(os.environ.get('GATEWAY_SIM_WEBHOOK_DUPLICATE_RATE', '0.1'))
+GATEWAY_SIM_WEBHOOK_REORDER_RATE = float(os.environ.get('GATEWAY_SIM_WEBHOOK_REORDER_RATE', '0.2'))
+GATEWAY_SIM_WEBHOOK_MAX_ATTEMPTS = 4
+GATEWAY_SIM_SEED = os.environ.get('GATEWAY_SIM_SEED')
+
+STRIPE_SIM_WEBHOOK_SECRET = "whsec_simulated"
+STRIPE_WEBHOOK_PATH = "/api/payments/stripe/webhook"
+RAZORPAY_SIM_KEY_ID = "rzp_test_simulated"
+RAZORPAY_SIM_KEY_SECRET = "simulated_key_secret"
+RAZORPAY_SIM_WEBHOOK_SECRET = "simulated_webhook_secret"
+RAZORPAY_WEBHOOK_PATH = "/api/payments/razorpay/webhook"
+MAX_TRACKED_PAYMENTS = 100_000
+
+
+class SimulatedGatewayError(Exception):
+    """Injected gateway failure (stands in for 5xx / connection errors)"""
+
+
+class LatencyModel:
+    """Samples delays (seconds) from a distribution given as a spec string"""
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        values = [float(v) / 1000 for v in args.split(",") if v.strip()]
+        self.kind = kind.strip().lower()
+        if self.kind == "fixed" and len(values) == 1:
+            self._sample = lambda rng: values[0]
+        elif self.kind == "uniform" and len(values) == 2:
+            self._sample = lambda rng: rng.uniform(values[0], values[1])
+        elif self.kind == "exponential" and len(values) == 1:
+            self._sample = lambda rng: rng.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+        elif self.kind == "lognormal" and len(values) == 2:
+            # Parameterised by median and p99, which is how gateway latency is usually quoted
+            median, p99 = values
+            mu = math.log(median)
+            sigma = max(math.log(p99 / median) / 2.326, 1e-6)
+            self._sample = lambda rng: rng.lognormvariate(mu, sigma)
+        else:
+            raise ValueError(f"Invalid latency spec {spec!r}")
+
+    def sample(self, rng: random.Random) -> float:
+        return self._sample(rng)
+
+
+class _Behaviour:
+    """Latency and fault injection shared by the gateway simulators"""
+
+    def __init__(self, latency: str, error_rate: float, hang_rate: float, seed: Optional[str]):
+        self.latency = LatencyModel(latency)
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()  # Razorpay calls run on executor threads
+        self.counters = {"calls": 0, "errors": 0, "hangs": 0}
+
+    def _draw(self) -> Tuple[float, str]:
+        with self._lock:
+            self.counters["calls"] += 1
+            roll = self.rng.random()
+            if roll < self.hang_rate:
+                self.counters["hangs"] += 1
+                return GATEWAY_SIM_HANG_SECONDS, "ok"
+            delay = self.latency.sample(self.rng)
+            if roll < self.hang_rate + self.error_rate:
+                self.counters["errors"] += 1
+                return delay, "error"
+            return delay, "ok"
+
+    async def async_call(self, operation: str):
+        delay, outcome = self._draw()
+        await asyncio.sleep(delay)
+        if outcome == "error":
+            raise SimulatedGatewayError(f"Simulated {operation} failure")
+
+    def blocking_call(self, operation: str):
+        delay, outcome = self._draw()
+        time.sleep(delay)
+        if outcome == "error":
+            raise SimulatedGatewayError(f"Simulated {operation} failure")
+
+
+def _hmac_hex(secret: str, message: bytes) -> str:
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def stripe_signature_header(body: bytes, secret: str = STRIPE_SIM_WEBHOOK_SECRET, timestamp: Optional[int] = None) -> str:
+    """Stripe-Signature header value ("t=...,v1=...") for a webhook body"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    return f"t={timestamp},v1={_hmac_hex(secret, f'{timestamp}.'.encode() + body)}"
+
+
+def razorpay_signature(body: bytes, secret: str = RAZORPAY_SIM_WEBHOOK_SECRET) -> str:
+    return _hmac_hex(secret, body)
+
+
+class WebhookDispatcher:
+    """Delivers simulated gateway webhooks into the app, the way gateways do:
+    late, sometimes twice, sometimes out of order, retried on non-2xx"""
+
+    def __init__(self, latency: str = GATEWAY_SIM_WEBHOOK_LATENCY,
+                 duplicate_rate: float = GATEWAY_SIM_WEBHOOK_DUPLICATE_RATE,
+                 reorder_rate: float = GATEWAY_SIM_WEBHOOK_REORDER_RATE,
+                 seed: Optional[str] = GATEWAY_SIM_SEED):
+        self.latency = LatencyModel(latency)
+        self.duplicate_rate = duplicate_rate
+        self.reorder_rate = reorder_rate
+        self.rng = random.Random(seed)
+        self._client = None
+        self._tasks = set()
+        self.counters = {"scheduled": 0, "delivered": 0, "duplicates": 0, "reordered": 0, "retries": 0, "dropped": 0}
+
+    def attach(self, app):
+        """Deliver to this ASGI app in-process (called from the app lifespan)"""
+        import httpx
+        self._client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://gateway-simulator", timeout=30
+        )
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def send(self, path: str, deliveries: List[Tuple[bytes, Dict[str, str]]], start_after: float = 0.0):
+        """Schedule one payment's webhook sequence (in the order the gateway emitted it)"""
+        deliveries = list(deliveries)
+        if len(deliveries) > 1 and self.rng.random() < self.reorder_rate:
+            deliveries.reverse()
+            self.counters["reordered"] += 1
+        delay = start_after
+        for body, headers in deliveries:
+            delay += self.latency.sample(self.rng)
+            self._schedule(path, body, headers, delay)
+            if self.rng.random() < self.duplicate_rate:
+                self.counters["duplicates"] += 1
+                self._schedule(path, body, headers, delay + self.latency.sample(self.rng) * 4)
+
+    def _schedule(self, path: str, body: bytes, headers: Dict[str, str], delay: float):
+        self.counters["scheduled"] += 1
+        task = asyncio.get_running_loop().create_task(self._deliver(path, body, headers, delay))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, path: str, body: bytes, headers: Dict[str, str], delay: float):
+        await asyncio.sleep(delay)
+        for attempt in range(GATEWAY_SIM_WEBHOOK_MAX_ATTEMPTS):
+            if self._client is None:
+                self.counters["dropped"] += 1
+                return
+            try:
+                response = await self._client.post(path, content=body, headers=headers)
+                if response.status_code < 300:
+                    self.counters["delivered"] += 1
+                    return
+            except Exception as e:
+                logger.debug(f"Simulated webhook to {path} failed: {e}")
+            self.counters["retries"] += 1
+            await asyncio.sleep(2 ** attempt)
+        self.counters["dropped"] += 1
+
+
+@dataclass
+class CheckoutSessionRequest:
+    """Offline stand-in for emergentintegrations' CheckoutSessionRequest (same fields)"""
+    amount: float
+    currency: str
+    success_url: str
+    cancel_url: str
+    metadata: Optional[Dict[str, str]] = None
+
+
+class SimulatedStripeCheckout:
+    """Offline stand-in for emergentintegrations' StripeCheckout"""
+
+    def __init__(self, behaviour: _Behaviour, dispatcher: WebhookDispatcher,
+                 pay_rate: float = GATEWAY_SIM_PAY_RATE, pay_after: str = GATEWAY_SIM_PAY_AFTER,
+                 webhook_secret: str = STRIPE_SIM_WEBHOOK_SECRET):
+        self.behaviour = behaviour
+        self.dispatcher = dispatcher
+        self.pay_rate = pay_rate
+        self.pay_after = LatencyModel(pay_after)
+        self.webhook_secret = webhook_secret
+        self._sessions: "OrderedDict[str, dict]" = OrderedDict()
+
+    async def create_checkout_session(self, request):
+        await self.behaviour.async_call("create_checkout_session")
+        session_id = f"cs_sim_{uuid.uuid4().hex}"
+        amount_total = int(round(request.amount * 100))
+        session = {"status": "open", "payment_status": "unpaid", "amount_total": amount_total,
+                   "currency": request.currency, "metadata": request.metadata or {}}
+        self._sessions[session_id] = session
+        if len(self._sessions) > MAX_TRACKED_PAYMENTS:
+            self._sessions.popitem(last=False)
+
+        if self.behaviour.rng.random() < self.pay_rate:
+            pay_after = self.pay_after.sample(self.behaviour.rng)
+            asyncio.get_running_loop().call_later(pay_after, self._complete, session_id)
+            self.dispatcher.send(STRIPE_WEBHOOK_PATH, [
+                self._event(session_id, "checkout.session.completed", "paid"),
+                self._event(session_id, "payment_intent.succeeded", "paid"),
+            ], start_after=pay_after)
+        return SimpleNamespace(session_id=session_id, url=f"https://checkout.stripe.test/c/pay/{session_id}")
+
+    def _complete(self, session_id: str):
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.update(status="complete", payment_status="paid")
+
+    def _event(self, session_id: str, event_type: str, payment_status: str) -> Tuple[bytes, Dict[str, str]]:
+        body = json.dumps({
+            "id": f"evt_sim_{uuid.uuid4().hex}",
+            "type": event_type,
+            "data": {"object": {"id": session_id, "payment_status": payment_status}},
+        }).encode()
+        return body, {"Stripe-Signature": stripe_signature_header(body, self.webhook_secret),
+                      "Content-Type": "application/json"}
+
+    async def get_checkout_status(self, session_id: str):
+        await self.behaviour.async_call("get_checkout_status")
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise SimulatedGatewayError(f"No such checkout session: {session_id}")
+        return SimpleNamespace(**session)
+
+    async def handle_webhook(self, payload: bytes, signature: Optional[str]):
+        parts = dict(p.split("=", 1) for p in (signature or "").split(",") if "=" in p)
+        expected = _hmac_hex(self.webhook_secret, f"{parts.get('t', '')}.".encode() + payload)
+        if not hmac.compare_digest(expected, parts.get("v1", "")):
+            raise ValueError("Invalid Stripe webhook signature")
+        event = json.loads(payload)
+        obj = event["data"]["object"]
+        return SimpleNamespace(
+            event_id=event["id"],
+            event_type=event["type"],
+            session_id=obj["id"],
+            payment_status=obj.get("payment_status", "unpaid"),
+            metadata=obj.get("metadata", {}),
+        )
+
+
+class _SimulatedOrders:
+    def __init__(self, owner: "SimulatedRazorpayClient"):
+        self._owner = owner
+        self._orders: "OrderedDict[str, dict]" = OrderedDict()
+
+    def create(self, data=None, **kwargs):
+        self._owner.behaviour.blocking_call("order.create")
+        order = {
+            "id": f"order_sim{uuid.uuid4().hex[:11]}",
+            "entity": "order",
+            "amount": data["amount"],
+            "currency": data.get("currency", "INR"),
+            "status": "created",
+            "notes": data.get("notes", {}),
+        }
+        with self._owner.behaviour._lock:
+            self._orders[order["id"]] = order
+            if len(self._orders) > MAX_TRACKED_PAYMENTS:
+                self._orders.popitem(last=False)
+        self._owner.order_created(order)
+        return order
+
+    def fetch(self, order_id, data=None, **kwargs):
+        self._owner.behaviour.blocking_call("order.fetch")
+        with self._owner.behaviour._lock:
+            order = self._orders.get(order_id)
+        if order is None:
+            raise SimulatedGatewayError(f"No such order: {order_id}")
+        return dict(order)
+
+    def mark_paid(self, order_id: str):
+        with self._owner.behaviour._lock:
+            order = self._orders.get(order_id)
+            if order is not None:
+                order["status"] = "paid"
+
+
+class SimulatedRazorpayClient:
+    """Offline stand-in for razorpay.Client (blocking, like the SDK)"""
+
+    def __init__(self, behaviour: _Behaviour, dispatcher: WebhookDispatcher,
+                 pay_rate: float = GATEWAY_SIM_PAY_RATE, pay_after: str = GATEWAY_SIM_PAY_AFTER,
+                 webhook_secret: str = RAZORPAY_SIM_WEBHOOK_SECRET):
+        self.behaviour = behaviour
+        self.dispatcher = dispatcher
+        self.pay_rate = pay_rate
+        self.pay_after = LatencyModel(pay_after)
+        self.webhook_secret = webhook_secret
+        self.order = _SimulatedOrders(self)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """Webhooks are scheduled on the app's loop; order.create runs on executor threads"""
+        self._loop = loop
+
+    def order_created(self, order: dict):
+        if self._loop is None:
+            return
+        with self.behaviour._lock:
+            paid = self.behaviour.rng.random() < self.pay_rate
+            pay_after = self.pay_after.sample(self.behaviour.rng)
+        if paid:
+            self._loop.call_soon_threadsafe(self._schedule_payment, order, pay_after)
+
+    def _schedule_payment(self, order: dict, pay_after: float):
+        payment_id = f"pay_sim{uuid.uuid4().hex[:11]}"
+        self._loop.call_later(pay_after, self.order.mark_paid, order["id"])
+        self.dispatcher.send(RAZORPAY_WEBHOOK_PATH, [
+            self._event("payment.authorized", order, payment_id, "authorized"),
+            self._event("payment.captured", order, payment_id, "captured"),
+        ], start_after=pay_after)
+
+    def _event(self, event: str, order: dict, payment_id: str, status: str) -> Tuple[bytes, Dict[str, str]]:
+        body = json.dumps({
+            "entity": "event",
+            "event": event,
+            "payload": {"payment": {"entity": {
+                "id": payment_id, "order_id": order["id"], "amount": order["amount"],
+                "currency": order["currency"], "status": status,
+            }}},
+        }).encode()
+        return body, {
+            "X-Razorpay-Signature": razorpay_signature(body, self.webhook_secret),
+            "X-Razorpay-Event-Id": f"evt_sim{uuid.uuid4().hex[:11]}",
+            "Content-Type": "application/json",
+        }
+
+
+behaviour = _Behaviour(GATEWAY_SIM_LATENCY, GATEWAY_SIM_ERROR_RATE, GATEWAY_SIM_HANG_RATE, GATEWAY_SIM_SEED)
+webhooks = WebhookDispatcher()
+stripe_checkout = SimulatedStripeCheckout(behaviour, webhooks)
+razorpay_client = SimulatedRazorpayClient(behaviour, webhooks)
+
+
+def start(app):
+    """Hook the simulators up to the running app (lifespan startup)"""
+    webhooks.attach(app)
+    razorpay_client.bind_loop(asyncio.get_running_loop())
+    logger.warning(
+        f"Payment gateways are SIMULATED (latency={behaviour.latency.spec}, "
+        f"error_rate={behaviour.error_rate}, hang_rate={behaviour.hang_rate})"
+    )
+
+
+async def stop():
+    await webhooks.close()
+
+
+def stats() -> Dict:
+    return {
+        "mode": PAYMENT_GATEWAY_MODE,
+        "latency": behaviour.latency.spec,
+        "error_rate": behaviour.error_rate,
+        "hang_rate": behaviour.hang_rate,
+        "calls": dict(behaviour.counters),
+        "webhooks": dict(webhooks.counters),
+        "webhooks_pending": len(webhooks._tasks),
+    }
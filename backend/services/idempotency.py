@@ -0,0 +1,278 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import orjson
+import os
+import time
+import logging
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# How long a stored response is replayed for
+IDEMPOTENCY_TTL_HOURS = float(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
+# Completed responses kept in-process in front of MongoDB
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '10000'))
+# A claim older than this belongs to a request that died mid-way and may be taken over
+IDEMPOTENCY_LOCK_SECONDS = float(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', '60'))
+# How long a duplicate waits for another worker's in-progress request before getting a 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', '5'))
+
+COLLECTION = "idempotency_keys"
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+POLL_SECONDS = 0.1
+
+# (status code, body): a handler's return value, or the detail of a 4xx it raised
+Outcome = Tuple[int, object]
+
+idempotent_requests = metrics.registry.counter(
+    "idempotent_requests", "Requests carrying an Idempotency-Key, by route and outcome", ("route", "outcome")
+)
+
+
+def body_hash(body: dict) -> str:
+    return hashlib.sha256(orjson.dumps(body, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+class IdempotencyStore:
+    """First-response-wins store for Idempotency-Key requests"""
+
+    def __init__(
+        self,
+        ttl_hours: float = IDEMPOTENCY_TTL_HOURS,
+        cache_size: int = IDEMPOTENCY_CACHE_SIZE,
+        lock_seconds: float = IDEMPOTENCY_LOCK_SECONDS,
+        wait_seconds: float = IDEMPOTENCY_WAIT_SECONDS,
+    ):
+        self.ttl = timedelta(hours=ttl_hours)
+        self.cache_size = cache_size
+        self.lock = timedelta(seconds=lock_seconds)
+        self.wait_seconds = wait_seconds
+        # record id -> (body hash, outcome, monotonic expiry)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        # record id -> future (body hash, outcome) for requests running in this process;
+        # the hash is the one the outcome was stored under, which duplicates are checked against
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.counters = {"executed": 0, "replayed": 0, "coalesced": 0, "conflicts": 0, "mismatches": 0}
+
+    @staticmethod
+    def record_id(route: str, key: str) -> str:
+        return f"{route}:{key}"
+
+    def _cached(self, record_id: str) -> Optional[tuple]:
+        entry = self._cache.get(record_id)
+        if entry is None:
+            return None
+        if entry[2] < time.monotonic():
+            self._cache.pop(record_id, None)
+            return None
+        self._cache.move_to_end(record_id)
+        return entry
+
+    def _remember(self, record_id: str, hashed: str, outcome: Outcome):
+        self._cache[record_id] = (hashed, outcome, time.monotonic() + self.ttl.total_seconds())
+        self._cache.move_to_end(record_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _count(self, route: str, outcome: str, counter: str):
+        self.counters[counter] += 1
+        idempotent_requests.labels(route, outcome).inc()
+
+    def _check_body(self, route: str, stored_hash: str, hashed: str):
+        if stored_hash != hashed:
+            self._count(route, "mismatch", "mismatches")
+            raise HTTPException(
+                status_code=422,
+                detail=f"{HEADER} was already used with a different request body"
+            )
+
+    @staticmethod
+    def _respond(outcome: Outcome, replayed: bool):
+        status_code, body = outcome
+        if status_code >= 400:
+            raise HTTPException(status_code=status_code, detail=body)
+        if not replayed:
+            return body
+        return ORJSONResponse(body, status_code=status_code, headers={REPLAYED_HEADER: "true"})
+
+    @staticmethod
+    async def _join(future: asyncio.Future) -> Optional[Tuple[str, Outcome]]:
+        """Wait for the in-process request holding a key; None when it failed for reasons of its own"""
+        try:
+            return await asyncio.shield(future)
+        except HTTPException as e:
+            # A 409 is about the key (another worker still holds it) and applies to every duplicate;
+            # anything else (a 422 for the first request's body, a 5xx that released the key) does not
+            if e.status_code == 409:
+                raise
+            return None
+        except asyncio.CancelledError:
+            if future.cancelled():
+                return None
+            raise
+        except Exception:
+            return None
+
+    async def _claim(self, db: AsyncIOMotorDatabase, record_id: str, route: str, hashed: str) -> Optional[dict]:
+        """Claim the key for this request; returns the existing record if someone else holds it"""
+        now = datetime.utcnow()
+        try:
+            await db[COLLECTION].insert_one({
+                "_id": record_id,
+                "route": route,
+                "body_hash": hashed,
+                "state": "in_progress",
+                "created_at": now,
+                "locked_until": now + self.lock,
+                "expires_at": now + self.ttl,
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+
+        existing = await db[COLLECTION].find_one({"_id": record_id})
+        if existing is None:
+            # Expired between the insert and the read; try once more
+            return await self._claim(db, record_id, route, hashed)
+        if existing["state"] == "in_progress" and existing["locked_until"] < now:
+            taken = await db[COLLECTION].find_one_and_update(
+                {"_id": record_id, "state": "in_progress", "locked_until": existing["locked_until"]},
+                {"$set": {"body_hash": hashed, "locked_until": now + self.lock}}
+            )
+            if taken is not None:
+                logger.warning(f"Took over abandoned idempotency claim {record_id}")
+                return None
+            existing = await db[COLLECTION].find_one({"_id": record_id}) or existing
+        return existing
+
+    async def _wait_for(self, db: AsyncIOMotorDatabase, record_id: str) -> Optional[dict]:
+        """Poll another worker's in-progress request until it stores its response"""
+        deadline = time.monotonic() + self.wait_seconds
+        while time.monotonic() < deadline:
+            await asyncio.sleep(POLL_SECONDS)
+            record = await db[COLLECTION].find_one({"_id": record_id})
+            if record is None or record["state"] == "done":
+                return record
+        return None
+
+    async def _store(self, db: AsyncIOMotorDatabase, record_id: str, outcome: Outcome):
+        try:
+            await db[COLLECTION].update_one(
+                {"_id": record_id},
+                {"$set": {"state": "done", "status_code": outcome[0], "response": outcome[1]}}
+            )
+        except PyMongoError as e:
+            # The response still goes out; only cross-worker replay of it is lost
+            logger.error(f"Could not store idempotent response {record_id}: {e}")
+
+    async def _release(self, db: AsyncIOMotorDatabase, record_id: str):
+        try:
+            await db[COLLECTION].delete_one({"_id": record_id, "state": "in_progress"})
+        except PyMongoError as e:
+            logger.error(f"Could not release idempotency claim {record_id}: {e}")
+
+    async def run(
+        self,
+        db: AsyncIOMotorDatabase,
+        route: str,
+        key: Optional[str],
+        body: dict,
+        handler: Callable[[], Awaitable[object]],
+    ):
+        """Run `handler` once per (route, key); repeats get the first response back.
+
+        2xx responses and 4xx errors are stored and replayed; 5xx errors release
+        the key so the client can retry.
+        """
+        if not key:
+            return await handler()
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"{HEADER} must be at most {MAX_KEY_LENGTH} characters")
+
+        record_id = self.record_id(route, key)
+        hashed = body_hash(body)
+
+        cached = self._cached(record_id)
+        if cached is not None:
+            self._check_body(route, cached[0], hashed)
+            self._count(route, "replayed", "replayed")
+            return self._respond(cached[1], replayed=True)
+
+        inflight = self._inflight.get(record_id)
+        if inflight is not None:
+            shared = await self._join(inflight)
+            if shared is None:
+                # Nothing was stored for the key; this request goes through on its own
+                return await self.run(db, route, key, body, handler)
+            self._check_body(route, shared[0], hashed)
+            self._count(route, "coalesced", "coalesced")
+            return self._respond(shared[1], replayed=True)
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[record_id] = future
+        claimed = False
+        try:
+            existing = await self._claim(db, record_id, route, hashed)
+            if existing is not None and existing["state"] == "in_progress":
+                existing = await self._wait_for(db, record_id) or existing
+            if existing is not None and existing["state"] == "done":
+                outcome = (existing["status_code"], existing["response"])
+                self._remember(record_id, existing["body_hash"], outcome)
+                # Duplicates waiting on this request check their own body against the stored one
+                future.set_result((existing["body_hash"], outcome))
+                self._check_body(route, existing["body_hash"], hashed)
+                self._count(route, "replayed", "replayed")
+                return self._respond(outcome, replayed=True)
+            if existing is not None:
+                self._check_body(route, existing["body_hash"], hashed)
+                self._count(route, "conflict", "conflicts")
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"A request with this {HEADER} is still in progress, retry shortly"
+                )
+
+            claimed = True
+            self._count(route, "executed", "executed")
+            try:
+                outcome = (200, await handler())
+            except HTTPException as e:
+                if e.status_code >= 500:
+                    raise
+                outcome = (e.status_code, e.detail)
+            await self._store(db, record_id, outcome)
+            self._remember(record_id, hashed, outcome)
+            future.set_result((hashed, outcome))
+            return self._respond(outcome, replayed=False)
+        except BaseException as e:
+            if not future.done():
+                if claimed:
+                    await self._release(db, record_id)
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(record_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "ttl_hours": self.ttl.total_seconds() / 3600,
+            "cached": len(self._cache),
+            "inflight": len(self._inflight),
+            **self.counters,
+        }
+
+
+idempotency_store = IdempotencyStore()
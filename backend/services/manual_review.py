@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from typing import Dict, Iterable, List, Optional, Tuple
+import asyncio
+import uuid
+import logging
+
+from services import payment_events
+from services.entitlements import PENDING_FIELD
+from services.write_behind import write_behind
+from services.reconciliation import PendingIndex, Reconciler, iter_statement_rows
+
+logger = logging.getLogger(__name__)
+
+ACTION_STATUS = {"verify": "verified", "reject": "rejected"}
+# Expired rows stay reviewable: the money for one can still turn up after the sweeper gave up on it
+REVIEWABLE_STATUSES = ("pending", "expired")
+REVIEWABLE = {"$in": list(REVIEWABLE_STATUSES)}
+LOOKUP_CHUNK = 1000
+
+
+async def apply_reviews(
+    db: AsyncIOMotorDatabase,
+    items: Iterable[Tuple[str, str, Optional[str]]],
+    reviewed_by: str,
+) -> List[Dict]:
+    """Verify/reject many pending (or expired) manual payments with one bulk_write.
+
+    `items` are (order_id, action, reason). Returns one result per item:
+    verified / rejected / already_processed / not_found / duplicate_item.
+    """
+    await write_behind.flush("manual_payments")
+    batch_id = uuid.uuid4().hex
+    now = datetime.utcnow()
+    ordered: List[Tuple[str, str, Optional[str]]] = []
+    seen = set()
+    ops = []
+
+    for order_id, action, reason in items:
+        ordered.append((order_id, action, reason))
+        if order_id in seen:
+            continue
+        seen.add(order_id)
+
+        update = {
+            "status": ACTION_STATUS[action],
+            "verified_at": now,
+            "review_batch_id": batch_id,
+        }
+        if action == "verify":
+            update["verified_by"] = reviewed_by
+            update[PENDING_FIELD] = True
+        elif reason:
+            update["rejection_reason"] = reason
+        ops.append(UpdateOne({"order_id": order_id, "status": REVIEWABLE}, {"$set": update}))
+
+    if ops:
+        await db.manual_payments.bulk_write(ops, ordered=False)
+
+    # Our batch id tells which rows this call changed, even under concurrent reviews
+    docs = {}
+    order_ids = list(seen)
+    for start in range(0, len(order_ids), LOOKUP_CHUNK):
+        chunk = order_ids[start:start + LOOKUP_CHUNK]
+        async for doc in db.manual_payments.find({"order_id": {"$in": chunk}}):
+            docs[doc["order_id"]] = doc
+
+    results = []
+    reported = set()
+    for order_id, action, _ in ordered:
+        if order_id in reported:
+            results.append({"order_id": order_id, "result": "duplicate_item"})
+            continue
+        reported.add(order_id)
+
+        doc = docs.get(order_id)
+        if doc is None:
+            results.append({"order_id": order_id, "result": "not_found"})
+        elif doc.get("review_batch_id") == batch_id:
+            payment_events.manual_payment_updated(doc)
+            results.append({"order_id": order_id, "result": ACTION_STATUS[action]})
+        else:
+            results.append({"order_id": order_id, "result": "already_processed", "status": doc["status"]})
+
+    changed = sum(1 for r in results if r["result"] in ACTION_STATUS.values())
+    logger.info(f"Bulk review {batch_id} by {reviewed_by}: {changed}/{len(results)} updated")
+    return results
+
+
+async def verify_from_statement(
+    db: AsyncIOMotorDatabase,
+    raw,
+    reviewed_by: str,
+    amount_tolerance: float = 1.0,
+) -> Dict:
+    """Verify pending (or expired) payments whose transaction_id and amount appear in a statement"""
+    await write_behind.flush("manual_payments")
+    index = await PendingIndex.from_db(db, REVIEWABLE_STATUSES)
+    reconciler = Reconciler(index, timedelta(0), amount_tolerance, match_amount_date=False)
+    # Same streaming matcher as reconcile_statement, off the event loop
+    report = await asyncio.to_thread(
+        reconciler.run, (row for row in iter_statement_rows(raw) if row.transaction_id)
+    )
+
+    matched = [m["order_id"] for m in report["matches"]["transaction_id"]]
+    counts = report["counts"]
+    results = []
+    for start in range(0, len(matched), LOOKUP_CHUNK):
+        chunk = matched[start:start + LOOKUP_CHUNK]
+        results.extend(await apply_reviews(db, ((o, "verify", None) for o in chunk), reviewed_by))
+    return {
+        "statement_rows": report["statement_rows"],
+        "matched": len(matched),
+        # First SAMPLE_SIZE only; amount_mismatch_rows has the total
+        "amount_mismatch": [
+            {
+                "order_id": sample["order_id"],
+                "transaction_id": sample["transaction_id"],
+                "expected_amount": sample["expected_amount"],
+                "statement_amount": sample["statement_amount"],
+            }
+            for sample in report["samples"].get("amount_mismatch", [])
+        ],
+        "amount_mismatch_rows": counts.get("amount_mismatch", 0),
+        "unmatched_rows": counts.get("unmatched", 0) + counts.get("duplicate", 0),
+        "results": results,
+    }
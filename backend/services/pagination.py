@@ -0,0 +1,82 @@
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple, Type
+from pydantic import BaseModel
+import base64
+import json
+
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at: datetime, key: str) -> str:
+    """Opaque token for the last row of a page"""
+    raw = json.dumps([created_at.isoformat(), key]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[datetime, str]:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        created_at, key = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), key
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid pagination cursor") from e
+
+
+def keyset_query(
+    base: dict,
+    key_field: str,
+    cursor: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    time_field: str = "created_at",
+) -> dict:
+    """Filter for the page after `cursor` in (time_field, key_field) descending order"""
+    query = dict(base)
+    created = {}
+    if date_from:
+        created["$gte"] = date_from
+    if date_to:
+        created["$lt"] = date_to
+    if created:
+        query[time_field] = created
+
+    if cursor:
+        created_at, key = decode_cursor(cursor)
+        after = {"$or": [
+            {time_field: {"$lt": created_at}},
+            {time_field: created_at, key_field: {"$lt": key}},
+        ]}
+        query = {"$and": [query, after]} if query else after
+    return query
+
+
+def keyset_sort(key_field: str, time_field: str = "created_at") -> List[Tuple[str, int]]:
+    return [(time_field, -1), (key_field, -1)]
+
+
+def split_page(
+    rows: List[dict], key_field: str, limit: int, time_field: str = "created_at"
+) -> Tuple[List[dict], Optional[str]]:
+    """Trim a `limit + 1` fetch to one page and build the cursor for the next one"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last[time_field], last[key_field])
+
+
+def clamp_limit(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def projection_for(model: Type[BaseModel], computed: Iterable[str] = ()) -> dict:
+    """Mongo projection fetching exactly the stored fields a list model renders"""
+    projection = {"_id": 0}
+    for name in model.model_fields:
+        if name not in computed:
+            projection[name] = 1
+    return projection
@@ -0,0 +1,202 @@
+from contextlib import asynccontextmanager
+from collections import defaultdict
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import PyMongoError, OperationFailure
+from typing import Awaitable, Callable, Dict, Optional, Set
+import asyncio
+import orjson
+import os
+import logging
+
+from services import metrics
+from services.revenue_rollups import revenue_rollups
+from services.entitlements import entitlements
+
+logger = logging.getLogger(__name__)
+
+# "auto" watches MongoDB change streams when the deployment supports them
+# (replica set / Atlas) so status events reach every worker; "off" = in-process only
+STATUS_CHANGE_STREAMS = os.environ.get('STATUS_CHANGE_STREAMS', 'auto').lower()
+STATUS_SUBSCRIBER_QUEUE_SIZE = 8
+STATUS_STREAM_MAX_TIMEOUT_SECONDS = int(os.environ.get('STATUS_STREAM_MAX_TIMEOUT_SECONDS', '60'))
+STATUS_STREAM_HEARTBEAT_SECONDS = 15
+STATUS_STREAM_RETRY_MS = 3000
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+TRANSACTION_FIELDS = (
+    "id", "session_id", "order_id", "status", "payment_status", "amount",
+    "currency", "package_name", "payment_gateway",
+)
+MANUAL_PAYMENT_FIELDS = (
+    "order_id", "status", "package_name", "amount", "currency",
+    "created_at", "verified_at",
+)
+
+
+class StatusBroker:
+    """In-process pub/sub of payment status changes, keyed by topic"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+
+    @asynccontextmanager
+    async def subscribe(self, topic: str):
+        queue: asyncio.Queue = asyncio.Queue(maxsize=STATUS_SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[topic].add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def publish(self, topic: str, event: dict) -> int:
+        delivered = 0
+        for queue in self._subscribers.get(topic, ()):
+            try:
+                queue.put_nowait(event)
+                delivered += 1
+            except asyncio.QueueFull:
+                # Subscribers only need the latest state
+                pass
+        return delivered
+
+    def stats(self) -> dict:
+        return {
+            "topics": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+        }
+
+
+broker = StatusBroker()
+metrics.registry.gauge(
+    "status_stream_subscribers", "Open payment status streams (SSE) in this process"
+).set_function(lambda: broker.stats()["subscribers"])
+
+
+def transaction_topic(doc: dict) -> Optional[str]:
+    if doc.get("session_id"):
+        return f"stripe:{doc['session_id']}"
+    if doc.get("order_id"):
+        return f"razorpay:{doc['order_id']}"
+    return None
+
+
+def manual_payment_topic(order_id: str) -> str:
+    return f"manual:{order_id}"
+
+
+def _publish_transaction(doc: dict):
+    topic = transaction_topic(doc)
+    if topic:
+        broker.publish(topic, {k: doc.get(k) for k in TRANSACTION_FIELDS})
+
+
+def _publish_manual_payment(doc: dict):
+    broker.publish(
+        manual_payment_topic(doc["order_id"]),
+        {k: doc.get(k) for k in MANUAL_PAYMENT_FIELDS},
+    )
+
+
+def transaction_created(doc: dict):
+    """Record a new pending payment_transactions row (nobody is subscribed yet)"""
+    metrics.payment_transitions.labels(doc.get("payment_gateway") or "unknown", "pending").inc()
+    revenue_rollups.transaction_created(doc)
+
+
+def transaction_updated(doc: dict):
+    """Announce a payment_transactions state change made by this process"""
+    metrics.payment_transitions.labels(doc.get("payment_gateway") or "unknown", doc.get("payment_status") or "unknown").inc()
+    revenue_rollups.transaction_updated(doc)
+    entitlements.transaction_updated(doc)
+    _publish_transaction(doc)
+
+
+def manual_payment_created(doc: dict):
+    """Record a new pending manual_payments row (nobody is subscribed yet)"""
+    metrics.payment_transitions.labels("manual", "pending").inc()
+    revenue_rollups.manual_payment_created(doc)
+
+
+def manual_payment_updated(doc: dict):
+    """Announce a manual_payments state change made by this process"""
+    metrics.payment_transitions.labels("manual", doc.get("status") or "unknown").inc()
+    revenue_rollups.manual_payment_updated(doc)
+    entitlements.manual_payment_updated(doc)
+    _publish_manual_payment(doc)
+
+
+async def _watch(db: AsyncIOMotorDatabase, collection: str, publish, operations=("update", "replace")):
+    pipeline = [{"$match": {"operationType": {"$in": list(operations)}}}]
+    try:
+        async with db[collection].watch(pipeline, full_document="updateLookup") as stream:
+            logger.info(f"Watching {collection} change stream for status events")
+            async for change in stream:
+                doc = change.get("fullDocument")
+                if doc is None and change.get("operationType") == "delete":
+                    doc = change.get("documentKey")
+                if doc:
+                    publish(doc)
+    except OperationFailure as e:
+        # 40573: change streams need a replica set
+        logger.info(f"Change streams unavailable for {collection}, status events are per-worker only: {e}")
+    except PyMongoError as e:
+        logger.warning(f"{collection} change stream stopped: {e}")
+
+
+async def watch_changes(db: AsyncIOMotorDatabase):
+    """Relay status changes made by other workers; exits quietly if unsupported"""
+    if STATUS_CHANGE_STREAMS == "off":
+        return
+    await asyncio.gather(
+        # Relay only: the worker that made the change already counted it
+        _watch(db, "payment_transactions", _publish_transaction),
+        _watch(db, "manual_payments", _publish_manual_payment),
+        # Plans granted by other workers must not be served stale from this one's cache
+        _watch(db, "entitlements", entitlements.invalidate_doc, ("insert", "update", "replace", "delete")),
+    )
+
+
+def format_sse(event: str, data: dict) -> str:
+    # orjson renders datetimes itself, so status payloads need no jsonable_encoder pass
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
+async def status_events(
+    topic: str,
+    load_current: Callable[[], Awaitable[Optional[dict]]],
+    render: Callable[[dict], dict],
+    is_final: Callable[[dict], bool],
+    timeout: float,
+):
+    """SSE body: one "status" event when the record changes (or is already final),
+    otherwise a "timeout" event with the last known state so the client can reconnect"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + min(timeout, STATUS_STREAM_MAX_TIMEOUT_SECONDS)
+    yield f"retry: {STATUS_STREAM_RETRY_MS}\n\n"
+
+    async with broker.subscribe(topic) as queue:
+        # Read after subscribing so a change in between cannot be missed
+        current = await load_current()
+        if current is not None and is_final(current):
+            yield format_sse("status", current)
+            return
+
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                yield format_sse("timeout", current or {})
+                return
+            try:
+                event = await asyncio.wait_for(
+                    queue.get(), timeout=min(remaining, STATUS_STREAM_HEARTBEAT_SECONDS)
+                )
+            except asyncio.TimeoutError:
+                if deadline - loop.time() > 0:
+                    yield ": keepalive\n\n"
+                continue
+            yield format_sse("status", render(event))
+            return
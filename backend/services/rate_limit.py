@@ -0,0 +1,267 @@
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from fastapi import HTTPException, Request
+from typing import Optional, Tuple
+import asyncio
+import math
+import time
+import os
+import logging
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional dependency
+    aioredis = None
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+# "local" keeps buckets per worker; "redis" shares them across workers
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'local')
+REDIS_URL = os.environ.get('REDIS_URL', '')
+# Token buckets over all payment write endpoints: sustained rate plus a burst allowance
+RATE_LIMIT_IP_PER_MINUTE = float(os.environ.get('RATE_LIMIT_IP_PER_MINUTE', '30'))
+RATE_LIMIT_IP_BURST = float(os.environ.get('RATE_LIMIT_IP_BURST', '10'))
+RATE_LIMIT_EMAIL_PER_MINUTE = float(os.environ.get('RATE_LIMIT_EMAIL_PER_MINUTE', '10'))
+RATE_LIMIT_EMAIL_BURST = float(os.environ.get('RATE_LIMIT_EMAIL_BURST', '5'))
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+
+# Admission control: payment writes served at once per worker, and how many may wait
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get('ADMISSION_MAX_CONCURRENCY', '64'))
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', '128'))
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_MS', '2000'))
+# While writes are queueing and their recent latency is above this, shed new ones (0 = off)
+ADMISSION_SHED_LATENCY_MS = float(os.environ.get('ADMISSION_SHED_LATENCY_MS', '5000'))
+LATENCY_EWMA_ALPHA = 0.2
+
+rate_limit_decisions = metrics.registry.counter(
+    "rate_limit_decisions", "Token-bucket decisions on payment writes", ("route", "scope", "decision")
+)
+admission_decisions = metrics.registry.counter(
+    "admission_decisions", "Admission-control decisions on payment writes", ("route", "decision")
+)
+
+# KEYS[1] = bucket; ARGV = rate per second, burst. Returns {allowed, tokens left}
+_REDIS_TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) / 1000 * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+
+class LocalBucketBackend:
+    """Per-worker token buckets; also the stand-in for Redis in tests and benchmarks"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        """Take one token; returns (allowed, tokens left)"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        # Least recently seen clients go first; their buckets would be full again anyway
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, tokens
+
+    async def close(self):
+        self._buckets.clear()
+
+
+class RedisBucketBackend:
+    """Token buckets in Redis, shared by all workers (refilled atomically in a script)"""
+
+    def __init__(self, url: str):
+        if aioredis is None:
+            raise RuntimeError("redis package is not installed")
+        self._redis = aioredis.from_url(url)
+        self._script = self._redis.register_script(_REDIS_TOKEN_BUCKET)
+
+    async def take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        allowed, tokens = await self._script(keys=[key], args=[rate, burst])
+        return bool(allowed), float(tokens)
+
+    async def close(self):
+        await self._redis.close()
+
+
+class RateLimiter:
+    """Token-bucket limits per client IP and per customer email"""
+
+    def __init__(self, backend, enabled: bool = RATE_LIMIT_ENABLED):
+        self.backend = backend
+        self.enabled = enabled
+        self.limits = {
+            "ip": (RATE_LIMIT_IP_PER_MINUTE / 60, RATE_LIMIT_IP_BURST),
+            "email": (RATE_LIMIT_EMAIL_PER_MINUTE / 60, RATE_LIMIT_EMAIL_BURST),
+        }
+        self.counters = {"allowed": 0, "limited": 0, "backend_errors": 0}
+
+    async def check(self, route: str, scope: str, identity: Optional[str]):
+        """Spend one token from the (scope, identity) bucket or raise a 429"""
+        if not self.enabled or not identity:
+            return
+        rate, burst = self.limits[scope]
+        if rate <= 0:
+            return
+        try:
+            allowed, tokens = await self.backend.take(f"ratelimit:{scope}:{identity}", rate, burst)
+        except Exception as e:
+            # Fail open: a limiter outage must not take payments down with it
+            self.counters["backend_errors"] += 1
+            logger.warning(f"Rate limiter backend error, allowing request: {e}")
+            return
+        decision = "allowed" if allowed else "limited"
+        self.counters[decision] += 1
+        rate_limit_decisions.labels(route, scope, decision).inc()
+        if not allowed:
+            retry_after = math.ceil((1 - tokens) / rate)
+            raise HTTPException(
+                status_code=429,
+                detail="Too many payment requests, please slow down",
+                headers={"Retry-After": str(retry_after)}
+            )
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.backend).__name__,
+            "limits_per_minute": {scope: {"rate": rate * 60, "burst": burst} for scope, (rate, burst) in self.limits.items()},
+            **self.counters,
+        }
+
+    async def close(self):
+        await self.backend.close()
+
+
+class AdmissionGate:
+    """Concurrency cap with a bounded wait queue; sheds load fast instead of piling up"""
+
+    def __init__(
+        self,
+        max_concurrency: int = ADMISSION_MAX_CONCURRENCY,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        queue_timeout_ms: float = ADMISSION_QUEUE_TIMEOUT_MS,
+        shed_latency_ms: float = ADMISSION_SHED_LATENCY_MS,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout_ms / 1000
+        self.shed_latency = shed_latency_ms / 1000
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.active = 0
+        self.waiting = 0
+        # Smoothed time from arrival to response, queue wait included
+        self.latency_ewma = 0.0
+        self.counters = {"admitted": 0, "queued": 0, "shed_queue_full": 0, "shed_latency": 0, "shed_timeout": 0}
+
+    def _shed(self, route: str, reason: str):
+        self.counters[f"shed_{reason}"] += 1
+        admission_decisions.labels(route, f"shed_{reason}").inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Payment service is busy, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+
+    def _observe(self, seconds: float):
+        self.latency_ewma += LATENCY_EWMA_ALPHA * (seconds - self.latency_ewma)
+
+    @asynccontextmanager
+    async def admit(self, route: str):
+        started = time.perf_counter()
+        # Counted here rather than read off the semaphore: acquires still being scheduled hold no slot yet
+        queue_depth = self.active + self.waiting - self.max_concurrency
+        if queue_depth >= 0:
+            if queue_depth >= self.max_queue:
+                self._shed(route, "queue_full")
+            if self.shed_latency and self.latency_ewma > self.shed_latency:
+                self._shed(route, "latency")
+            self.counters["queued"] += 1
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            # Waiting this long means the latency estimate should say so too
+            self._observe(time.perf_counter() - started)
+            self._shed(route, "timeout")
+        finally:
+            self.waiting -= 1
+
+        self.counters["admitted"] += 1
+        admission_decisions.labels(route, "admitted").inc()
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+            self._observe(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1),
+            **self.counters,
+        }
+
+
+def _build_backend():
+    if RATE_LIMIT_BACKEND == "redis":
+        if REDIS_URL and aioredis is not None:
+            return RedisBucketBackend(REDIS_URL)
+        logger.warning("Redis rate limiter requested but unavailable, using per-worker buckets")
+    return LocalBucketBackend()
+
+
+rate_limiter = RateLimiter(_build_backend())
+admission_gate = AdmissionGate()
+metrics.registry.gauge(
+    "admission_in_flight", "Payment writes being served in this process"
+).set_function(lambda: admission_gate.active)
+metrics.registry.gauge(
+    "admission_queue_depth", "Payment writes waiting for an admission slot"
+).set_function(lambda: admission_gate.waiting)
+
+
+def payment_write_guard(route: str):
+    """Route dependency: rate-limit the caller, then hold an admission slot for the request"""
+    async def guard(request: Request):
+        client_ip = request.client.host if request.client else None
+        await rate_limiter.check(route, "ip", client_ip)
+        try:
+            body = await request.json()
+        except ValueError:
+            # Left for FastAPI's body validation to reject
+            body = None
+        email = body.get("user_email") if isinstance(body, dict) else None
+        if isinstance(email, str):
+            await rate_limiter.check(route, "email", email.strip().lower())
+        async with admission_gate.admit(route):
+            yield
+    return guard
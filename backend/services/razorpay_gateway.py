@@ -0,0 +1,169 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+import asyncio
+import importlib
+import hmac
+import hashlib
+import os
+import logging
+
+from services import metrics
+from services import gateway_simulators
+
+logger = logging.getLogger(__name__)
+
+RAZORPAY_KEY_ID = os.environ.get('RAZORPAY_KEY_ID', '')
+RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET', '')
+RAZORPAY_WEBHOOK_SECRET = os.environ.get('RAZORPAY_WEBHOOK_SECRET', '')
+
+# Blocking SDK calls run on their own small pool so a slow Razorpay round trip
+# never stalls the event loop (or starves the default executor)
+RAZORPAY_MAX_WORKERS = int(os.environ.get('RAZORPAY_MAX_WORKERS', '8'))
+RAZORPAY_MAX_CONCURRENCY = int(os.environ.get('RAZORPAY_MAX_CONCURRENCY', '16'))
+RAZORPAY_TIMEOUT_SECONDS = float(os.environ.get('RAZORPAY_TIMEOUT_SECONDS', '10'))
+RAZORPAY_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('RAZORPAY_QUEUE_TIMEOUT_SECONDS', '2'))
+
+# Imported on first use (or by preload_sdks()), not when the app boots
+SDK_MODULES = ("razorpay",)
+
+
+class GatewayUnavailable(Exception):
+    """Gateway is not configured or all call slots are busy"""
+
+
+class GatewayTimeout(Exception):
+    """Gateway call did not finish within its deadline"""
+
+
+def _hmac_sha256(secret: str, message: bytes) -> str:
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def _signature_matches(expected: str, signature: Optional[str]) -> bool:
+    # Compared as bytes: compare_digest rejects non-ASCII str, and the signature is client input
+    return hmac.compare_digest(expected.encode(), (signature or "").encode("utf-8", "surrogatepass"))
+
+
+class RazorpayGateway:
+    """Async adapter around the blocking razorpay.Client"""
+
+    def __init__(
+        self,
+        key_id: str,
+        key_secret: str,
+        webhook_secret: str = "",
+        max_workers: int = RAZORPAY_MAX_WORKERS,
+        max_concurrency: int = RAZORPAY_MAX_CONCURRENCY,
+        timeout: float = RAZORPAY_TIMEOUT_SECONDS,
+        queue_timeout: float = RAZORPAY_QUEUE_TIMEOUT_SECONDS,
+        client=None,
+    ):
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.webhook_secret = webhook_secret
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self._client = client
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+
+    @property
+    def configured(self) -> bool:
+        return self._client is not None or bool(self.key_id and self.key_secret)
+
+    @property
+    def client(self):
+        """razorpay.Client, built on first use"""
+        if self._client is None and self.key_id and self.key_secret:
+            import razorpay
+            self._client = razorpay.Client(auth=(self.key_id, self.key_secret))
+        return self._client
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="razorpay",
+            )
+        return self._executor
+
+    async def _call(self, fn, *args, **kwargs):
+        """Run a blocking SDK call on the gateway pool with a concurrency cap and deadline"""
+        if not self.configured:
+            raise GatewayUnavailable("Razorpay is not configured")
+
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise GatewayUnavailable("Razorpay gateway is busy, please retry")
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._get_executor(), partial(fn, *args, **kwargs))
+            return await asyncio.wait_for(future, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise GatewayTimeout(f"Razorpay did not respond within {self.timeout}s")
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def create_order(self, data: dict) -> dict:
+        # Pass the deadline down to requests too, so a timed-out call frees its thread
+        with metrics.time_gateway("razorpay", "create_order"):
+            return await self._call(self.client.order.create, data=data, timeout=self.timeout)
+
+    async def fetch_order(self, order_id: str) -> dict:
+        with metrics.time_gateway("razorpay", "fetch_order"):
+            return await self._call(self.client.order.fetch, order_id, timeout=self.timeout)
+
+    def verify_payment_signature(self, order_id: str, payment_id: str, signature: str) -> bool:
+        """Checkout signature check (HMAC-SHA256 of "order_id|payment_id"), done on the loop"""
+        if not self.key_secret:
+            return False
+        expected = _hmac_sha256(self.key_secret, f"{order_id}|{payment_id}".encode())
+        return _signature_matches(expected, signature)
+
+    @staticmethod
+    def verify_webhook_signature(body: bytes, signature: str, secret: str) -> bool:
+        """Webhook signature check (HMAC-SHA256 of the raw body)"""
+        if not secret:
+            return False
+        return _signature_matches(_hmac_sha256(secret, body), signature)
+
+    def stats(self) -> dict:
+        return {
+            "configured": self.configured,
+            "simulated": gateway_simulators.SIMULATED,
+            "max_workers": self.max_workers,
+            "max_concurrency": self.max_concurrency,
+            "timeout_seconds": self.timeout,
+            "in_flight": self.in_flight,
+            "sdk_loaded": self._client is not None,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def preload_sdks():
+    """Import the Razorpay SDK ahead of the first order (blocking)"""
+    for module in SDK_MODULES:
+        importlib.import_module(module)
+
+
+if gateway_simulators.SIMULATED:
+    razorpay_gateway = RazorpayGateway(
+        gateway_simulators.RAZORPAY_SIM_KEY_ID,
+        gateway_simulators.RAZORPAY_SIM_KEY_SECRET,
+        webhook_secret=gateway_simulators.RAZORPAY_SIM_WEBHOOK_SECRET,
+        client=gateway_simulators.razorpay_client,
+    )
+else:
+    razorpay_gateway = RazorpayGateway(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET, RAZORPAY_WEBHOOK_SECRET)
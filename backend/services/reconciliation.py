@@ -0,0 +1,270 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import lru_cache
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import asyncio
+import csv
+import io
+import re
+import logging
+
+from services.write_behind import write_behind
+
+logger = logging.getLogger(__name__)
+
+# Header aliases seen in Indian bank / UPI statement exports
+TRANSACTION_ID_COLUMNS = ("transaction_id", "txn_id", "utr", "utr_no", "utr_number", "reference", "ref_no", "reference_no", "cheque/ref_no")
+AMOUNT_COLUMNS = ("amount", "credit", "credit_amount", "deposit", "deposit_amount", "cr_amount")
+DATE_COLUMNS = ("date", "txn_date", "transaction_date", "value_date", "posting_date")
+DESCRIPTION_COLUMNS = ("description", "narration", "remarks", "particulars", "details")
+
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d-%b-%Y", "%d %b %Y", "%d/%m/%y", "%Y-%m-%d %H:%M:%S", "%d/%m/%Y %H:%M:%S")
+
+# UTRs / UPI refs embedded in narration text (e.g. "UPI/412345678901/...")
+_REFERENCE_TOKEN = re.compile(r"[A-Za-z0-9]{10,22}")
+
+SAMPLE_SIZE = 100
+
+
+class StatementRow(NamedTuple):
+    line_no: int
+    transaction_id: str
+    amount_paise: int
+    date: Optional[datetime]
+    description: str
+
+
+def _normalize_header(name: str) -> str:
+    return (name or "").strip().lower().replace(" ", "_").replace(".", "")
+
+
+def _pick(headers: List[str], aliases: Tuple[str, ...]) -> Optional[int]:
+    for alias in aliases:
+        if alias in headers:
+            return headers.index(alias)
+    return None
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value: str) -> Optional[datetime]:
+    """Parse a statement date; cached because statements repeat the same few dates"""
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def to_paise(amount: float) -> int:
+    return int(round(amount * 100))
+
+
+def iter_statement_rows(raw, encoding: str = "utf-8-sig") -> Iterator[StatementRow]:
+    """Stream a CSV statement (binary file object) as StatementRows, one line at a time"""
+    text = io.TextIOWrapper(raw, encoding=encoding, newline="")
+    try:
+        reader = csv.reader(text)
+        headers = [_normalize_header(h) for h in next(reader, [])]
+        txn_col = _pick(headers, TRANSACTION_ID_COLUMNS)
+        amount_col = _pick(headers, AMOUNT_COLUMNS)
+        date_col = _pick(headers, DATE_COLUMNS)
+        desc_col = _pick(headers, DESCRIPTION_COLUMNS)
+        if amount_col is None or (txn_col is None and desc_col is None):
+            raise ValueError("Statement needs an amount column and a transaction id or description column")
+
+        width = len(headers)
+        for line_no, row in enumerate(reader, start=2):
+            if len(row) < width:
+                continue
+            try:
+                amount = float(row[amount_col].replace(",", "") or 0)
+            except ValueError:
+                continue
+            if amount <= 0:
+                continue  # debits / empty credit cells
+            yield StatementRow(
+                line_no,
+                row[txn_col].strip() if txn_col is not None else "",
+                to_paise(amount),
+                parse_date(row[date_col]) if date_col is not None else None,
+                row[desc_col] if desc_col is not None else "",
+            )
+    finally:
+        # Leave the upload's file object open for its owner
+        text.detach()
+
+
+class PendingIndex:
+    """In-memory hash index of pending manual payments"""
+
+    def __init__(self):
+        self.by_transaction_id: Dict[str, Tuple[str, int]] = {}
+        # amount_paise -> (sorted created_at list, order_ids in the same order)
+        self._by_amount: Dict[int, List[Tuple[datetime, str]]] = defaultdict(list)
+        self.by_amount: Dict[int, Tuple[List[datetime], List[str]]] = {}
+        self.count = 0
+
+    def add(self, order_id: str, transaction_id: Optional[str], amount: float, created_at: datetime):
+        amount_paise = to_paise(amount)
+        if transaction_id:
+            self.by_transaction_id[transaction_id.strip()] = (order_id, amount_paise)
+        self._by_amount[amount_paise].append((created_at, order_id))
+        self.count += 1
+
+    def finalize(self) -> "PendingIndex":
+        for amount_paise, entries in self._by_amount.items():
+            entries.sort()
+            self.by_amount[amount_paise] = ([e[0] for e in entries], [e[1] for e in entries])
+        self._by_amount = defaultdict(list)
+        return self
+
+    @classmethod
+    async def from_db(cls, db: AsyncIOMotorDatabase, status: Iterable[str] = ("pending",)) -> "PendingIndex":
+        index = cls()
+        cursor = db.manual_payments.find(
+            {"status": {"$in": list(status)}},
+            {"_id": 0, "order_id": 1, "transaction_id": 1, "amount": 1, "created_at": 1},
+        ).batch_size(5000)
+        async for payment in cursor:
+            index.add(payment["order_id"], payment.get("transaction_id"), payment["amount"], payment["created_at"])
+        return index.finalize()
+
+
+class Reconciler:
+    """Matches statement rows to pending payments; each payment is claimed at most once"""
+
+    def __init__(self, index: PendingIndex, date_window: timedelta, amount_tolerance: float = 1.0, match_amount_date: bool = True):
+        self.index = index
+        self.date_window = date_window
+        self.tolerance_paise = to_paise(amount_tolerance)
+        # Off: rows only match by transaction id / UTR reference
+        self.match_amount_date = match_amount_date
+        self.claimed = set()
+
+    def _by_reference(self, row: StatementRow):
+        by_txn = self.index.by_transaction_id
+        if row.transaction_id and row.transaction_id in by_txn:
+            return row.transaction_id, by_txn[row.transaction_id]
+        if row.description:
+            for token in _REFERENCE_TOKEN.findall(row.description):
+                if token in by_txn:
+                    return token, by_txn[token]
+        return None, None
+
+    def _by_amount_and_date(self, row: StatementRow, limit: int = 10) -> List[str]:
+        bucket = self.index.by_amount.get(row.amount_paise)
+        if bucket is None or row.date is None:
+            return []
+        created, order_ids = bucket
+        # Date-only statements: widen by a day so same-day submissions are in range
+        lo = bisect_left(created, row.date - self.date_window)
+        hi = bisect_right(created, row.date + self.date_window + timedelta(days=1), lo)
+        candidates = []
+        for i in range(lo, hi):
+            if order_ids[i] not in self.claimed:
+                candidates.append(order_ids[i])
+                if len(candidates) > limit:
+                    break  # already ambiguous; busy amounts can have thousands in range
+        return candidates
+
+    def match(self, row: StatementRow) -> Tuple[str, Optional[str], Optional[dict]]:
+        """Returns (kind, order_id, detail); kind is one of transaction_id,
+        amount_date, amount_mismatch, ambiguous, duplicate, unmatched"""
+        reference, hit = self._by_reference(row)
+        if hit is not None:
+            order_id, expected_paise = hit
+            if order_id in self.claimed:
+                return "duplicate", order_id, None
+            if abs(expected_paise - row.amount_paise) > self.tolerance_paise:
+                return "amount_mismatch", order_id, {
+                    "expected_amount": expected_paise / 100,
+                    "statement_amount": row.amount_paise / 100,
+                }
+            self.claimed.add(order_id)
+            return "transaction_id", order_id, {"reference": reference}
+
+        candidates = self._by_amount_and_date(row) if self.match_amount_date else []
+        if len(candidates) == 1:
+            self.claimed.add(candidates[0])
+            return "amount_date", candidates[0], None
+        if candidates:
+            return "ambiguous", None, {"candidates": candidates[:10]}
+        return "unmatched", None, None
+
+    def run(self, rows: Iterable[StatementRow], sample_size: int = SAMPLE_SIZE) -> Dict:
+        counts = defaultdict(int)
+        matches = {"transaction_id": [], "amount_date": []}
+        samples = defaultdict(list)
+        total = 0
+
+        for row in rows:
+            total += 1
+            kind, order_id, detail = self.match(row)
+            counts[kind] += 1
+            if kind in matches:
+                matches[kind].append({
+                    "order_id": order_id,
+                    "line": row.line_no,
+                    "amount": row.amount_paise / 100,
+                    **(detail or {}),
+                })
+            elif len(samples[kind]) < sample_size:
+                samples[kind].append({
+                    "line": row.line_no,
+                    "transaction_id": row.transaction_id,
+                    "amount": row.amount_paise / 100,
+                    "order_id": order_id,
+                    **(detail or {}),
+                })
+
+        return {
+            "statement_rows": total,
+            "pending_records": self.index.count,
+            "counts": dict(counts),
+            "matches": matches,
+            "samples": dict(samples),
+        }
+
+
+async def reconcile_statement(
+    db: AsyncIOMotorDatabase,
+    raw,
+    date_window_days: int = 3,
+    amount_tolerance: float = 1.0,
+    auto_verify: bool = False,
+    include_amount_date: bool = False,
+    verified_by: str = "reconciliation",
+) -> Dict:
+    """Match a statement against pending (or expired) payments and optionally verify the matches.
+
+    Only transaction-id matches are auto-verified unless include_amount_date is set.
+    """
+    from services import manual_review
+
+    await write_behind.flush("manual_payments")
+    # Same statuses the review endpoints accept: late money for an expired payment still matches
+    index = await PendingIndex.from_db(db, manual_review.REVIEWABLE_STATUSES)
+    reconciler = Reconciler(index, timedelta(days=date_window_days), amount_tolerance)
+    # Parsing and matching are CPU-bound; keep them off the event loop
+    report = await asyncio.to_thread(reconciler.run, iter_statement_rows(raw))
+
+    if auto_verify:
+        kinds = ["transaction_id", "amount_date"] if include_amount_date else ["transaction_id"]
+        order_ids = [m["order_id"] for kind in kinds for m in report["matches"][kind]]
+        summary = defaultdict(int)
+        for start in range(0, len(order_ids), manual_review.LOOKUP_CHUNK):
+            chunk = order_ids[start:start + manual_review.LOOKUP_CHUNK]
+            results = await manual_review.apply_reviews(db, ((o, "verify", None) for o in chunk), verified_by)
+            for result in results:
+                summary[result["result"]] += 1
+        report["verification"] = dict(summary)
+
+    logger.info(
+        f"Reconciled {report['statement_rows']} statement rows against "
+        f"{report['pending_records']} pending payments: {report['counts']}"
+    )
+    return report
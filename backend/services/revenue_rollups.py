@@ -0,0 +1,257 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import os
+import logging
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "revenue_daily"
+# Transition counts are aggregated in memory and $inc'ed into the rollups this often
+REVENUE_ROLLUP_FLUSH_SECONDS = float(os.environ.get('REVENUE_ROLLUP_FLUSH_SECONDS', '5'))
+
+# Everything is bucketed by the day the payment was *created* (a cohort), so
+# conversion compares like with like and the backfill can rebuild any day exactly
+DAY_FORMAT = "%Y-%m-%d"
+TRANSACTION_OUTCOMES = ("paid", "failed", "expired")
+
+RollupKey = Tuple[str, str, str, str]
+
+rollup_flushes = metrics.registry.histogram(
+    "revenue_rollup_flush_duration_seconds", "Revenue rollup $inc flush latency", ("outcome",)
+)
+
+
+def _day(value) -> Optional[str]:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime(DAY_FORMAT)
+
+
+def rollup_id(key: RollupKey) -> str:
+    return "|".join(key)
+
+
+def _key(doc: dict, source: str) -> Optional[RollupKey]:
+    day = _day(doc.get("created_at"))
+    if day is None:
+        return None
+    return (day, source, doc.get("package_id") or "unknown", (doc.get("currency") or "").upper())
+
+
+class RevenueRollups:
+    """Daily revenue/conversion rollups, maintained from payment state transitions"""
+
+    def __init__(self, flush_seconds: float = REVENUE_ROLLUP_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._pending: Dict[RollupKey, Dict[str, float]] = defaultdict(lambda: defaultdict(int))
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.counters = {"recorded": 0, "flushed_docs": 0, "flush_errors": 0, "skipped": 0}
+
+    def _add(self, key: Optional[RollupKey], increments: Dict[str, float]):
+        if key is None:
+            self.counters["skipped"] += 1
+            return
+        bucket = self._pending[key]
+        for field, amount in increments.items():
+            bucket[field] += amount
+        self.counters["recorded"] += 1
+
+    def transaction_created(self, doc: dict):
+        self._add(_key(doc, doc.get("payment_gateway") or "unknown"), {"created": 1})
+
+    def transaction_updated(self, doc: dict):
+        status = doc.get("payment_status")
+        if status not in TRANSACTION_OUTCOMES:
+            return
+        increments = {status: 1}
+        if status == "paid":
+            increments["revenue"] = float(doc.get("amount") or 0)
+        if status != "expired" and doc.get("expired_at"):
+            # Paid (late webhook or status poll) after the expiry sweeper had counted it as expired
+            increments["expired"] = -1
+        self._add(_key(doc, doc.get("payment_gateway") or "unknown"), increments)
+
+    def manual_payment_created(self, doc: dict):
+        self._add(_key(doc, "manual"), {"created": 1})
+
+    def manual_payment_updated(self, doc: dict):
+        status = doc.get("status")
+        if status == "verified":
+            increments = {"paid": 1, "revenue": float(doc.get("amount") or 0)}
+        elif status in ("rejected", "expired"):
+            increments = {status: 1}
+        else:
+            return
+        if status != "expired" and doc.get("expired_at"):
+            # Reviewed after the expiry sweeper had already counted it as expired
+            increments["expired"] = -1
+        # Turnaround: submission to admin decision
+        created_at, verified_at = doc.get("created_at"), doc.get("verified_at")
+        if status != "expired" and isinstance(created_at, datetime) and isinstance(verified_at, datetime):
+            increments["reviewed"] = 1
+            increments["review_seconds"] = max(0.0, (verified_at - created_at).total_seconds())
+        self._add(_key(doc, "manual"), increments)
+
+    async def flush(self):
+        """$inc every pending bucket into its rollup document"""
+        if self._db is None or not self._pending:
+            return
+        async with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+            keys = list(pending)
+            ops = [
+                UpdateOne(
+                    {"_id": rollup_id(key)},
+                    {
+                        "$inc": dict(pending[key]),
+                        "$setOnInsert": {"day": key[0], "source": key[1], "package_id": key[2], "currency": key[3]},
+                    },
+                    upsert=True,
+                )
+                for key in keys
+            ]
+            failed = set()
+            try:
+                with metrics.time_outcome(rollup_flushes):
+                    await self._db[COLLECTION].bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                # Unordered: every op not listed in writeErrors was applied, and
+                # re-sending an applied $inc would count it twice
+                self.counters["flush_errors"] += 1
+                failed = {error["index"] for error in (e.details or {}).get("writeErrors") or []}
+                logger.error(f"Revenue rollup flush: {len(failed)} of {len(ops)} docs failed, re-queued: {e}")
+            except PyMongoError as e:
+                self.counters["flush_errors"] += 1
+                failed = set(range(len(ops)))
+                logger.error(f"Revenue rollup flush failed ({len(ops)} docs): {e}")
+            self.counters["flushed_docs"] += len(ops) - len(failed)
+            # Put the failed increments back; the next flush retries them
+            for index in failed:
+                for field, amount in pending[keys[index]].items():
+                    self._pending[keys[index]][field] += amount
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._db = db
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending_buckets": len(self._pending),
+            "flush_seconds": self.flush_seconds,
+            **self.counters,
+        }
+
+
+def _created_range(date_from: Optional[str], date_to: Optional[str]) -> Dict:
+    """created_at bounds for whole UTC days [date_from, date_to]"""
+    bounds: Dict = {"$type": "date"}
+    if date_from:
+        bounds["$gte"] = datetime.strptime(date_from, DAY_FORMAT)
+    if date_to:
+        bounds["$lt"] = datetime.strptime(date_to, DAY_FORMAT) + timedelta(days=1)
+    return bounds
+
+
+def _backfill_pipeline(source, status_field: str, paid_status: str, created_range: Dict) -> List[dict]:
+    """Aggregation rebuilding one collection's rollups, merged into COLLECTION"""
+    day = {"$dateToString": {"format": DAY_FORMAT, "date": "$created_at"}}
+    paid = {"$eq": [f"${status_field}", paid_status]}
+
+    def count(status):
+        return {"$sum": {"$cond": [{"$eq": [f"${status_field}", status]}, 1, 0]}}
+
+    group = {
+        "_id": {
+            "day": day,
+            "source": {"$ifNull": [source, "unknown"]},
+            "package_id": {"$ifNull": ["$package_id", "unknown"]},
+            "currency": {"$toUpper": {"$ifNull": ["$currency", ""]}},
+        },
+        "created": {"$sum": 1},
+        "paid": {"$sum": {"$cond": [paid, 1, 0]}},
+        "revenue": {"$sum": {"$cond": [paid, "$amount", 0]}},
+    }
+    if status_field == "status":
+        reviewed = {"$and": [
+            {"$in": ["$status", ["verified", "rejected"]]},
+            {"$eq": [{"$type": "$verified_at"}, "date"]},
+        ]}
+        group["rejected"] = count("rejected")
+        group["expired"] = count("expired")
+        group["reviewed"] = {"$sum": {"$cond": [reviewed, 1, 0]}}
+        group["review_seconds"] = {"$sum": {"$cond": [
+            reviewed, {"$divide": [{"$subtract": ["$verified_at", "$created_at"]}, 1000]}, 0
+        ]}}
+    else:
+        for status in TRANSACTION_OUTCOMES[1:]:
+            group[status] = count(status)
+
+    fields = {name: 1 for name in group if name != "_id"}
+    return [
+        {"$match": {"created_at": created_range}},
+        {"$group": group},
+        {"$project": {
+            "_id": {"$concat": ["$_id.day", "|", "$_id.source", "|", "$_id.package_id", "|", "$_id.currency"]},
+            "day": "$_id.day",
+            "source": "$_id.source",
+            "package_id": "$_id.package_id",
+            "currency": "$_id.currency",
+            **fields,
+        }},
+        {"$merge": {"into": COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+async def backfill(db: AsyncIOMotorDatabase, date_from: Optional[str] = None, date_to: Optional[str] = None) -> Dict:
+    """Rebuild rollups for whole days [date_from, date_to] (YYYY-MM-DD) from the source collections.
+
+    Runs server-side ($group + $merge); the whole history when no range is given.
+    """
+    created_range = _created_range(date_from, date_to)
+    # Buffered increments would be counted twice once the backfill replaces their rollups
+    await revenue_rollups.flush()
+    started = datetime.now(timezone.utc)
+    await db.payment_transactions.aggregate(
+        _backfill_pipeline("$payment_gateway", "payment_status", "paid", created_range)
+    ).to_list(None)
+    await db.manual_payments.aggregate(
+        _backfill_pipeline("manual", "status", "verified", created_range)
+    ).to_list(None)
+
+    days = {}
+    if date_from:
+        days["$gte"] = date_from
+    if date_to:
+        days["$lte"] = date_to
+    rollups = await db[COLLECTION].count_documents({"day": days} if days else {})
+    elapsed = (datetime.now(timezone.utc) - started).total_seconds()
+    logger.info(f"Revenue rollup backfill {date_from or 'start'}..{date_to or 'now'}: {rollups} rollups in {elapsed:.1f}s")
+    return {"date_from": date_from, "date_to": date_to, "rollups": rollups, "seconds": round(elapsed, 3)}
+
+
+revenue_rollups = RevenueRollups()
@@ -0,0 +1,397 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pathlib import Path
+from pymongo import ReturnDocument
+from typing import Dict, Optional, Tuple
+from fastapi import Request
+from python_multipart.exceptions import ParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import ClientDisconnect
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# "local" writes under SCREENSHOT_STORAGE_DIR; "s3" uses any S3-compatible endpoint
+SCREENSHOT_STORAGE_BACKEND = os.environ.get('SCREENSHOT_STORAGE_BACKEND', 'local')
+SCREENSHOT_STORAGE_DIR = os.environ.get('SCREENSHOT_STORAGE_DIR', str(BACKEND_DIR / 'uploads' / 'screenshots'))
+SCREENSHOT_S3_BUCKET = os.environ.get('SCREENSHOT_S3_BUCKET', '')
+SCREENSHOT_S3_ENDPOINT_URL = os.environ.get('SCREENSHOT_S3_ENDPOINT_URL') or None
+SCREENSHOT_S3_PREFIX = os.environ.get('SCREENSHOT_S3_PREFIX', 'screenshots/')
+SCREENSHOT_MAX_BYTES = int(os.environ.get('SCREENSHOT_MAX_BYTES', str(5 * 1024 * 1024)))
+SCREENSHOT_CHUNK_BYTES = 64 * 1024
+SCREENSHOT_THUMBNAIL_SIZE = int(os.environ.get('SCREENSHOT_THUMBNAIL_SIZE', '320'))
+SCREENSHOT_THUMBNAIL_WORKERS = int(os.environ.get('SCREENSHOT_THUMBNAIL_WORKERS', '2'))
+
+COLLECTION = "screenshots"
+
+# Sniffed from the first bytes; the client's Content-Type is not trusted
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png", "png"),
+    (b"\xff\xd8\xff", "image/jpeg", "jpg"),
+)
+
+
+class InvalidScreenshot(ValueError):
+    pass
+
+
+class ScreenshotTooLarge(ValueError):
+    pass
+
+
+def _sniff(head: bytes) -> Optional[Tuple[str, str]]:
+    for signature, content_type, ext in _SIGNATURES:
+        if head.startswith(signature):
+            return content_type, ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp", "webp"
+    return None
+
+
+class UploadSpool:
+    """Incrementally sniffs, hashes and writes an upload to a temp file, enforcing max_bytes"""
+
+    def __init__(self, max_bytes: int = SCREENSHOT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.kind: Optional[Tuple[str, str]] = None
+        self._head = b""
+        self._digest = hashlib.sha256()
+        self._file = tempfile.NamedTemporaryFile(prefix="screenshot-", delete=False)
+        self.path = self._file.name
+
+    def feed(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise ScreenshotTooLarge(f"Screenshot exceeds {self.max_bytes // 1024} KB")
+        if self.kind is None:
+            self._head += chunk[:16]
+            if len(self._head) >= 12:
+                self._check_type()
+        self._digest.update(chunk)
+        self._file.write(chunk)
+
+    def _check_type(self):
+        self.kind = _sniff(self._head)
+        if self.kind is None:
+            raise InvalidScreenshot("Screenshot must be a PNG, JPEG or WebP image")
+
+    def finish(self) -> str:
+        """Close the temp file and return the content's sha256"""
+        self._file.close()
+        if self.size == 0:
+            raise InvalidScreenshot("Empty screenshot upload")
+        if self.kind is None:
+            self._check_type()
+        return self._digest.hexdigest()
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def read_multipart_file(request: Request, field: str, spool: UploadSpool):
+    """Feed one file field of a multipart request body into `spool` as it arrives.
+
+    Unlike request.form(), nothing is spooled before the size limit applies.
+    """
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise InvalidScreenshot("Expected a multipart/form-data upload")
+
+    state = {"header": b"", "headers": {}, "target": False, "found": False, "complete": False}
+    pending = []
+
+    def on_header_field(data, start, end):
+        state["header"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        name = state["header"].lower()
+        state["headers"][name] = state["headers"].get(name, b"") + data[start:end]
+
+    def on_header_end():
+        state["header"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        state["target"] = options.get(b"name") == field.encode() and not state["found"]
+        state["found"] = state["found"] or state["target"]
+        state["headers"] = {}
+
+    def on_part_data(data, start, end):
+        if state["target"]:
+            pending.append(data[start:end])
+
+    def on_part_end():
+        state["complete"] = state["complete"] or state["target"]
+        state["target"] = False
+
+    parser = MultipartParser(boundary, {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    # Malformed or cut-off bodies are the client's fault (400), not a storage failure
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if pending:
+                data = b"".join(pending)
+                pending.clear()
+                # Hashing and disk writes stay off the event loop
+                await asyncio.to_thread(spool.feed, data)
+        parser.finalize()
+    except ParseError as e:
+        raise InvalidScreenshot(f"Malformed multipart body: {e}")
+    except ClientDisconnect:
+        raise InvalidScreenshot("Upload was interrupted")
+    if not state["found"]:
+        raise InvalidScreenshot(f"Missing '{field}' file field")
+    if not state["complete"]:
+        raise InvalidScreenshot(f"The '{field}' file field is truncated")
+
+
+def make_thumbnail(src_path: str, dst_path: str, size: int = SCREENSHOT_THUMBNAIL_SIZE):
+    """Write a JPEG thumbnail no larger than size x size (blocking)"""
+    from PIL import Image
+
+    with Image.open(src_path) as image:
+        # For JPEGs, decode at reduced scale instead of full resolution
+        image.draft("RGB", (size, size))
+        image.thumbnail((size, size))
+        image.convert("RGB").save(dst_path, "JPEG", quality=80, optimize=True)
+
+
+class LocalObjectStore:
+    """Filesystem object store; also the stand-in for S3 in development"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise KeyError(key)
+        return path
+
+    async def exists(self, key: str) -> bool:
+        return self.path(key).exists()
+
+    async def put_file(self, key: str, src_path: str, content_type: str):
+        dst = self.path(key)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        # Copy then rename, so readers never see a partial object
+        partial = dst.with_name(f".{dst.name}.{uuid.uuid4().hex}.partial")
+        await asyncio.to_thread(shutil.copyfile, src_path, partial)
+        os.replace(partial, dst)
+
+    def url(self, key: str) -> Optional[str]:
+        return None  # served by the API
+
+    def close(self):
+        pass
+
+
+class S3ObjectStore:
+    """S3-compatible object store (AWS, MinIO, R2); boto3 calls run in threads"""
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, prefix: str = ""):
+        import boto3
+        from botocore.exceptions import ClientError
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = boto3.client("s3", endpoint_url=endpoint_url)
+        self._client_error = ClientError
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await asyncio.to_thread(self._client.head_object, Bucket=self.bucket, Key=self.prefix + key)
+            return True
+        except self._client_error:
+            return False
+
+    async def put_file(self, key: str, src_path: str, content_type: str):
+        await asyncio.to_thread(
+            self._client.upload_file, src_path, self.bucket, self.prefix + key,
+            ExtraArgs={"ContentType": content_type, "CacheControl": "private, max-age=31536000, immutable"},
+        )
+
+    def url(self, key: str) -> Optional[str]:
+        return self._client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self.prefix + key}, ExpiresIn=3600
+        )
+
+    def close(self):
+        self._client.close()
+
+
+class ScreenshotStore:
+    """Content-addressed screenshot uploads with background thumbnails"""
+
+    def __init__(self, backend: str = SCREENSHOT_STORAGE_BACKEND, max_bytes: int = SCREENSHOT_MAX_BYTES,
+                 thumbnail_workers: int = SCREENSHOT_THUMBNAIL_WORKERS):
+        self.backend_name = backend
+        self.max_bytes = max_bytes
+        self.thumbnail_workers = thumbnail_workers
+        self._objects = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks = set()
+        self._thumbnailing = set()
+        self._stats = {"uploads": 0, "duplicates": 0, "rejected": 0, "thumbnails": 0, "thumbnail_failures": 0}
+
+    @property
+    def objects(self):
+        # Built on first use so a missing bucket/boto3 only affects uploads
+        if self._objects is None:
+            if self.backend_name == "s3":
+                self._objects = S3ObjectStore(SCREENSHOT_S3_BUCKET, SCREENSHOT_S3_ENDPOINT_URL, SCREENSHOT_S3_PREFIX)
+            else:
+                self._objects = LocalObjectStore(SCREENSHOT_STORAGE_DIR)
+        return self._objects
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.thumbnail_workers, thread_name_prefix="thumbnail"
+            )
+        return self._executor
+
+    @staticmethod
+    def thumbnail_key(screenshot_id: str) -> str:
+        return f"thumbnails/{screenshot_id}.jpg"
+
+    async def save(self, db: AsyncIOMotorDatabase, request: Request, field: str = "screenshot") -> Dict:
+        """Stream a multipart upload to storage; identical content is stored once"""
+        spool = UploadSpool(self.max_bytes)
+        try:
+            await read_multipart_file(request, field, spool)
+            screenshot_id = await asyncio.to_thread(spool.finish)
+        except Exception:
+            spool.discard()
+            self._stats["rejected"] += 1
+            raise
+        content_type, ext = spool.kind
+        size = spool.size
+        tmp_path = spool.path
+
+        key = f"{screenshot_id}.{ext}"
+        try:
+            if not await self.objects.exists(key):
+                await self.objects.put_file(key, tmp_path, content_type)
+            now = datetime.utcnow()
+            before = await db[COLLECTION].find_one_and_update(
+                {"_id": screenshot_id},
+                {
+                    "$setOnInsert": {
+                        "key": key,
+                        "content_type": content_type,
+                        "size": size,
+                        "thumbnail_status": "pending",
+                        "created_at": now,
+                    },
+                    "$set": {"last_uploaded_at": now},
+                    "$inc": {"uploads": 1},
+                },
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+            )
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+        duplicate = before is not None
+        if duplicate and (before.get("thumbnail_status") == "ready" or screenshot_id in self._thumbnailing):
+            os.unlink(tmp_path)
+            self._stats["duplicates"] += 1
+        else:
+            self._schedule_thumbnail(db, screenshot_id, tmp_path)
+        self._stats["uploads"] += 1
+
+        return {
+            "screenshot_id": screenshot_id,
+            "content_type": content_type,
+            "size": size,
+            "duplicate": duplicate,
+        }
+
+    def _schedule_thumbnail(self, db: AsyncIOMotorDatabase, screenshot_id: str, src_path: str):
+        self._thumbnailing.add(screenshot_id)
+        task = asyncio.create_task(self._thumbnail(db, screenshot_id, src_path))
+        self._tasks.add(task)
+
+        def done(task):
+            self._tasks.discard(task)
+            self._thumbnailing.discard(screenshot_id)
+        task.add_done_callback(done)
+
+    async def _thumbnail(self, db: AsyncIOMotorDatabase, screenshot_id: str, src_path: str):
+        dst_path = src_path + ".thumb.jpg"
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, make_thumbnail, src_path, dst_path)
+            await self.objects.put_file(self.thumbnail_key(screenshot_id), dst_path, "image/jpeg")
+            await db[COLLECTION].update_one({"_id": screenshot_id}, {"$set": {"thumbnail_status": "ready"}})
+            self._stats["thumbnails"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Thumbnail for screenshot {screenshot_id} failed: {e}")
+            self._stats["thumbnail_failures"] += 1
+            await db[COLLECTION].update_one({"_id": screenshot_id}, {"$set": {"thumbnail_status": "failed"}})
+        finally:
+            for path in (src_path, dst_path):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    async def resolve(self, db: AsyncIOMotorDatabase, screenshot_id: str, thumbnail: bool = False) -> Optional[Tuple[str, str]]:
+        """(object key, content type) for a screenshot; the original until its thumbnail is ready"""
+        doc = await db[COLLECTION].find_one(
+            {"_id": screenshot_id}, {"key": 1, "content_type": 1, "thumbnail_status": 1}
+        )
+        if doc is None:
+            return None
+        if thumbnail and doc.get("thumbnail_status") == "ready":
+            return self.thumbnail_key(screenshot_id), "image/jpeg"
+        return doc["key"], doc["content_type"]
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.backend_name,
+            "max_bytes": self.max_bytes,
+            "thumbnail_workers": self.thumbnail_workers,
+            "thumbnails_in_progress": len(self._tasks),
+            **self._stats,
+        }
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._objects is not None:
+            self._objects.close()
+
+
+screenshot_store = ScreenshotStore()
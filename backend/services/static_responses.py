@@ -0,0 +1,88 @@
+from datetime import datetime, timezone
+from fastapi import Request, Response
+from typing import Callable, Dict, Optional
+import hashlib
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Browsers revalidate with If-None-Match once this expires
+STATIC_RESPONSE_MAX_AGE_SECONDS = int(os.environ.get('STATIC_RESPONSE_MAX_AGE_SECONDS', '300'))
+
+
+class StaticEntry:
+    __slots__ = ("body", "etag", "built_at")
+
+    def __init__(self, body: bytes, built_at: datetime):
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.built_at = built_at
+
+
+class StaticResponseRegistry:
+    """Config-backed responses serialized once and served with strong ETags"""
+
+    def __init__(self, max_age: int = STATIC_RESPONSE_MAX_AGE_SECONDS):
+        self.cache_control = f"public, max-age={max_age}"
+        self._builders: Dict[str, Callable[[], dict]] = {}
+        self._entries: Dict[str, StaticEntry] = {}
+        self._not_modified = 0
+        self._served = 0
+
+    def register(self, name: str, builder: Callable[[], dict]):
+        """Register a payload builder; it runs now and again on every refresh()"""
+        self._builders[name] = builder
+        self._build(name)
+
+    def _build(self, name: str) -> StaticEntry:
+        payload = self._builders[name]()
+        body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode()
+        entry = StaticEntry(body, datetime.now(timezone.utc))
+        previous = self._entries.get(name)
+        self._entries[name] = entry
+        if previous is not None and previous.etag != entry.etag:
+            logger.info(f"Static response {name} changed: {previous.etag} -> {entry.etag}")
+        return entry
+
+    def refresh(self, name: Optional[str] = None) -> Dict[str, str]:
+        """Rebuild one or all registered responses after a config change"""
+        names = [name] if name else list(self._builders)
+        return {n: self._build(n).etag for n in names}
+
+    def _matches(self, entry: StaticEntry, if_none_match: Optional[str]) -> bool:
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        # If-None-Match uses weak comparison, so W/"x" matches "x"
+        tags = (t.strip().removeprefix("W/") for t in if_none_match.split(","))
+        return entry.etag in tags
+
+    def respond(self, name: str, request: Request) -> Response:
+        entry = self._entries[name]
+        headers = {"ETag": entry.etag, "Cache-Control": self.cache_control}
+        if self._matches(entry, request.headers.get("if-none-match")):
+            self._not_modified += 1
+            return Response(status_code=304, headers=headers)
+        self._served += 1
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    def stats(self) -> Dict:
+        return {
+            "cache_control": self.cache_control,
+            "served": self._served,
+            "not_modified": self._not_modified,
+            "entries": {
+                name: {
+                    "etag": entry.etag,
+                    "bytes": len(entry.body),
+                    "built_at": entry.built_at.isoformat(),
+                }
+                for name, entry in self._entries.items()
+            },
+        }
+
+
+static_responses = StaticResponseRegistry()
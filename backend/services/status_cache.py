@@ -0,0 +1,162 @@
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import json
+import time
+import os
+import logging
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional dependency
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+# "local" keeps entries per worker; "redis" shares them across workers
+STATUS_CACHE_BACKEND = os.environ.get('STATUS_CACHE_BACKEND', 'local')
+REDIS_URL = os.environ.get('REDIS_URL', '')
+STATUS_CACHE_TTL_SECONDS = float(os.environ.get('STATUS_CACHE_TTL_SECONDS', '3'))
+# Paid is terminal, so it can be cached much longer
+STATUS_CACHE_PAID_TTL_SECONDS = float(os.environ.get('STATUS_CACHE_PAID_TTL_SECONDS', '300'))
+STATUS_CACHE_MAX_ENTRIES = int(os.environ.get('STATUS_CACHE_MAX_ENTRIES', '10000'))
+
+
+class LocalCacheBackend:
+    """In-process TTL cache; also the stand-in for Redis in tests and benchmarks"""
+
+    def __init__(self, max_entries: int = STATUS_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        return value
+
+    async def set(self, key: str, value: dict, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    async def close(self):
+        self._entries.clear()
+
+
+class RedisCacheBackend:
+    """Redis-backed cache shared by all workers"""
+
+    def __init__(self, url: str):
+        if aioredis is None:
+            raise RuntimeError("redis package is not installed")
+        self._redis = aioredis.from_url(url)
+
+    async def get(self, key: str) -> Optional[dict]:
+        raw = await self._redis.get(key)
+        return json.loads(raw) if raw else None
+
+    async def set(self, key: str, value: dict, ttl: float):
+        await self._redis.set(key, json.dumps(value), px=int(ttl * 1000))
+
+    async def delete(self, key: str):
+        await self._redis.delete(key)
+
+    async def close(self):
+        await self._redis.close()
+
+
+class StatusCache:
+    """Short-TTL status cache with per-key request coalescing"""
+
+    def __init__(self, backend, prefix: str, ttl: float, paid_ttl: float):
+        self.backend = backend
+        self.prefix = prefix
+        self.ttl = ttl
+        self.paid_ttl = paid_ttl
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Bumped by invalidate() while a load is in flight so it cannot re-cache stale data
+        self._generations: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[dict]]) -> dict:
+        cache_key = self._key(key)
+        cached = await self.backend.get(cache_key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        inflight = self._inflight.get(cache_key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting on a failed load; don't warn about it
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[cache_key] = future
+        self._generations[cache_key] = 0
+        try:
+            value = await loader()
+            if self._generations.get(cache_key) == 0:
+                ttl = self.paid_ttl if value.get("payment_status") == "paid" else self.ttl
+                await self.backend.set(cache_key, value, ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(cache_key, None)
+            self._generations.pop(cache_key, None)
+
+    async def invalidate(self, key: str):
+        cache_key = self._key(key)
+        if cache_key in self._generations:
+            self._generations[cache_key] += 1
+        await self.backend.delete(cache_key)
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
+
+    async def close(self):
+        await self.backend.close()
+
+
+def _build_backend():
+    if STATUS_CACHE_BACKEND == "redis":
+        if REDIS_URL and aioredis is not None:
+            return RedisCacheBackend(REDIS_URL)
+        logger.warning("Redis status cache requested but unavailable, using local cache")
+    return LocalCacheBackend()
+
+
+stripe_status_cache = StatusCache(
+    _build_backend(),
+    prefix="stripe-status",
+    ttl=STATUS_CACHE_TTL_SECONDS,
+    paid_ttl=STATUS_CACHE_PAID_TTL_SECONDS,
+)
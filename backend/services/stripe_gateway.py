@@ -0,0 +1,150 @@
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Optional
+import importlib
+import os
+import logging
+
+if TYPE_CHECKING:
+    from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionRequest
+    import requests
+
+from services import metrics
+from services import gateway_simulators
+
+logger = logging.getLogger(__name__)
+
+STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY', 'sk_test_emergent')
+STRIPE_TIMEOUT_SECONDS = float(os.environ.get('STRIPE_TIMEOUT_SECONDS', '30'))
+STRIPE_MAX_NETWORK_RETRIES = int(os.environ.get('STRIPE_MAX_NETWORK_RETRIES', '2'))
+STRIPE_POOL_MAXSIZE = int(os.environ.get('STRIPE_POOL_MAXSIZE', '20'))
+# Checkout clients are cached per webhook URL (one per frontend origin)
+STRIPE_MAX_ORIGINS = int(os.environ.get('STRIPE_MAX_ORIGINS', '32'))
+
+WEBHOOK_PATH = "/api/payments/stripe/webhook"
+
+# Imported on first use (or by preload_sdks()), not when the app boots
+SDK_MODULES = ("stripe", "requests", "emergentintegrations.payments.stripe.checkout")
+
+
+class StripeGateway:
+    """Process-wide Stripe access sharing one keep-alive HTTP pool"""
+
+    def __init__(
+        self,
+        api_key: str,
+        timeout: float = STRIPE_TIMEOUT_SECONDS,
+        max_network_retries: int = STRIPE_MAX_NETWORK_RETRIES,
+        pool_maxsize: int = STRIPE_POOL_MAXSIZE,
+        max_origins: int = STRIPE_MAX_ORIGINS,
+        checkout_factory: Optional[Callable[..., "StripeCheckout"]] = None,
+        request_factory: Optional[Callable[..., "CheckoutSessionRequest"]] = None,
+        simulated: bool = False,
+    ):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_network_retries = max_network_retries
+        self.pool_maxsize = pool_maxsize
+        self.max_origins = max_origins
+        self.checkout_factory = checkout_factory
+        self.request_factory = request_factory
+        # Simulated gateways never load the Stripe SDK stack
+        self.simulated = simulated
+        self._session: Optional["requests.Session"] = None
+        self._checkouts: "OrderedDict[str, StripeCheckout]" = OrderedDict()
+
+    def _configure_http(self):
+        """Install a pooled HTTP client for every Stripe SDK call in this process"""
+        if self._session is not None:
+            return
+        import requests
+        import stripe
+        from requests.adapters import HTTPAdapter
+
+        # Retries are left to the Stripe SDK (it knows which requests are safe to repeat)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize, max_retries=0)
+        self._session.mount("https://", adapter)
+
+        stripe.default_http_client = stripe.RequestsClient(
+            timeout=self.timeout,
+            session=self._session,
+            async_fallback_client=stripe.HTTPXClient(timeout=self.timeout),
+        )
+        stripe.max_network_retries = self.max_network_retries
+
+    @staticmethod
+    def webhook_url_for(origin_url: Optional[str]) -> str:
+        if not origin_url:
+            return ""
+        return f"{origin_url.rstrip('/')}{WEBHOOK_PATH}"
+
+    def checkout(self, origin_url: Optional[str] = None) -> "StripeCheckout":
+        """Cached StripeCheckout for the given frontend origin"""
+        if not self.simulated:
+            self._configure_http()
+        webhook_url = self.webhook_url_for(origin_url)
+
+        checkout = self._checkouts.get(webhook_url)
+        if checkout is not None:
+            self._checkouts.move_to_end(webhook_url)
+            return checkout
+
+        if self.checkout_factory is None:
+            from emergentintegrations.payments.stripe.checkout import StripeCheckout
+            self.checkout_factory = StripeCheckout
+        checkout = self.checkout_factory(api_key=self.api_key, webhook_url=webhook_url)
+        self._checkouts[webhook_url] = checkout
+        if len(self._checkouts) > self.max_origins:
+            self._checkouts.popitem(last=False)
+        return checkout
+
+    def session_request(self, **fields) -> "CheckoutSessionRequest":
+        if self.request_factory is None:
+            from emergentintegrations.payments.stripe.checkout import CheckoutSessionRequest
+            self.request_factory = CheckoutSessionRequest
+        return self.request_factory(**fields)
+
+    async def create_checkout_session(self, origin_url: str, request: "CheckoutSessionRequest"):
+        with metrics.time_gateway("stripe", "create_checkout_session"):
+            return await self.checkout(origin_url).create_checkout_session(request)
+
+    async def get_checkout_status(self, session_id: str):
+        with metrics.time_gateway("stripe", "get_checkout_status"):
+            return await self.checkout().get_checkout_status(session_id)
+
+    async def handle_webhook(self, payload: bytes, signature: Optional[str]):
+        with metrics.time_gateway("stripe", "handle_webhook"):
+            return await self.checkout().handle_webhook(payload, signature)
+
+    def stats(self) -> dict:
+        return {
+            "timeout_seconds": self.timeout,
+            "max_network_retries": self.max_network_retries,
+            "pool_maxsize": self.pool_maxsize,
+            "cached_origins": len(self._checkouts),
+            "simulated": gateway_simulators.SIMULATED,
+            "sdk_loaded": self._session is not None,
+        }
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+        self._checkouts.clear()
+
+
+def preload_sdks():
+    """Import the Stripe SDK stack ahead of the first checkout (blocking)"""
+    for module in SDK_MODULES:
+        importlib.import_module(module)
+
+
+if gateway_simulators.SIMULATED:
+    stripe_gateway = StripeGateway(
+        "sk_test_simulated",
+        checkout_factory=lambda **kwargs: gateway_simulators.stripe_checkout,
+        request_factory=gateway_simulators.CheckoutSessionRequest,
+        simulated=True,
+    )
+else:
+    stripe_gateway = StripeGateway(STRIPE_API_KEY)
@@ -0,0 +1,374 @@
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from typing import Dict, Optional, Tuple
+import asyncio
+import hmac
+import math
+import os
+import time
+import logging
+
+from services import metrics
+from services.entitlements import entitlements, normalize_email
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "usage_monthly"
+USAGE_METERING_ENABLED = os.environ.get('USAGE_METERING_ENABLED', 'true').lower() == 'true'
+# Increments are summed in memory and $inc'ed into Mongo this often
+USAGE_FLUSH_SECONDS = float(os.environ.get('USAGE_FLUSH_SECONDS', '2'))
+# How long a flushed total is trusted before re-reading it (bounds how late other workers' usage shows up)
+USAGE_SNAPSHOT_TTL_SECONDS = float(os.environ.get('USAGE_SNAPSHOT_TTL_SECONDS', '15'))
+USAGE_SNAPSHOT_CACHE_SIZE = int(os.environ.get('USAGE_SNAPSHOT_CACHE_SIZE', '50000'))
+USAGE_TOKEN_ENCODING = os.environ.get('USAGE_TOKEN_ENCODING', 'cl100k_base')
+# Shared secret the tool backends send as X-Service-Token; the meter endpoint is off without it
+USAGE_SERVICE_TOKEN = os.environ.get('USAGE_SERVICE_TOKEN', '')
+# Retry a tokenizer that failed to load (e.g. no network for the encoding file) after this long.
+# tiktoken downloads the file into its own cache: TIKTOKEN_CACHE_DIR if the operator sets it, else the temp dir
+TOKENIZER_RETRY_SECONDS = 300
+
+# Quotas are "words/month": usage is bucketed per user per UTC calendar month
+MONTH_FORMAT = "%Y-%m"
+TOTALS = ("words", "tokens", "requests")
+
+UsageKey = Tuple[str, str]
+
+usage_flushes = metrics.registry.histogram(
+    "usage_flush_duration_seconds", "Usage counter $inc flush latency", ("outcome",)
+)
+quota_decisions = metrics.registry.counter(
+    "usage_quota_decisions", "Word-quota checks by outcome", ("decision",)
+)
+
+
+def current_month(now: Optional[datetime] = None) -> str:
+    return (now or datetime.utcnow()).strftime(MONTH_FORMAT)
+
+
+def usage_id(key: UsageKey) -> str:
+    return "|".join(key)
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+class TokenCounter:
+    """tiktoken counts; the encoding loads on a thread, with a chars/4 estimate until it is there"""
+
+    def __init__(self, encoding_name: str = USAGE_TOKEN_ENCODING):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._loading = False
+        self._failed_at: Optional[float] = None
+        self._warned = False
+
+    @property
+    def exact(self) -> bool:
+        return self._encoding is not None
+
+    def _load(self):
+        try:
+            # Imported here: tiktoken and its encoding file are too heavy for boot
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(self.encoding_name)
+            logger.info(f"tiktoken encoding {self.encoding_name} loaded")
+        except Exception as e:
+            self._failed_at = time.monotonic()
+            # Retries keep failing the same way without network; say so once
+            log = logger.debug if self._warned else logger.warning
+            self._warned = True
+            log(f"tiktoken encoding {self.encoding_name} unavailable, estimating tokens at 4 chars each: {e}")
+        finally:
+            self._loading = False
+
+    def preload(self):
+        """Start loading the encoding in the background (needs a running loop)"""
+        if self._encoding is not None or self._loading:
+            return
+        if self._failed_at is not None and time.monotonic() - self._failed_at < TOKENIZER_RETRY_SECONDS:
+            return
+        self._loading = True
+        asyncio.get_running_loop().run_in_executor(None, self._load)
+
+    def count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode_ordinary(text))
+        self.preload()
+        return math.ceil(len(text) / 4)
+
+
+def service_token_valid(token: Optional[str]) -> bool:
+    """Constant-time check of a caller's X-Service-Token against USAGE_SERVICE_TOKEN"""
+    if not USAGE_SERVICE_TOKEN or not token:
+        return False
+    return hmac.compare_digest(USAGE_SERVICE_TOKEN.encode(), token.encode("utf-8", "surrogatepass"))
+
+
+def _add_into(target: Dict, increments: Dict[str, int]):
+    """Apply flat "a.b.c" increments to a nested totals document"""
+    for path, amount in increments.items():
+        node = target
+        *parents, leaf = path.split(".")
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = node.get(leaf, 0) + amount
+
+
+class UsageMeter:
+    """Per-user monthly word/token counters, aggregated in memory and flushed in batches.
+
+    record() is a few dict updates; nothing touches Mongo until the next flush,
+    which $inc's every user touched since the last one in a single bulk write.
+    Quota checks add this worker's unflushed counts to the last flushed total.
+    """
+
+    def __init__(
+        self,
+        flush_seconds: float = USAGE_FLUSH_SECONDS,
+        snapshot_ttl: float = USAGE_SNAPSHOT_TTL_SECONDS,
+        snapshot_cache_size: int = USAGE_SNAPSHOT_CACHE_SIZE,
+    ):
+        self.flush_seconds = flush_seconds
+        self.snapshot_ttl = snapshot_ttl
+        self.snapshot_cache_size = snapshot_cache_size
+        self.tokens = TokenCounter()
+        self._pending: Dict[UsageKey, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        # Swapped out of _pending and still being written; counted as local until the write lands
+        self._flushing: Dict[UsageKey, Dict[str, int]] = {}
+        # key -> (flushed totals document, monotonic expiry)
+        self._snapshots: "OrderedDict[UsageKey, Tuple[Dict, float]]" = OrderedDict()
+        # Bumped by every flush; a snapshot read that raced with one is not cached
+        self._flush_generation = 0
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.counters = {
+            "recorded": 0,
+            "estimated_token_counts": 0,
+            "flushes": 0,
+            "flushed_docs": 0,
+            "flush_errors": 0,
+            "snapshot_hits": 0,
+            "snapshot_misses": 0,
+            "quota_exceeded": 0,
+        }
+
+    # ---- counting ----
+
+    def record(self, email: str, tool: str, words: int, tokens: int = 0, now: Optional[datetime] = None):
+        """Count one use of `tool`; O(1), no I/O"""
+        bucket = self._pending[(email, current_month(now))]
+        bucket["words"] += words
+        bucket["tokens"] += tokens
+        bucket["requests"] += 1
+        bucket[f"tools.{tool}.words"] += words
+        bucket[f"tools.{tool}.tokens"] += tokens
+        bucket[f"tools.{tool}.requests"] += 1
+        self.counters["recorded"] += 1
+
+    def _local(self, key: UsageKey) -> Dict[str, int]:
+        local: Dict = {}
+        for source in (self._flushing, self._pending):
+            increments = source.get(key)
+            if increments:
+                _add_into(local, increments)
+        return local
+
+    # ---- flushed totals ----
+
+    async def _flushed_totals(self, db: AsyncIOMotorDatabase, key: UsageKey) -> Dict:
+        entry = self._snapshots.get(key)
+        if entry is not None and entry[1] >= time.monotonic():
+            self._snapshots.move_to_end(key)
+            self.counters["snapshot_hits"] += 1
+            return entry[0]
+
+        self.counters["snapshot_misses"] += 1
+        generation = self._flush_generation
+        doc = await db[COLLECTION].find_one(
+            {"_id": usage_id(key)}, {"_id": 0, "words": 1, "tokens": 1, "requests": 1, "tools": 1}
+        ) or {}
+        if generation == self._flush_generation:
+            self._snapshots[key] = (doc, time.monotonic() + self.snapshot_ttl)
+            self._snapshots.move_to_end(key)
+            while len(self._snapshots) > self.snapshot_cache_size:
+                self._snapshots.popitem(last=False)
+        return doc
+
+    async def usage(self, db: AsyncIOMotorDatabase, email: str, month: Optional[str] = None) -> Dict:
+        """Month-to-date totals: last flushed value plus this worker's unflushed counts"""
+        key = (email, month or current_month())
+        totals: Dict = {}
+        _add_into(totals, self._flatten(await self._flushed_totals(db, key)))
+        _add_into(totals, self._flatten(self._local(key)))
+        return {
+            "user_email": email,
+            "month": key[1],
+            **{field: totals.get(field, 0) for field in TOTALS},
+            "tools": totals.get("tools", {}),
+        }
+
+    @staticmethod
+    def _flatten(doc: Dict, prefix: str = "") -> Dict[str, int]:
+        flat = {}
+        for name, value in doc.items():
+            if isinstance(value, dict):
+                flat.update(UsageMeter._flatten(value, f"{prefix}{name}."))
+            else:
+                flat[f"{prefix}{name}"] = value
+        return flat
+
+    # ---- metering with quota ----
+
+    async def meter(
+        self,
+        db: AsyncIOMotorDatabase,
+        email: str,
+        tool: str,
+        text: Optional[str] = None,
+        words: Optional[int] = None,
+        tokens: Optional[int] = None,
+        enforce: bool = True,
+    ) -> Dict:
+        """Count a piece of generated/processed text against the user's monthly word quota.
+
+        Raises 402 when it would take the user over their plan's words_per_month.
+        """
+        email = normalize_email(email)
+        if email is None:
+            raise HTTPException(status_code=400, detail="A user email is required for metering")
+        if text is not None:
+            # The text is the source of truth; caller-supplied counts only stand in for it
+            words = count_words(text)
+            tokens = self.tokens.count(text)
+            if text and not self.tokens.exact:
+                self.counters["estimated_token_counts"] += 1
+        else:
+            words = words or 0
+            tokens = tokens or 0
+
+        plan = await entitlements.lookup(db, email)
+        limit = plan["limits"].get("words_per_month")
+        key = (email, current_month())
+        flushed = (await self._flushed_totals(db, key)).get("words", 0)
+        # No await from here on, so concurrent requests in this worker see each other's counts
+        used = flushed + self._local(key).get("words", 0)
+        if enforce and limit is not None and used + words > limit:
+            self.counters["quota_exceeded"] += 1
+            quota_decisions.labels("exceeded").inc()
+            raise HTTPException(
+                status_code=402,
+                detail={
+                    "message": f"Monthly word quota of the {plan['plan_name']} plan exceeded",
+                    "plan": plan["plan"],
+                    "limit": limit,
+                    "used": used,
+                    "requested": words,
+                }
+            )
+        quota_decisions.labels("unlimited" if limit is None else "allowed").inc()
+        self.record(email, tool, words, tokens)
+        used += words
+        return {
+            "plan": plan["plan"],
+            "month": key[1],
+            "words": words,
+            "tokens": tokens,
+            "tokens_exact": self.tokens.exact,
+            "used": used,
+            "limit": limit,
+            "remaining": None if limit is None else max(limit - used, 0),
+        }
+
+    # ---- flushing ----
+
+    async def flush(self):
+        """$inc every user's pending counts into their monthly document"""
+        if self._db is None or not self._pending:
+            return
+        async with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+            self._flushing = pending
+            keys = list(pending)
+            ops = [
+                UpdateOne(
+                    {"_id": usage_id(key)},
+                    {
+                        "$inc": dict(pending[key]),
+                        "$setOnInsert": {"user_email": key[0], "month": key[1]},
+                        "$currentDate": {"updated_at": True},
+                    },
+                    upsert=True,
+                )
+                for key in keys
+            ]
+            failed = set()
+            try:
+                with metrics.time_outcome(usage_flushes):
+                    await self._db[COLLECTION].bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                # Unordered: every op not listed in writeErrors was applied, and
+                # re-sending an applied $inc would count it twice
+                self.counters["flush_errors"] += 1
+                failed = {error["index"] for error in (e.details or {}).get("writeErrors") or []}
+                logger.error(f"Usage flush: {len(failed)} of {len(ops)} docs failed, re-queued: {e}")
+            except PyMongoError as e:
+                self.counters["flush_errors"] += 1
+                failed = set(range(len(ops)))
+                logger.error(f"Usage flush failed ({len(ops)} docs): {e}")
+            finally:
+                self._flushing = {}
+
+            self.counters["flushes"] += 1
+            self.counters["flushed_docs"] += len(ops) - len(failed)
+            for index, key in enumerate(keys):
+                increments = pending[key]
+                if index in failed:
+                    # Put the increments back; the next flush retries them
+                    for field, amount in increments.items():
+                        self._pending[key][field] += amount
+                    continue
+                # Cached totals move forward by exactly what was written
+                entry = self._snapshots.get(key)
+                if entry is not None:
+                    _add_into(entry[0], increments)
+            self._flush_generation += 1
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._db = db
+        self._task = asyncio.create_task(self._flush_loop())
+        self.tokens.preload()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": USAGE_METERING_ENABLED,
+            "pending_users": len(self._pending),
+            "cached_snapshots": len(self._snapshots),
+            "flush_seconds": self.flush_seconds,
+            "token_encoding": self.tokens.encoding_name,
+            "tokens_exact": self.tokens.exact,
+            **self.counters,
+        }
+
+
+usage_meter = UsageMeter()
+metrics.registry.gauge(
+    "usage_pending_users", "Users with unflushed usage counts in this process"
+).set_function(lambda: len(usage_meter._pending))
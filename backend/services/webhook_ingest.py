@@ -0,0 +1,223 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import os
+import logging
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', '4'))
+WEBHOOK_QUEUE_SIZE = int(os.environ.get('WEBHOOK_QUEUE_SIZE', '10000'))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', '5'))
+WEBHOOK_RETRY_BASE_SECONDS = float(os.environ.get('WEBHOOK_RETRY_BASE_SECONDS', '1'))
+# Event ids remembered per worker so retried deliveries skip the DB entirely
+WEBHOOK_SEEN_CACHE_SIZE = int(os.environ.get('WEBHOOK_SEEN_CACHE_SIZE', '50000'))
+# Events still "received" after this long were lost (crash/full queue) and are replayed
+WEBHOOK_RECOVERY_AFTER_SECONDS = int(os.environ.get('WEBHOOK_RECOVERY_AFTER_SECONDS', '60'))
+
+COLLECTION = "webhook_events"
+
+EventHandler = Callable[[AsyncIOMotorDatabase, dict], Awaitable[None]]
+
+
+class WebhookIngestor:
+    """Durable, deduplicated webhook intake with background processing"""
+
+    def __init__(
+        self,
+        workers: int = WEBHOOK_WORKERS,
+        queue_size: int = WEBHOOK_QUEUE_SIZE,
+        max_attempts: int = WEBHOOK_MAX_ATTEMPTS,
+        seen_cache_size: int = WEBHOOK_SEEN_CACHE_SIZE,
+    ):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.seen_cache_size = seen_cache_size
+        self._handlers: Dict[str, EventHandler] = {}
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self.counters = {
+            "accepted": 0,
+            "duplicates": 0,
+            "processed": 0,
+            "retried": 0,
+            "failed": 0,
+            "deferred": 0,
+        }
+
+    def register(self, gateway: str, handler: EventHandler):
+        """Set the function that applies a gateway's events to our records"""
+        self._handlers[gateway] = handler
+
+    @staticmethod
+    def event_key(gateway: str, event_id: str) -> str:
+        return f"{gateway}:{event_id}"
+
+    def _remember(self, key: str):
+        self._seen[key] = None
+        self._seen.move_to_end(key)
+        if len(self._seen) > self.seen_cache_size:
+            self._seen.popitem(last=False)
+
+    async def ingest(self, db: AsyncIOMotorDatabase, gateway: str, event_id: str, event_type: str, data: dict) -> str:
+        """Record the event and queue it; returns "accepted" or "duplicate" """
+        key = self.event_key(gateway, event_id)
+        if key in self._seen:
+            self.counters["duplicates"] += 1
+            return "duplicate"
+
+        try:
+            await db[COLLECTION].insert_one({
+                "_id": key,
+                "gateway": gateway,
+                "event_id": event_id,
+                "event_type": event_type,
+                "data": data,
+                "status": "received",
+                "attempts": 0,
+                "received_at": datetime.utcnow(),
+            })
+        except DuplicateKeyError:
+            self._remember(key)
+            self.counters["duplicates"] += 1
+            return "duplicate"
+
+        self._remember(key)
+        self.counters["accepted"] += 1
+        self._enqueue(key)
+        return "accepted"
+
+    def _enqueue(self, key: str, delay: float = 0):
+        if self._queue is None:
+            # Not started (e.g. running without the lifespan); recovery will pick it up
+            self.counters["deferred"] += 1
+            return
+        if delay:
+            asyncio.get_running_loop().call_later(delay, self._enqueue, key)
+            return
+        try:
+            self._queue.put_nowait(key)
+        except asyncio.QueueFull:
+            self.counters["deferred"] += 1
+            logger.warning(f"Webhook queue full, {key} left for recovery")
+
+    async def _process(self, key: str):
+        db = self._db
+        event = await db[COLLECTION].find_one_and_update(
+            {"_id": key, "status": {"$in": ["received", "retrying"]}},
+            {"$set": {"status": "processing", "processing_at": datetime.utcnow()}, "$inc": {"attempts": 1}},
+        )
+        if event is None:
+            return  # already handled by another worker
+
+        handler = self._handlers.get(event["gateway"])
+        attempts = event["attempts"] + 1
+        try:
+            if handler is not None:
+                with metrics.time_outcome(metrics.webhook_processing_duration, event["gateway"]):
+                    await handler(db, event["data"])
+            await db[COLLECTION].update_one(
+                {"_id": key},
+                {"$set": {"status": "processed", "processed_at": datetime.utcnow()}},
+            )
+            self.counters["processed"] += 1
+        except Exception as e:
+            if attempts >= self.max_attempts:
+                status = "failed"
+                self.counters["failed"] += 1
+                logger.error(f"Webhook {key} failed after {attempts} attempts: {e}")
+            else:
+                status = "retrying"
+                self.counters["retried"] += 1
+                logger.warning(f"Webhook {key} attempt {attempts} failed, retrying: {e}")
+            await db[COLLECTION].update_one(
+                {"_id": key},
+                {"$set": {"status": status, "last_error": str(e)}},
+            )
+            if status == "retrying":
+                self._enqueue(key, delay=WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+    async def _worker(self):
+        while True:
+            key = await self._queue.get()
+            try:
+                await self._process(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Webhook {key} could not be processed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def recover(self) -> int:
+        """Re-queue events that were logged but never finished processing"""
+        cutoff = datetime.utcnow() - timedelta(seconds=WEBHOOK_RECOVERY_AFTER_SECONDS)
+        # Reset stuck "processing" events first (their worker died mid-flight)
+        await self._db[COLLECTION].update_many(
+            {"status": "processing", "processing_at": {"$lt": cutoff}},
+            {"$set": {"status": "retrying"}},
+        )
+        count = 0
+        cursor = self._db[COLLECTION].find(
+            {"status": {"$in": ["received", "retrying"]}, "received_at": {"$lt": cutoff}},
+            {"_id": 1},
+        ).limit(self.queue_size)
+        async for event in cursor:
+            self._enqueue(event["_id"])
+            count += 1
+        if count:
+            logger.info(f"Recovered {count} unprocessed webhook events")
+        return count
+
+    async def _recovery_loop(self):
+        while True:
+            try:
+                await self.recover()
+            except PyMongoError as e:
+                logger.warning(f"Webhook recovery scan failed: {e}")
+            await asyncio.sleep(WEBHOOK_RECOVERY_AFTER_SECONDS)
+
+    async def replay(self, key: str) -> bool:
+        """Manually re-run a failed (or any finished) event"""
+        result = await self._db[COLLECTION].update_one(
+            {"_id": key, "status": {"$in": ["failed", "processed"]}},
+            {"$set": {"status": "retrying", "attempts": 0}},
+        )
+        if result.modified_count:
+            self._enqueue(key)
+        return bool(result.modified_count)
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._db = db
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._recovery_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "seen_cache": len(self._seen),
+            **self.counters,
+        }
+
+
+webhook_ingestor = WebhookIngestor()
+metrics.registry.gauge(
+    "webhook_queue_depth", "Webhook events waiting for a worker"
+).set_function(lambda: webhook_ingestor.stats()["queue_depth"])
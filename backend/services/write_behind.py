@@ -0,0 +1,214 @@
+from collections import deque
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from typing import Deque, Dict, List, Optional
+import asyncio
+import time
+import os
+import logging
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Off by default: buffered writes are lost if the process dies inside a flush window
+WRITE_BEHIND_ENABLED = os.environ.get('WRITE_BEHIND_ENABLED', 'false').lower() == 'true'
+WRITE_BEHIND_MAX_BATCH = int(os.environ.get('WRITE_BEHIND_MAX_BATCH', '500'))
+WRITE_BEHIND_FLUSH_MS = float(os.environ.get('WRITE_BEHIND_FLUSH_MS', '50'))
+# Past this many buffered writes, callers flush inline instead of queueing more
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get('WRITE_BEHIND_MAX_PENDING', '20000'))
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.environ.get('WRITE_BEHIND_MAX_ATTEMPTS', '3'))
+
+batch_size = metrics.registry.histogram(
+    "write_behind_batch_size", "Operations per write-behind bulk_write", ("collection",),
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+)
+flush_duration = metrics.registry.histogram(
+    "write_behind_flush_duration_seconds", "Write-behind bulk_write latency", ("collection", "outcome")
+)
+
+
+class _Buffer:
+    def __init__(self, collection: AsyncIOMotorCollection):
+        self.collection = collection
+        self.ops: Deque = deque()
+        # One flush per collection at a time keeps ops applied in the order they were queued
+        self.lock = asyncio.Lock()
+
+
+class WriteBehindBuffer:
+    """Groups non-critical inserts/updates into ordered bulk_write batches.
+
+    Writes are flushed every `flush_ms` or as soon as a collection has
+    `max_batch` queued. Anything that moves a payment to paid/verified must not
+    go through here: those paths write directly and call flush() first, so the
+    document they update is guaranteed to exist.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = WRITE_BEHIND_ENABLED,
+        max_batch: int = WRITE_BEHIND_MAX_BATCH,
+        flush_ms: float = WRITE_BEHIND_FLUSH_MS,
+        max_pending: int = WRITE_BEHIND_MAX_PENDING,
+        max_attempts: int = WRITE_BEHIND_MAX_ATTEMPTS,
+    ):
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.flush_interval = flush_ms / 1000
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._buffers: Dict[str, _Buffer] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.counters = {
+            "queued": 0,
+            "written": 0,
+            "batches": 0,
+            "retried": 0,
+            "dropped": 0,
+            "inline_flushes": 0,
+        }
+
+    @property
+    def pending(self) -> int:
+        return sum(len(buffer.ops) for buffer in self._buffers.values())
+
+    async def insert_one(self, collection: AsyncIOMotorCollection, document: dict):
+        if not self._running:
+            await collection.insert_one(document)
+            return
+        await self._queue(collection, InsertOne(document))
+
+    async def update_one(self, collection: AsyncIOMotorCollection, filter: dict, update: dict):
+        if not self._running:
+            await collection.update_one(filter, update)
+            return
+        await self._queue(collection, UpdateOne(filter, update))
+
+    @property
+    def _running(self) -> bool:
+        return self._task is not None
+
+    async def _queue(self, collection: AsyncIOMotorCollection, op):
+        if self.pending >= self.max_pending:
+            self.counters["inline_flushes"] += 1
+            await self.flush(collection.name)
+
+        buffer = self._buffers.get(collection.name)
+        if buffer is None:
+            buffer = self._buffers[collection.name] = _Buffer(collection)
+        buffer.ops.append(op)
+        self.counters["queued"] += 1
+        if len(buffer.ops) >= self.max_batch:
+            self._wake.set()
+
+    async def flush(self, collection: Optional[str] = None):
+        """Write everything queued so far (for one collection, or all of them)"""
+        names = [collection] if collection else list(self._buffers)
+        for name in names:
+            buffer = self._buffers.get(name)
+            # Take the lock even when empty: a batch popped by the flusher may still be in flight
+            if buffer is not None:
+                await self._flush_buffer(name, buffer)
+
+    async def _flush_buffer(self, name: str, buffer: _Buffer):
+        async with buffer.lock:
+            while buffer.ops:
+                ops = [buffer.ops.popleft() for _ in range(min(self.max_batch, len(buffer.ops)))]
+                await self._write(name, buffer.collection, ops)
+
+    async def _write(self, name: str, collection: AsyncIOMotorCollection, ops: List):
+        batch_size.labels(name).observe(len(ops))
+        attempt = 0
+        while ops:
+            started = time.perf_counter()
+            try:
+                await collection.bulk_write(ops, ordered=True)
+                flush_duration.labels(name, "ok").observe(time.perf_counter() - started)
+                self.counters["batches"] += 1
+                self.counters["written"] += len(ops)
+                return
+            except BulkWriteError as e:
+                flush_duration.labels(name, "error").observe(time.perf_counter() - started)
+                write_errors = (e.details or {}).get("writeErrors") or []
+                if write_errors:
+                    # Ordered batch: everything before the failing op was applied; drop that
+                    # op (e.g. a duplicate key) and carry on with the rest
+                    failed = write_errors[0]
+                    index = failed["index"]
+                    self.counters["written"] += index
+                    self.counters["dropped"] += 1
+                    logger.error(f"Write-behind dropped a {name} write: {failed.get('errmsg')}")
+                    ops = ops[index + 1:]
+                    continue
+                # Only writeConcernErrors: retry like any other failure; inserts that
+                # did land come back as duplicate keys and are dropped above
+                attempt += 1
+                if not await self._backoff(name, ops, attempt, e):
+                    return
+            except PyMongoError as e:
+                flush_duration.labels(name, "error").observe(time.perf_counter() - started)
+                attempt += 1
+                if not await self._backoff(name, ops, attempt, e):
+                    return
+
+    async def _backoff(self, name: str, ops: List, attempt: int, error: Exception) -> bool:
+        """Wait before retrying a failed batch; False (batch dropped) once attempts run out"""
+        if attempt >= self.max_attempts:
+            self.counters["dropped"] += len(ops)
+            logger.error(f"Write-behind dropped {len(ops)} {name} writes after {attempt} attempts: {error}")
+            return False
+        self.counters["retried"] += 1
+        logger.warning(f"Write-behind flush of {name} failed (attempt {attempt}): {error}")
+        await asyncio.sleep(0.1 * 2 ** attempt)
+        return True
+
+    async def _flush_loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush error: {e}")
+
+    def start(self):
+        if not self.enabled:
+            return
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._flush_loop())
+        logger.info(f"Write-behind enabled (batch={self.max_batch}, window={self.flush_interval * 1000:g}ms)")
+
+    async def stop(self):
+        """Stop the flusher and write out whatever is still buffered"""
+        if self._task is None:
+            return
+        # Let an in-flight batch finish rather than cancelling it halfway
+        self._stopping = True
+        self._wake.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "running": self._running,
+            "max_batch": self.max_batch,
+            "flush_ms": self.flush_interval * 1000,
+            "pending": {name: len(buffer.ops) for name, buffer in self._buffers.items()},
+            **self.counters,
+        }
+
+
+write_behind = WriteBehindBuffer()
+metrics.registry.gauge(
+    "write_behind_pending", "Writes buffered and not yet flushed"
+).set_function(lambda: write_behind.pending)
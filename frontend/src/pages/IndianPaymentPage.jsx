@@ -23,6 +23,8 @@ export const IndianPaymentPage = () => {
   const [loading, setLoading] = useState(false);
   const [copied, setCopied] = useState('');
   const [showProofForm, setShowProofForm] = useState(false);
+  const [screenshot, setScreenshot] = useState(null);
+  const [uploadingScreenshot, setUploadingScreenshot] = useState(false);
 
   // Form data
   const [formData, setFormData] = useState({
@@ -68,6 +70,26 @@ export const IndianPaymentPage = () => {
     setTimeout(() => setCopied(''), 2000);
   };
 
+  const handleScreenshotChange = async (e) => {
+    const file = e.target.files?.[0];
+    if (!file) return;
+
+    const body = new FormData();
+    body.append('screenshot', file);
+    setUploadingScreenshot(true);
+    try {
+      const response = await axios.post(`${BACKEND_URL}/api/manual-payments/upload-screenshot`, body);
+      setScreenshot({ id: response.data.screenshot_id, name: file.name });
+      toast.success('Screenshot uploaded');
+    } catch (error) {
+      console.error('Error uploading screenshot:', error);
+      setScreenshot(null);
+      toast.error(error.response?.data?.detail || 'Failed to upload screenshot');
+    } finally {
+      setUploadingScreenshot(false);
+    }
+  };
+
   const handleSubmitProof = async () => {
     if (!formData.userName || !formData.userEmail) {
       toast.error('Please fill in all required fields');
@@ -83,6 +105,7 @@ export const IndianPaymentPage = () => {
         currency: 'INR',
         payment_method: selectedMethod,
         transaction_id: formData.transactionId,
+        screenshot_id: screenshot?.id,
         user_name: formData.userName,
         user_email: formData.userEmail,
         user_phone: formData.userPhone,
@@ -353,6 +376,24 @@ export const IndianPaymentPage = () => {
                 </p>
               </div>
 
+              <div>
+                <Label>Payment Screenshot (Optional)</Label>
+                <Input
+                  type="file"
+                  accept="image/png,image/jpeg,image/webp"
+                  onChange={handleScreenshotChange}
+                  disabled={uploadingScreenshot}
+                  className="mt-1"
+                />
+                <p className="text-xs text-muted-foreground mt-1">
+                  {uploadingScreenshot
+                    ? 'Uploading...'
+                    : screenshot
+                      ? <><Upload className="w-3 h-3 inline mr-1" />{screenshot.name} uploaded</>
+                      : 'PNG, JPEG or WebP, up to 5 MB'}
+                </p>
+              </div>
+
               <div>
                 <Label>Additional Notes (Optional)</Label>
                 <Textarea
@@ -381,7 +422,7 @@ export const IndianPaymentPage = () => {
                 </Button>
                 <Button
                   onClick={handleSubmitProof}
-                  disabled={loading}
+                  disabled={loading || uploadingScreenshot}
                   className="flex-1 bg-gradient-to-r from-cyan-600 to-blue-600 hover:from-cyan-700 hover:to-blue-700"
                 >
                   {loading ? 'Submitting...' : 'Submit for Verification'}
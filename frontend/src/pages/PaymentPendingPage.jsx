@@ -19,6 +19,19 @@ export const PaymentPendingPage = () => {
     }
   }, [orderId]);
 
+  // Wait for verification over Server-Sent Events instead of polling
+  useEffect(() => {
+    if (!orderId || !paymentData || paymentData.status !== 'pending') {
+      return undefined;
+    }
+    const source = new EventSource(`${BACKEND_URL}/api/manual-payments/payment-status/${orderId}/stream`);
+    source.addEventListener('status', (event) => {
+      setPaymentData(JSON.parse(event.data));
+      source.close();
+    });
+    return () => source.close();
+  }, [orderId, paymentData]);
+
   const checkPaymentStatus = async () => {
     try {
       const response = await axios.get(`${BACKEND_URL}/api/manual-payments/payment-status/${orderId}`);
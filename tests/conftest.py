@@ -0,0 +1,37 @@
+"""Shared fixtures: the real app on mongomock-motor with simulated gateways (see backend/benchmarks/harness.py)."""
+from pathlib import Path
+import sys
+import uuid
+
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR / "backend" / "benchmarks"))
+
+import harness  # noqa: E402  (puts backend/ on sys.path)
+
+# Configures the environment before any service module reads it at import time
+app = harness.load_app(gateway_latency=0.001)
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    """A fresh in-memory database per test"""
+    from mongomock_motor import AsyncMongoMockClient
+    return AsyncMongoMockClient()[f"test_{uuid.uuid4().hex[:8]}"]
+
+
+@pytest.fixture(scope="session")
+async def client():
+    """httpx client against the app; the lifespan runs once per test session"""
+    async with harness.running_app(app) as http:
+        yield http
+
+
+def unique_email(prefix: str = "user") -> str:
+    return f"{prefix}-{uuid.uuid4().hex[:8]}@example.com"
@@ -0,0 +1,213 @@
+from datetime import datetime, timedelta
+import asyncio
+
+import pytest
+
+import database
+from services import entitlements as entitlements_module
+from services.entitlements import Entitlements, FREE_PLAN, normalize_email
+from tests.conftest import unique_email
+
+pytestmark = pytest.mark.anyio
+
+PERIOD = timedelta(days=entitlements_module.ENTITLEMENT_PERIOD_DAYS)
+T0 = datetime(2026, 5, 1, 12, 0)
+
+
+def test_normalize_email():
+    assert normalize_email("  A@Example.COM ") == "a@example.com"
+    assert normalize_email("guest") is None
+    assert normalize_email("") is None
+    assert normalize_email(None) is None
+
+
+async def test_users_without_a_plan_get_the_free_plan(db):
+    plan = await Entitlements().lookup(db, unique_email())
+    assert plan["plan"] == FREE_PLAN["plan"]
+    assert plan["limits"]["words_per_month"] == entitlements_module.FREE_WORDS_PER_MONTH
+    assert plan["active"] is False
+
+
+async def test_grant_is_idempotent_per_payment(db):
+    store = Entitlements()
+    email = unique_email()
+    first = await store.grant(db, email, "starter", "stripe", "txn_1", at=T0)
+    again = await store.grant(db, email, "starter", "stripe", "txn_1", at=T0 + timedelta(days=1))
+    assert first["expires_at"] == again["expires_at"] == T0 + PERIOD
+    assert store.counters["granted"] == 1
+
+
+async def test_same_plan_stacks_and_a_different_plan_starts_over(db):
+    store = Entitlements()
+    email = unique_email()
+    await store.grant(db, email, "starter", "stripe", "txn_1", at=T0)
+    stacked = await store.grant(db, email, "starter", "manual", "ORD1", at=T0 + timedelta(days=5))
+    assert (stacked["starts_at"], stacked["expires_at"]) == (T0, T0 + 2 * PERIOD)
+
+    upgraded = await store.grant(db, email, "pro", "razorpay", "order_1", at=T0 + timedelta(days=10))
+    assert (upgraded["starts_at"], upgraded["expires_at"]) == (T0 + timedelta(days=10), T0 + timedelta(days=10) + PERIOD)
+    assert upgraded["limits"]["words_per_month"] == 100000
+    assert upgraded["grants"] == ["stripe:txn_1", "manual:ORD1", "razorpay:order_1"]
+
+
+async def test_concurrent_grants_all_stack(db):
+    store = Entitlements()
+    email = unique_email()
+    # Mongo keeps milliseconds
+    now = datetime.utcnow().replace(microsecond=0)
+    await asyncio.gather(*(store.grant(db, email, "starter", "stripe", f"txn_{i}", at=now) for i in range(5)))
+    doc = await db.entitlements.find_one({"_id": email})
+    assert len(doc["grants"]) == 5
+    assert doc["expires_at"] == now + 5 * PERIOD
+
+
+async def test_unknown_package_or_guest_is_skipped(db):
+    store = Entitlements()
+    assert await store.grant(db, unique_email(), "platinum", "stripe", "txn_1") is None
+    assert await store.grant(db, "guest", "starter", "stripe", "txn_2") is None
+    assert store.counters["skipped"] == 2
+
+
+async def test_lookup_is_cached_until_invalidated(db):
+    store = Entitlements()
+    email = unique_email()
+    await store.lookup(db, email)
+    await store.lookup(db, email.upper())
+    assert (store.counters["misses"], store.counters["hits"]) == (1, 1)
+
+    await store.grant(db, email, "pro", "stripe", "txn_1")
+    plan = await store.lookup(db, email)
+    assert plan["plan"] == "pro" and plan["active"] is True
+    assert store.counters["misses"] == 2
+
+
+class SlowDB:
+    """Reads that take a moment, so concurrent lookups overlap"""
+
+    def __init__(self):
+        self.reads = 0
+
+    def __getitem__(self, name):
+        return self
+
+    async def find_one(self, *args):
+        self.reads += 1
+        await asyncio.sleep(0.01)
+        return None
+
+
+async def test_concurrent_lookups_share_one_read():
+    store = Entitlements()
+    db = SlowDB()
+    await asyncio.gather(*(store.lookup(db, "a@example.com") for _ in range(10)))
+    assert db.reads == 1
+    assert store.counters["misses"] == 1
+    assert store.counters["coalesced"] == 9
+
+
+async def test_expired_plan_falls_back_to_free(db):
+    store = Entitlements()
+    email = unique_email()
+    await store.grant(db, email, "pro", "stripe", "txn_1", at=datetime.utcnow() - 2 * PERIOD)
+    plan = await store.lookup(db, email)
+    assert plan["plan"] == FREE_PLAN["plan"] and plan["active"] is False
+    assert plan["expired_at"] is not None
+
+
+async def test_rebuild_replays_paid_and_verified_payments_in_order(db):
+    store = Entitlements()
+    email = unique_email()
+    now = datetime.utcnow().replace(microsecond=0)
+    await db.payment_transactions.insert_many([
+        {"id": "t1", "user_email": email.upper(), "package_id": "starter", "payment_gateway": "stripe",
+         "payment_status": "paid", "created_at": now - timedelta(days=3)},
+        {"id": "t2", "user_email": email, "package_id": "starter", "payment_gateway": "stripe",
+         "payment_status": "failed", "created_at": now - timedelta(days=2)},
+    ])
+    await db.manual_payments.insert_many([
+        {"order_id": "ORD1", "user_email": email, "package_id": "starter", "status": "verified",
+         "created_at": now - timedelta(days=2), "verified_at": now - timedelta(days=1)},
+        {"order_id": "ORD2", "user_email": email, "package_id": "pro", "status": "rejected",
+         "created_at": now - timedelta(days=2)},
+    ])
+    # A stale plan from a payment that no longer counts
+    await store.grant(db, email, "pro", "manual", "ORD2")
+
+    report = await store.rebuild(db, email)
+    assert report["payments"] == 2
+    assert report["entitlement"]["plan"] == "starter"
+    assert report["entitlement"]["expires_at"] == now - timedelta(days=3) + 2 * PERIOD
+    doc = await db.entitlements.find_one({"_id": email})
+    assert doc["grants"] == ["stripe:t1", "manual:ORD1"]
+
+
+async def test_rebuild_without_payments_removes_the_plan(db):
+    store = Entitlements()
+    email = unique_email()
+    await store.grant(db, email, "pro", "stripe", "txn_1")
+    report = await store.rebuild(db, email)
+    assert report["payments"] == 0
+    assert report["entitlement"]["plan"] == FREE_PLAN["plan"]
+    assert await db.entitlements.find_one({"_id": email}) is None
+
+
+async def test_verifying_a_manual_payment_grants_the_plan(client):
+    email = unique_email()
+    payment = {
+        "package_id": "pro", "package_name": "Pro", "amount": 6500, "currency": "INR",
+        "payment_method": "upi", "transaction_id": "UTR1", "user_name": "A", "user_email": email,
+    }
+    order_id = (await client.post("/api/manual-payments/submit-payment", json=payment)).json()["order_id"]
+    assert (await client.get(f"/api/entitlements/{email}")).json()["plan"] == FREE_PLAN["plan"]
+
+    assert (await client.post(f"/api/manual-payments/verify-payment/{order_id}")).status_code == 200
+    payments = database.get_db().manual_payments
+    for _ in range(50):
+        payment = await payments.find_one({"order_id": order_id})
+        if entitlements_module.PENDING_FIELD not in payment:
+            break
+        await asyncio.sleep(0.01)
+    # The marker set with the transition is cleared once the plan is in place
+    assert entitlements_module.PENDING_FIELD not in payment
+    plan = (await client.get(f"/api/entitlements/{email}")).json()
+    assert plan["plan"] == "pro" and plan["active"] is True
+
+
+async def test_resume_pending_finishes_grants_left_by_a_dead_worker(db):
+    store = Entitlements()
+    email = unique_email()
+    await db.payment_transactions.insert_many([
+        {"id": "t1", "user_email": email, "package_id": "starter", "payment_gateway": "stripe",
+         "payment_status": "paid", entitlements_module.PENDING_FIELD: True},
+        # Already granted: no marker
+        {"id": "t2", "user_email": email, "package_id": "pro", "payment_gateway": "stripe", "payment_status": "paid"},
+    ])
+    await db.manual_payments.insert_many([
+        {"order_id": "ORD1", "user_email": email, "package_id": "starter", "status": "verified",
+         entitlements_module.PENDING_FIELD: True},
+        # Nothing to grant, but the marker still goes
+        {"order_id": "ORD2", "user_email": "guest", "package_id": "starter", "status": "verified",
+         entitlements_module.PENDING_FIELD: True},
+    ])
+
+    assert await store.resume_pending(db) == 3
+    doc = await db.entitlements.find_one({"_id": email})
+    assert (doc["plan"], doc["grants"]) == ("starter", ["stripe:t1", "manual:ORD1"])
+    assert await db.payment_transactions.count_documents({entitlements_module.PENDING_FIELD: True}) == 0
+    assert await db.manual_payments.count_documents({entitlements_module.PENDING_FIELD: True}) == 0
+    assert await store.resume_pending(db) == 0
+
+
+async def test_failed_grant_keeps_the_payment_marked(db, monkeypatch):
+    store = Entitlements()
+    await db.payment_transactions.insert_one(
+        {"id": "t1", "user_email": unique_email(), "package_id": "starter", "payment_gateway": "stripe",
+         "payment_status": "paid", entitlements_module.PENDING_FIELD: True})
+
+    async def contended(*args, **kwargs):
+        raise RuntimeError("kept changing")
+
+    monkeypatch.setattr(store, "grant", contended)
+    assert await store.resume_pending(db) == 0
+    assert store.counters["grant_errors"] == 1
+    assert await db.payment_transactions.count_documents({entitlements_module.PENDING_FIELD: True}) == 1
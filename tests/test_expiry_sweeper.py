@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.expiry_sweeper import ExpirySweeper, LEASE_COLLECTION, LEASE_ID
+
+pytestmark = pytest.mark.anyio
+
+OLD = datetime.utcnow() - timedelta(days=60)
+
+
+def sweeper(**kwargs) -> ExpirySweeper:
+    return ExpirySweeper(max_per_second=0, busy_requests=0, **kwargs)
+
+
+async def insert_transaction(db, transaction_id, payment_status, created_at=OLD):
+    await db.payment_transactions.insert_one({
+        "id": transaction_id, "payment_status": payment_status, "status": "open",
+        "payment_gateway": "stripe", "user_email": "a@example.com", "package_id": "starter",
+        "amount": 29.0, "currency": "usd", "created_at": created_at,
+    })
+
+
+async def statuses(db):
+    return {t["id"]: t["payment_status"] async for t in db.payment_transactions.find()}
+
+
+async def test_pending_and_unpaid_transactions_expire(db):
+    await insert_transaction(db, "t1", "pending")
+    await insert_transaction(db, "t2", "unpaid")
+    await insert_transaction(db, "t3", "paid")
+    await insert_transaction(db, "t4", "unpaid", created_at=datetime.utcnow())
+
+    report = await sweeper(reconcile=False).sweep(db)
+    assert report["collections"]["payment_transactions"]["expired"] == 2
+    assert await statuses(db) == {"t1": "expired", "t2": "expired", "t3": "paid", "t4": "unpaid"}
+
+
+async def test_unpaid_transaction_paid_at_the_gateway_is_marked_paid(db):
+    await insert_transaction(db, "t1", "unpaid")
+    job = sweeper()
+
+    async def paid(doc):
+        return "paid"
+
+    job.register("stripe", paid)
+    report = await job.sweep(db)
+    assert report["collections"]["payment_transactions"]["reconciled_paid"] == 1
+    assert await statuses(db) == {"t1": "paid"}
+
+
+async def test_only_the_lease_holder_sweeps(db):
+    await insert_transaction(db, "t1", "pending")
+    first, second = sweeper(reconcile=False), sweeper(reconcile=False)
+    assert await first._acquire_lease(db)
+
+    assert await second.sweep(db) is None
+    assert second.counters["lease_busy"] == 1
+    assert await statuses(db) == {"t1": "pending"}
+
+    # The holder sweeps (renewing its own lease) and lets go afterwards
+    assert (await first.sweep(db))["collections"]["payment_transactions"]["expired"] == 1
+    assert await db[LEASE_COLLECTION].find_one({"_id": LEASE_ID}) is None
+    assert await second.sweep(db) is not None
+
+
+async def test_a_stale_lease_is_taken_over(db):
+    await db[LEASE_COLLECTION].insert_one({
+        "_id": LEASE_ID, "owner": "dead-worker", "expires_at": datetime.utcnow() - timedelta(seconds=1),
+    })
+    job = sweeper(reconcile=False)
+    assert await job.sweep(db) is not None
+    assert job.counters["lease_busy"] == 0
+
+
+async def test_sweep_stops_when_its_lease_is_taken_over(db):
+    await insert_transaction(db, "t1", "pending")
+    await insert_transaction(db, "t2", "pending", created_at=OLD + timedelta(minutes=1))
+    job = sweeper(reconcile=False, batch_size=1)
+
+    async def stalled(rows, elapsed):
+        # Another worker takes the lease while this one is between batches
+        await db[LEASE_COLLECTION].update_one({"_id": LEASE_ID}, {"$set": {"owner": "other-worker"}})
+        return False
+
+    job._pace = stalled
+    report = await job.sweep(db)
+    assert report["lease_lost"] is True
+    assert job.counters["lease_lost"] == 1
+    assert await statuses(db) == {"t1": "expired", "t2": "pending"}
+    # The other worker's lease is left alone
+    assert (await db[LEASE_COLLECTION].find_one({"_id": LEASE_ID}))["owner"] == "other-worker"
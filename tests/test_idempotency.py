@@ -0,0 +1,197 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from services.idempotency import IdempotencyStore, REPLAYED_HEADER, COLLECTION, body_hash
+from tests.conftest import unique_email
+
+pytestmark = pytest.mark.anyio
+
+
+def counting_handler(result=None, error=None):
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        if error is not None:
+            raise error
+        return result if result is not None else {"n": len(calls)}
+
+    return handler, calls
+
+
+async def test_without_key_runs_every_time(db):
+    store = IdempotencyStore()
+    handler, calls = counting_handler()
+    await store.run(db, "route", None, {}, handler)
+    await store.run(db, "route", None, {}, handler)
+    assert len(calls) == 2
+
+
+async def test_first_response_is_replayed(db):
+    store = IdempotencyStore()
+    handler, calls = counting_handler()
+    first = await store.run(db, "route", "key-1", {"a": 1}, handler)
+    again = await store.run(db, "route", "key-1", {"a": 1}, handler)
+
+    assert first == {"n": 1}
+    assert len(calls) == 1
+    assert again.headers[REPLAYED_HEADER] == "true"
+    assert again.body == b'{"n":1}'
+    assert store.counters["executed"] == 1 and store.counters["replayed"] == 1
+
+
+async def test_replay_from_mongo_in_another_worker(db):
+    handler, calls = counting_handler()
+    await IdempotencyStore().run(db, "route", "key-1", {"a": 1}, handler)
+    # A second process has an empty in-memory cache
+    replay = await IdempotencyStore().run(db, "route", "key-1", {"a": 1}, handler)
+    assert len(calls) == 1
+    assert replay.headers[REPLAYED_HEADER] == "true"
+
+
+async def test_same_key_different_body_is_422(db):
+    store = IdempotencyStore()
+    handler, _ = counting_handler()
+    await store.run(db, "route", "key-1", {"a": 1}, handler)
+    with pytest.raises(HTTPException) as raised:
+        await store.run(db, "route", "key-1", {"a": 2}, handler)
+    assert raised.value.status_code == 422
+    with pytest.raises(HTTPException) as raised:
+        await IdempotencyStore().run(db, "route", "key-1", {"a": 2}, handler)
+    assert raised.value.status_code == 422
+
+
+async def test_keys_are_scoped_per_route(db):
+    store = IdempotencyStore()
+    handler, calls = counting_handler()
+    await store.run(db, "stripe", "key-1", {}, handler)
+    await store.run(db, "razorpay", "key-1", {}, handler)
+    assert len(calls) == 2
+
+
+async def test_concurrent_duplicates_are_coalesced(db):
+    store = IdempotencyStore()
+    handler, calls = counting_handler()
+    results = await asyncio.gather(*(store.run(db, "route", "key-1", {}, handler) for _ in range(5)))
+    assert len(calls) == 1
+    assert results[0] == {"n": 1}
+    assert store.counters["coalesced"] == 4
+
+
+class SlowCollection:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    async def find_one(self, *args, **kwargs):
+        await asyncio.sleep(0.01)
+        return await self.collection.find_one(*args, **kwargs)
+
+
+class SlowReads:
+    """Reads that take a moment, so a duplicate arrives while the first request holds the key"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __getitem__(self, name):
+        return SlowCollection(self.db[name])
+
+
+async def test_coalesced_duplicates_are_checked_against_the_stored_body(db):
+    handler, calls = counting_handler()
+    await IdempotencyStore().run(db, "route", "key-1", {"a": 1}, handler)
+
+    # Another worker: the first duplicate to arrive has a different body than the stored one
+    store = IdempotencyStore()
+    results = await asyncio.gather(
+        store.run(SlowReads(db), "route", "key-1", {"a": 2}, handler),
+        store.run(SlowReads(db), "route", "key-1", {"a": 1}, handler),
+        return_exceptions=True,
+    )
+    assert isinstance(results[0], HTTPException) and results[0].status_code == 422
+    assert results[1].headers[REPLAYED_HEADER] == "true" and results[1].body == b'{"n":1}'
+    assert len(calls) == 1
+
+
+async def test_coalesced_duplicate_runs_itself_after_a_server_error(db):
+    store = IdempotencyStore()
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise HTTPException(status_code=502, detail="Gateway down")
+        return {"n": len(calls)}
+
+    results = await asyncio.gather(
+        store.run(db, "route", "key-1", {}, flaky),
+        store.run(db, "route", "key-1", {}, flaky),
+        return_exceptions=True,
+    )
+    # The 502 released the key instead of being stored, so it is not shared either
+    assert isinstance(results[0], HTTPException) and results[0].status_code == 502
+    assert results[1] == {"n": 2}
+
+
+async def test_client_errors_are_replayed(db):
+    store = IdempotencyStore()
+    handler, calls = counting_handler(error=HTTPException(status_code=400, detail="Invalid package"))
+    for _ in range(2):
+        with pytest.raises(HTTPException) as raised:
+            await store.run(db, "route", "key-1", {}, handler)
+        assert (raised.value.status_code, raised.value.detail) == (400, "Invalid package")
+    assert len(calls) == 1
+
+
+async def test_server_errors_release_the_key(db):
+    store = IdempotencyStore()
+    failing, _ = counting_handler(error=HTTPException(status_code=502, detail="Gateway down"))
+    with pytest.raises(HTTPException):
+        await store.run(db, "route", "key-1", {}, failing)
+    assert await db[COLLECTION].count_documents({}) == 0
+
+    handler, calls = counting_handler()
+    assert await store.run(db, "route", "key-1", {}, handler) == {"n": 1}
+    assert len(calls) == 1
+
+
+async def test_in_progress_claim_from_another_worker_is_409(db):
+    store = IdempotencyStore(wait_seconds=0.2)
+    handler, _ = counting_handler()
+    other = IdempotencyStore()
+    await other._claim(db, other.record_id("route", "key-1"), "route", body_hash({}))
+    with pytest.raises(HTTPException) as raised:
+        await store.run(db, "route", "key-1", {}, handler)
+    assert raised.value.status_code == 409
+    assert store.counters["conflicts"] == 1
+
+
+async def test_overlong_key_is_400(db):
+    handler, _ = counting_handler()
+    with pytest.raises(HTTPException) as raised:
+        await IdempotencyStore().run(db, "route", "k" * 256, {}, handler)
+    assert raised.value.status_code == 400
+
+
+async def test_submit_payment_retry_returns_the_first_order(client):
+    payment = {
+        "package_id": "starter", "package_name": "Starter", "amount": 2400, "currency": "INR",
+        "payment_method": "upi", "transaction_id": "UTR123", "user_name": "A", "user_email": unique_email(),
+    }
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+    first = await client.post("/api/manual-payments/submit-payment", json=payment, headers=headers)
+    again = await client.post("/api/manual-payments/submit-payment", json=payment, headers=headers)
+    changed = await client.post("/api/manual-payments/submit-payment", json={**payment, "amount": 2401}, headers=headers)
+
+    assert first.status_code == 200 and again.status_code == 200
+    assert again.json()["order_id"] == first.json()["order_id"]
+    assert again.headers[REPLAYED_HEADER] == "true"
+    assert changed.status_code == 422
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from services import pagination
+from services.pagination import InvalidCursor
+from tests.conftest import unique_email
+
+pytestmark = pytest.mark.anyio
+
+T0 = datetime(2026, 5, 1, 12, 0, 0)
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 5, 1, 12, 30, 15, 123456)
+    token = pagination.encode_cursor(created_at, "ORD1234")
+    assert "=" not in token
+    assert pagination.decode_cursor(token) == (created_at, "ORD1234")
+
+
+@pytest.mark.parametrize("token", ["", "not-base64!", "bm90IGpzb24", "WzFd", "WyJub3QgYSBkYXRlIiwgImsiXQ"])
+def test_bad_cursors_raise_invalid_cursor(token):
+    with pytest.raises(InvalidCursor):
+        pagination.decode_cursor(token)
+
+
+def test_split_page():
+    rows = [{"created_at": T0 - timedelta(minutes=i), "order_id": f"O{i}"} for i in range(3)]
+    page, cursor = pagination.split_page(rows, "order_id", limit=2)
+    assert page == rows[:2]
+    assert pagination.decode_cursor(cursor) == (rows[1]["created_at"], "O1")
+
+    page, cursor = pagination.split_page(rows, "order_id", limit=3)
+    assert page == rows and cursor is None
+
+
+def test_clamp_limit():
+    assert pagination.clamp_limit(0) == 1
+    assert pagination.clamp_limit(50) == 50
+    assert pagination.clamp_limit(10_000) == pagination.MAX_PAGE_SIZE
+
+
+async def test_keyset_pages_cover_every_row_once_with_tied_timestamps(db):
+    # Several rows per timestamp: the key breaks ties so none are skipped or repeated
+    docs = [
+        {"order_id": f"O{i:03d}", "created_at": T0 - timedelta(minutes=i // 3), "status": "pending"}
+        for i in range(20)
+    ]
+    docs.append({"order_id": "X999", "created_at": T0, "status": "verified"})
+    await db.manual_payments.insert_many(docs)
+
+    seen, cursor = [], None
+    while True:
+        query = pagination.keyset_query({"status": "pending"}, "order_id", cursor)
+        rows = await db.manual_payments.find(query, {"_id": 0}).sort(
+            pagination.keyset_sort("order_id")
+        ).limit(4 + 1).to_list(None)
+        page, cursor = pagination.split_page(rows, "order_id", 4)
+        seen.extend(row["order_id"] for row in page)
+        if cursor is None:
+            break
+
+    expected = sorted(docs[:-1], key=lambda d: (d["created_at"], d["order_id"]), reverse=True)
+    assert seen == [d["order_id"] for d in expected]
+
+
+def test_keyset_query_date_bounds():
+    query = pagination.keyset_query({"status": "pending"}, "order_id", date_from=T0, date_to=T0 + timedelta(days=1))
+    assert query == {"status": "pending", "created_at": {"$gte": T0, "$lt": T0 + timedelta(days=1)}}
+
+
+async def test_pending_payments_endpoint_pages_and_rejects_bad_cursors(client):
+    email = unique_email()
+    payment = {
+        "package_id": "starter", "package_name": "Starter", "amount": 2400, "currency": "INR",
+        "payment_method": "bank_transfer", "user_name": "A", "user_email": email,
+    }
+    created = []
+    for _ in range(5):
+        response = await client.post("/api/manual-payments/submit-payment", json=payment)
+        created.append(response.json()["order_id"])
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, "method": "bank_transfer"}
+        if cursor:
+            params["cursor"] = cursor
+        page = (await client.get("/api/manual-payments/pending-payments", params=params)).json()
+        assert page["count"] <= 2
+        seen.extend(p["order_id"] for p in page["payments"] if p["user_email"] == email)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(created)
+
+    response = await client.get("/api/manual-payments/pending-payments", params={"cursor": "garbage!"})
+    assert response.status_code == 400
@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from services import rate_limit
+from services.rate_limit import AdmissionGate, LocalBucketBackend, RateLimiter
+
+pytestmark = pytest.mark.anyio
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+async def test_bucket_allows_the_burst_then_refills(clock):
+    backend = LocalBucketBackend()
+    decisions = [(await backend.take("k", rate=1.0, burst=3))[0] for _ in range(4)]
+    assert decisions == [True, True, True, False]
+
+    clock.now += 1.0
+    assert (await backend.take("k", rate=1.0, burst=3))[0] is True
+    assert (await backend.take("k", rate=1.0, burst=3))[0] is False
+
+    # Refill never goes past the burst
+    clock.now += 60
+    decisions = [(await backend.take("k", rate=1.0, burst=3))[0] for _ in range(4)]
+    assert decisions == [True, True, True, False]
+
+
+async def test_buckets_are_per_key_and_bounded(clock):
+    backend = LocalBucketBackend(max_keys=2)
+    assert (await backend.take("a", 1.0, 1))[0]
+    assert not (await backend.take("a", 1.0, 1))[0]
+    assert (await backend.take("b", 1.0, 1))[0]
+    await backend.take("c", 1.0, 1)
+    # "a" was least recently used and evicted; it starts with a full bucket again
+    assert list(backend._buckets) == ["b", "c"]
+    assert (await backend.take("a", 1.0, 1))[0]
+
+
+async def test_limiter_raises_429_with_retry_after(clock):
+    limiter = RateLimiter(LocalBucketBackend(), enabled=True)
+    limiter.limits["email"] = (10 / 60, 2)
+    await limiter.check("route", "email", "a@example.com")
+    await limiter.check("route", "email", "a@example.com")
+    with pytest.raises(HTTPException) as raised:
+        await limiter.check("route", "email", "a@example.com")
+    assert raised.value.status_code == 429
+    assert raised.value.headers["Retry-After"] == "6"
+    # Other customers are unaffected
+    await limiter.check("route", "email", "b@example.com")
+    assert limiter.counters == {"allowed": 3, "limited": 1, "backend_errors": 0}
+
+
+async def test_limiter_fails_open_on_backend_errors():
+    class Broken:
+        async def take(self, key, rate, burst):
+            raise ConnectionError("redis down")
+
+    limiter = RateLimiter(Broken(), enabled=True)
+    await limiter.check("route", "ip", "1.2.3.4")
+    assert limiter.counters["backend_errors"] == 1
+
+
+async def test_disabled_limiter_and_missing_identity_skip(clock):
+    limiter = RateLimiter(LocalBucketBackend(), enabled=False)
+    limiter.limits["ip"] = (1.0, 0)
+    await limiter.check("route", "ip", "1.2.3.4")
+    enabled = RateLimiter(LocalBucketBackend(), enabled=True)
+    await enabled.check("route", "ip", None)
+    assert enabled.counters["allowed"] == 0
+
+
+async def hold(gate: AdmissionGate, release: asyncio.Event):
+    async with gate.admit("route"):
+        await release.wait()
+
+
+async def test_admission_sheds_when_the_queue_is_full():
+    gate = AdmissionGate(max_concurrency=1, max_queue=1, queue_timeout_ms=5000, shed_latency_ms=0)
+    release = asyncio.Event()
+    active = asyncio.create_task(hold(gate, release))
+    await asyncio.sleep(0)
+    queued = asyncio.create_task(hold(gate, release))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as raised:
+        async with gate.admit("route"):
+            pass
+    assert raised.value.status_code == 503
+    assert raised.value.headers["Retry-After"] == "1"
+    assert gate.counters["shed_queue_full"] == 1
+
+    release.set()
+    await asyncio.gather(active, queued)
+    assert gate.counters["admitted"] == 2
+    assert gate.active == 0 and gate.waiting == 0
+
+
+async def test_admission_sheds_after_the_queue_timeout():
+    gate = AdmissionGate(max_concurrency=1, max_queue=5, queue_timeout_ms=20, shed_latency_ms=0)
+    release = asyncio.Event()
+    active = asyncio.create_task(hold(gate, release))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as raised:
+        async with gate.admit("route"):
+            pass
+    assert raised.value.status_code == 503
+    assert gate.counters["shed_timeout"] == 1
+    release.set()
+    await active
+    # The slot the timed-out request never got is still free
+    async with gate.admit("route"):
+        pass
+
+
+async def test_admission_sheds_on_latency_only_while_queueing():
+    gate = AdmissionGate(max_concurrency=1, max_queue=5, queue_timeout_ms=5000, shed_latency_ms=100)
+    gate.latency_ewma = 1.0
+    # Nothing is queued: slow but idle workers still take requests
+    async with gate.admit("route"):
+        pass
+    gate.latency_ewma = 1.0
+
+    release = asyncio.Event()
+    active = asyncio.create_task(hold(gate, release))
+    await asyncio.sleep(0)
+    with pytest.raises(HTTPException):
+        async with gate.admit("route"):
+            pass
+    assert gate.counters["shed_latency"] == 1
+    release.set()
+    await active
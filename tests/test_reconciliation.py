@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+import io
+
+import pytest
+
+from services import manual_review
+from services.reconciliation import PendingIndex, Reconciler, iter_statement_rows, reconcile_statement
+
+pytestmark = pytest.mark.anyio
+
+T0 = datetime(2026, 5, 1, 10, 0)
+
+
+def statement(text: str) -> io.BytesIO:
+    return io.BytesIO(text.encode("utf-8-sig"))
+
+
+def build_index():
+    index = PendingIndex()
+    index.add("ORD1", "UTR1111111111", 2400.0, T0)
+    index.add("ORD2", "UTR2222222222", 6500.0, T0)
+    index.add("ORD3", None, 999.0, T0)
+    index.add("ORD4", None, 500.0, T0)
+    index.add("ORD5", None, 500.0, T0 + timedelta(hours=1))
+    return index.finalize()
+
+
+def test_statement_rows_use_header_aliases_and_skip_debits():
+    rows = list(iter_statement_rows(statement(
+        "Txn Date,Narration,UTR No,Credit\n"
+        "01/05/2026,UPI/UTR1111111111/payer,UTR1111111111,\"2,400.00\"\n"
+        "01/05/2026,ATM withdrawal,,0\n"
+        "01/05/2026,short row\n"
+        "02/05/2026,NEFT,X1,abc\n"
+        "02/05/2026,NEFT,X2,100.5\n"
+    )))
+    assert [(r.line_no, r.transaction_id, r.amount_paise) for r in rows] == [
+        (2, "UTR1111111111", 240000),
+        (6, "X2", 10050),
+    ]
+    assert rows[0].date == datetime(2026, 5, 1)
+
+
+def test_statement_without_amount_column_is_rejected():
+    with pytest.raises(ValueError):
+        list(iter_statement_rows(statement("reference,notes\nX,Y\n")))
+
+
+def test_matching_kinds():
+    reconciler = Reconciler(build_index(), timedelta(days=1), amount_tolerance=1.0)
+    report = reconciler.run(iter_statement_rows(statement(
+        "date,transaction_id,description,amount\n"
+        "2026-05-01,UTR1111111111,,2400.50\n"     # by id, within tolerance
+        "2026-05-01,UTR1111111111,,2400\n"        # same id again
+        "2026-05-01,,NEFT UTR2222222222 X,6400\n" # id found in the description, wrong amount
+        "2026-05-01,,,999\n"                      # single pending payment of that amount
+        "2026-05-01,,,500\n"                      # two candidates
+        "2026-05-01,,,123\n"
+    )))
+    assert report["statement_rows"] == 6
+    assert report["counts"] == {
+        "transaction_id": 1, "duplicate": 1, "amount_mismatch": 1,
+        "amount_date": 1, "ambiguous": 1, "unmatched": 1,
+    }
+    assert [m["order_id"] for m in report["matches"]["transaction_id"]] == ["ORD1"]
+    assert [m["order_id"] for m in report["matches"]["amount_date"]] == ["ORD3"]
+    mismatch = report["samples"]["amount_mismatch"][0]
+    assert (mismatch["order_id"], mismatch["expected_amount"], mismatch["statement_amount"]) == ("ORD2", 6500.0, 6400.0)
+    assert report["samples"]["ambiguous"][0]["candidates"] == ["ORD4", "ORD5"]
+
+
+def test_amount_date_matching_respects_the_window_and_can_be_off():
+    rows = "date,transaction_id,amount\n2026-05-20,,999\n"
+    assert Reconciler(build_index(), timedelta(days=1)).run(
+        iter_statement_rows(statement(rows)))["counts"] == {"unmatched": 1}
+
+    rows = "date,transaction_id,amount\n2026-05-01,,999\n"
+    assert Reconciler(build_index(), timedelta(days=1), match_amount_date=False).run(
+        iter_statement_rows(statement(rows)))["counts"] == {"unmatched": 1}
+
+
+async def insert_payment(db, order_id, transaction_id, amount, status="pending"):
+    await db.manual_payments.insert_one({
+        "order_id": order_id, "transaction_id": transaction_id, "amount": amount,
+        "status": status, "created_at": T0, "user_email": "a@example.com", "package_id": "starter",
+    })
+
+
+async def test_verify_from_statement(db):
+    await insert_payment(db, "ORD1", "UTR1", 2400.0)
+    await insert_payment(db, "ORD2", "UTR2", 2400.0)
+    await insert_payment(db, "ORD3", "UTR3", 2400.0, status="expired")
+    await insert_payment(db, "ORD4", "UTR4", 2400.0, status="rejected")
+
+    report = await manual_review.verify_from_statement(db, statement(
+        "transaction_id,amount\n"
+        "UTR1,2400\n"
+        "UTR2,2000\n"
+        "UTR3,2400\n"
+        "UTR4,2400\n"
+        "UTR1,2400\n"
+        ",2400\n"
+    ), "admin")
+
+    assert report["statement_rows"] == 5
+    assert report["matched"] == 2
+    assert report["amount_mismatch_rows"] == 1
+    assert report["amount_mismatch"][0]["order_id"] == "ORD2"
+    # UTR4 is not reviewable, the second UTR1 is a duplicate
+    assert report["unmatched_rows"] == 2
+    assert {r["order_id"]: r["result"] for r in report["results"]} == {"ORD1": "verified", "ORD3": "verified"}
+
+    statuses = {p["order_id"]: p["status"] async for p in db.manual_payments.find()}
+    assert statuses == {"ORD1": "verified", "ORD2": "pending", "ORD3": "verified", "ORD4": "rejected"}
+
+
+async def test_apply_reviews_reports_each_item(db):
+    await insert_payment(db, "ORD1", "UTR1", 2400.0)
+    await insert_payment(db, "ORD2", "UTR2", 2400.0, status="verified")
+    results = await manual_review.apply_reviews(db, [
+        ("ORD1", "reject", "No money received"),
+        ("ORD1", "verify", None),
+        ("ORD2", "verify", None),
+        ("NOPE", "verify", None),
+    ], "admin")
+    assert [r["result"] for r in results] == ["rejected", "duplicate_item", "already_processed", "not_found"]
+    rejected = await db.manual_payments.find_one({"order_id": "ORD1"})
+    assert rejected["rejection_reason"] == "No money received"
+
+
+async def test_reconcile_statement_matches_and_verifies_expired_payments(db):
+    await insert_payment(db, "ORD1", "UTR1", 2400.0)
+    await insert_payment(db, "ORD2", "UTR2", 2400.0, status="expired")
+    await insert_payment(db, "ORD3", "UTR3", 2400.0, status="rejected")
+
+    report = await reconcile_statement(db, statement(
+        "transaction_id,amount\n"
+        "UTR1,2400\n"
+        "UTR2,2400\n"
+        "UTR3,2400\n"
+    ), auto_verify=True)
+
+    assert report["pending_records"] == 2
+    assert [m["order_id"] for m in report["matches"]["transaction_id"]] == ["ORD1", "ORD2"]
+    assert report["counts"]["unmatched"] == 1
+    assert report["verification"] == {"verified": 2}
+    statuses = {p["order_id"]: p["status"] async for p in db.manual_payments.find()}
+    assert statuses == {"ORD1": "verified", "ORD2": "verified", "ORD3": "rejected"}
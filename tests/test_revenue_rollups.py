@@ -0,0 +1,44 @@
+from datetime import datetime
+
+import pytest
+
+from services.revenue_rollups import RevenueRollups
+
+T0 = datetime(2026, 5, 1, 12, 0)
+
+
+def bucket(rollups: RevenueRollups, source: str) -> dict:
+    return dict(rollups._pending[("2026-05-01", source, "starter", "USD" if source == "stripe" else "INR")])
+
+
+@pytest.mark.parametrize("status", ["paid", "failed"])
+def test_transaction_settled_after_expiry_leaves_the_expired_count(status):
+    rollups = RevenueRollups()
+    doc = {"id": "t1", "payment_gateway": "stripe", "package_id": "starter", "currency": "usd", "amount": 29.0, "created_at": T0}
+    rollups.transaction_created(doc)
+    expired = {**doc, "payment_status": "expired", "expired_at": T0}
+    rollups.transaction_updated(expired)
+    rollups.transaction_updated({**expired, "payment_status": status})
+
+    counts = bucket(rollups, "stripe")
+    assert counts["created"] == 1
+    assert counts["expired"] == 0
+    assert counts[status] == 1
+    assert counts.get("revenue", 0) == (29.0 if status == "paid" else 0)
+
+
+def test_transaction_paid_without_expiry_is_counted_once():
+    rollups = RevenueRollups()
+    rollups.transaction_updated({"payment_gateway": "stripe", "package_id": "starter", "currency": "usd",
+                                 "amount": 29.0, "created_at": T0, "payment_status": "paid"})
+    assert bucket(rollups, "stripe") == {"paid": 1, "revenue": 29.0}
+
+
+def test_manual_payment_verified_after_expiry_leaves_the_expired_count():
+    rollups = RevenueRollups()
+    doc = {"order_id": "ORD1", "package_id": "starter", "currency": "INR", "amount": 2400.0, "created_at": T0}
+    expired = {**doc, "status": "expired", "expired_at": T0}
+    rollups.manual_payment_updated(expired)
+    rollups.manual_payment_updated({**expired, "status": "verified", "verified_at": T0})
+    counts = bucket(rollups, "manual")
+    assert (counts["expired"], counts["paid"], counts["revenue"]) == (0, 1, 2400.0)
@@ -0,0 +1,182 @@
+import asyncio
+import os
+
+import pytest
+from fastapi import HTTPException
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from services import usage_metering
+from services.entitlements import entitlements
+from services.usage_metering import UsageMeter, COLLECTION, count_words, current_month, usage_id
+from tests.conftest import unique_email
+
+pytestmark = pytest.mark.anyio
+
+
+class FailingCollection:
+    def __init__(self, error):
+        self.error = error
+        self.calls = []
+
+    async def bulk_write(self, ops, ordered):
+        self.calls.append(ops)
+        raise self.error
+
+
+class FailingDB:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getitem__(self, name):
+        return self.collection
+
+
+@pytest.fixture
+def meter(db):
+    meter = UsageMeter(flush_seconds=3600, snapshot_ttl=3600)
+    meter._db = db
+    return meter
+
+
+def test_count_words():
+    assert count_words("  one two\nthree\tfour  ") == 4
+    assert count_words("") == 0
+
+
+async def test_record_and_flush_increment_the_monthly_document(meter, db):
+    email = unique_email()
+    meter.record(email, "rewriter", 10, 14)
+    meter.record(email, "rewriter", 5, 7)
+    meter.record(email, "summarizer", 3, 4)
+    await meter.flush()
+
+    doc = await db[COLLECTION].find_one({"_id": usage_id((email, current_month()))})
+    assert (doc["words"], doc["tokens"], doc["requests"]) == (18, 25, 3)
+    assert doc["tools"]["rewriter"] == {"words": 15, "tokens": 21, "requests": 2}
+    assert doc["user_email"] == email
+    assert not meter._pending
+
+    # Later flushes add to it
+    meter.record(email, "rewriter", 2)
+    await meter.flush()
+    doc = await db[COLLECTION].find_one({"_id": usage_id((email, current_month()))})
+    assert doc["words"] == 20 and doc["tools"]["rewriter"]["requests"] == 3
+
+
+async def test_usage_adds_unflushed_counts_without_double_counting(meter, db):
+    email = unique_email()
+    meter.record(email, "rewriter", 10)
+    await meter.flush()
+    meter.record(email, "rewriter", 5)
+
+    usage = await meter.usage(db, email)
+    assert (usage["words"], usage["requests"]) == (15, 2)
+    # The cached flushed total moves forward with the flush instead of being re-read
+    await meter.flush()
+    usage = await meter.usage(db, email)
+    assert usage["words"] == 15
+    assert usage["tools"]["rewriter"]["words"] == 15
+    assert meter.counters["snapshot_misses"] == 1
+
+
+async def test_quota_arithmetic(meter, db):
+    email = unique_email()
+    free_words = (await entitlements.lookup(db, email))["limits"]["words_per_month"]
+
+    result = await meter.meter(db, email, "rewriter", words=free_words - 10)
+    assert (result["used"], result["remaining"], result["limit"]) == (free_words - 10, 10, free_words)
+    await meter.flush()
+
+    result = await meter.meter(db, email, "rewriter", words=10)
+    assert result["remaining"] == 0
+
+    with pytest.raises(HTTPException) as raised:
+        await meter.meter(db, email, "rewriter", words=1)
+    assert raised.value.status_code == 402
+    assert raised.value.detail["used"] == free_words
+    assert raised.value.detail["requested"] == 1
+    assert meter.counters["quota_exceeded"] == 1
+
+    # Recorded without enforcement (e.g. a tool run that already happened)
+    result = await meter.meter(db, email, "rewriter", words=5, enforce=False)
+    assert result["used"] == free_words + 5 and result["remaining"] == 0
+
+
+async def test_concurrent_requests_cannot_overshoot_the_quota(meter, db):
+    email = unique_email()
+    free_words = (await entitlements.lookup(db, email))["limits"]["words_per_month"]
+    results = await asyncio.gather(
+        *(meter.meter(db, email, "rewriter", words=free_words // 4) for _ in range(6)),
+        return_exceptions=True,
+    )
+    assert sum(1 for r in results if isinstance(r, dict)) == 4
+    assert sum(1 for r in results if isinstance(r, HTTPException)) == 2
+
+
+async def test_text_is_counted_on_the_server(meter, db):
+    result = await meter.meter(db, unique_email(), "rewriter", text="one two three four", words=0, tokens=0)
+    assert result["words"] == 4
+    assert result["tokens"] > 0
+
+
+async def test_failed_flush_puts_everything_back(meter):
+    meter.record("a@example.com", "rewriter", 5)
+    meter.record("b@example.com", "rewriter", 7)
+    meter._db = FailingDB(FailingCollection(AutoReconnect("down")))
+    await meter.flush()
+    assert {key[0]: counts["words"] for key, counts in meter._pending.items()} == {"a@example.com": 5, "b@example.com": 7}
+    assert meter.counters["flush_errors"] == 1
+
+
+async def test_partial_bulk_write_error_requeues_only_the_failed_docs(meter):
+    meter.record("a@example.com", "rewriter", 5)
+    meter.record("b@example.com", "rewriter", 7)
+    meter.record("c@example.com", "rewriter", 9)
+    error = BulkWriteError({"writeErrors": [{"index": 1, "code": 2, "errmsg": "bad update"}]})
+    meter._db = FailingDB(FailingCollection(error))
+    await meter.flush()
+    assert [key[0] for key in meter._pending] == ["b@example.com"]
+    assert meter._pending[("b@example.com", current_month())]["words"] == 7
+    assert meter.counters["flushed_docs"] == 2
+
+
+async def test_write_concern_error_does_not_requeue(meter):
+    meter.record("a@example.com", "rewriter", 5)
+    error = BulkWriteError({"writeErrors": [], "writeConcernErrors": [{"code": 64, "errmsg": "timeout"}]})
+    meter._db = FailingDB(FailingCollection(error))
+    await meter.flush()
+    # The $inc was applied on the primary; sending it again would count it twice
+    assert not meter._pending
+
+
+async def test_meter_endpoint_requires_the_service_token(client, monkeypatch):
+    url = f"/api/usage/{unique_email()}/meter"
+    body = {"tool": "rewriter", "text": "hello there"}
+
+    monkeypatch.setattr(usage_metering, "USAGE_SERVICE_TOKEN", "")
+    assert (await client.post(url, json=body)).status_code == 403
+
+    monkeypatch.setattr(usage_metering, "USAGE_SERVICE_TOKEN", "s3cret")
+    assert (await client.post(url, json=body)).status_code == 401
+    assert (await client.post(url, json=body, headers={"X-Service-Token": "wrong"})).status_code == 401
+
+    response = await client.post(url, json=body, headers={"X-Service-Token": "s3cret"})
+    assert response.status_code == 200
+    assert response.json()["words"] == 2
+
+
+def test_tokenizer_failures_warn_once_and_leave_the_environment_alone(monkeypatch, caplog):
+    import tiktoken
+
+    def unavailable(name):
+        raise OSError("no network")
+
+    monkeypatch.setattr(tiktoken, "get_encoding", unavailable)
+    monkeypatch.delenv("TIKTOKEN_CACHE_DIR", raising=False)
+    counter = usage_metering.TokenCounter()
+    with caplog.at_level("DEBUG", logger=usage_metering.__name__):
+        counter._load()
+        counter._load()
+    assert [r.levelname for r in caplog.records] == ["WARNING", "DEBUG"]
+    assert "TIKTOKEN_CACHE_DIR" not in os.environ
+    assert not counter.exact and counter.count("abcdefgh") == 2
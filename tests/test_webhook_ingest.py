@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+import asyncio
+import json
+import uuid
+
+import pytest
+
+import harness
+from services import webhook_ingest
+from services.webhook_ingest import COLLECTION, WebhookIngestor
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(webhook_ingest, "WEBHOOK_RETRY_BASE_SECONDS", 0.01)
+
+
+async def wait_for_status(db, key, status, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        event = await db[COLLECTION].find_one({"_id": key})
+        if event and event["status"] == status:
+            return event
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"{key} never reached {status}: {event}")
+
+
+async def test_duplicates_are_dropped_in_memory_and_in_mongo(db):
+    ingestor = WebhookIngestor()
+    assert await ingestor.ingest(db, "stripe", "evt_1", "checkout.session.completed", {}) == "accepted"
+    assert await ingestor.ingest(db, "stripe", "evt_1", "checkout.session.completed", {}) == "duplicate"
+    # Another worker has not seen it, but the event log has
+    assert await WebhookIngestor().ingest(db, "stripe", "evt_1", "checkout.session.completed", {}) == "duplicate"
+    # Event ids are per gateway
+    assert await ingestor.ingest(db, "razorpay", "evt_1", "payment.captured", {}) == "accepted"
+    assert await db[COLLECTION].count_documents({}) == 2
+    # Not started: left for recovery
+    assert ingestor.counters["deferred"] == 2
+
+
+async def test_failed_handler_is_retried_until_it_succeeds(db, fast_retries):
+    calls = []
+
+    async def flaky(db, data):
+        calls.append(data)
+        if len(calls) < 3:
+            raise RuntimeError("transaction not found yet")
+
+    ingestor = WebhookIngestor(workers=1, max_attempts=5)
+    ingestor.register("stripe", flaky)
+    ingestor.start(db)
+    try:
+        await ingestor.ingest(db, "stripe", "evt_1", "checkout.session.completed", {"session_id": "cs_1"})
+        event = await wait_for_status(db, "stripe:evt_1", "processed")
+    finally:
+        await ingestor.stop()
+    assert len(calls) == 3
+    assert event["attempts"] == 3
+    assert ingestor.counters["retried"] == 2 and ingestor.counters["processed"] == 1
+
+
+async def test_event_fails_after_max_attempts_and_can_be_replayed(db, fast_retries):
+    broken = True
+
+    async def handler(db, data):
+        if broken:
+            raise RuntimeError("boom")
+
+    ingestor = WebhookIngestor(workers=1, max_attempts=2)
+    ingestor.register("stripe", handler)
+    ingestor.start(db)
+    try:
+        await ingestor.ingest(db, "stripe", "evt_1", "checkout.session.completed", {})
+        event = await wait_for_status(db, "stripe:evt_1", "failed")
+        assert event["attempts"] == 2 and event["last_error"] == "boom"
+
+        broken = False
+        assert await ingestor.replay("stripe:evt_1")
+        await wait_for_status(db, "stripe:evt_1", "processed")
+        assert not await ingestor.replay("stripe:unknown")
+    finally:
+        await ingestor.stop()
+
+
+async def test_recovery_requeues_stuck_events(db):
+    handled = []
+
+    async def handler(db, data):
+        handled.append(data["n"])
+
+    ingestor = WebhookIngestor(workers=1)
+    ingestor.register("stripe", handler)
+    # Logged by workers that died before (or while) processing them, long enough ago
+    long_ago = datetime.utcnow() - timedelta(seconds=webhook_ingest.WEBHOOK_RECOVERY_AFTER_SECONDS + 60)
+    await ingestor.ingest(db, "stripe", "evt_1", "t", {"n": 1})
+    await db[COLLECTION].update_one({"_id": "stripe:evt_1"}, {"$set": {"received_at": long_ago}})
+    await db[COLLECTION].insert_one({
+        "_id": "stripe:evt_2", "gateway": "stripe", "event_id": "evt_2", "event_type": "t",
+        "data": {"n": 2}, "status": "processing", "attempts": 1,
+        "received_at": long_ago, "processing_at": long_ago,
+    })
+    ingestor.start(db)
+    try:
+        await wait_for_status(db, "stripe:evt_1", "processed")
+        await wait_for_status(db, "stripe:evt_2", "processed")
+    finally:
+        await ingestor.stop()
+    assert sorted(handled) == [1, 2]
+
+
+async def test_razorpay_webhook_redelivery_is_acknowledged_once(client):
+    body = json.dumps({
+        "event": "payment.captured",
+        "payload": {"payment": {"entity": {"id": f"pay_{uuid.uuid4().hex[:10]}", "order_id": "order_missing"}}},
+    }).encode()
+    headers = {
+        "X-Razorpay-Signature": harness.razorpay_webhook_signature(body),
+        "X-Razorpay-Event-Id": f"evt_{uuid.uuid4().hex}",
+        "Content-Type": "application/json",
+    }
+    first = await client.post("/api/payments/razorpay/webhook", content=body, headers=headers)
+    again = await client.post("/api/payments/razorpay/webhook", content=body, headers=headers)
+    assert first.json() == {"status": "accepted"}
+    assert again.json() == {"status": "duplicate"}
+
+    forged = await client.post("/api/payments/razorpay/webhook", content=body, headers={**headers, "X-Razorpay-Signature": "0" * 64})
+    assert forged.status_code == 400
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from services.write_behind import WriteBehindBuffer
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeCollection:
+    """Records bulk_write calls; raises the queued errors first"""
+
+    name = "fake"
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = []
+
+    async def bulk_write(self, ops, ordered):
+        assert ordered
+        self.calls.append(list(ops))
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+def ops(count):
+    return [InsertOne({"_id": i}) for i in range(count)]
+
+
+async def test_disabled_buffer_writes_through(db):
+    buffer = WriteBehindBuffer(enabled=False)
+    buffer.start()
+    await buffer.insert_one(db.things, {"_id": 1})
+    assert await db.things.find_one({"_id": 1}) == {"_id": 1}
+    assert buffer.counters["queued"] == 0
+
+
+async def test_updates_apply_after_the_insert_they_follow(db):
+    buffer = WriteBehindBuffer(enabled=True, flush_ms=10_000)
+    buffer.start()
+    try:
+        await buffer.insert_one(db.things, {"_id": 1, "status": "pending"})
+        await buffer.update_one(db.things, {"_id": 1}, {"$set": {"status": "paid"}})
+        await buffer.update_one(db.things, {"_id": 1}, {"$set": {"status": "refunded"}})
+        assert await db.things.find_one({"_id": 1}) is None
+        assert buffer.pending == 3
+
+        await buffer.flush("things")
+        assert await db.things.find_one({"_id": 1}) == {"_id": 1, "status": "refunded"}
+        assert buffer.counters["written"] == 3 and buffer.counters["batches"] == 1
+    finally:
+        await buffer.stop()
+
+
+async def test_full_batch_wakes_the_flusher(db):
+    buffer = WriteBehindBuffer(enabled=True, max_batch=3, flush_ms=10_000)
+    buffer.start()
+    try:
+        for i in range(3):
+            await buffer.insert_one(db.things, {"_id": i})
+        for _ in range(50):
+            if buffer.pending == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert await db.things.count_documents({}) == 3
+    finally:
+        await buffer.stop()
+
+
+async def test_stop_writes_out_what_is_buffered(db):
+    buffer = WriteBehindBuffer(enabled=True, flush_ms=10_000)
+    buffer.start()
+    await buffer.insert_one(db.things, {"_id": 1})
+    await buffer.stop()
+    assert await db.things.count_documents({}) == 1
+
+
+async def test_failing_op_is_dropped_and_the_rest_continue():
+    error = BulkWriteError({"writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate key"}]})
+    collection = FakeCollection(error)
+    buffer = WriteBehindBuffer()
+    batch = ops(4)
+    await buffer._write("fake", collection, batch)
+
+    assert collection.calls == [batch, batch[2:]]
+    assert buffer.counters["written"] == 3
+    assert buffer.counters["dropped"] == 1
+    assert buffer.counters["retried"] == 0
+
+
+async def test_write_concern_only_error_is_retried():
+    error = BulkWriteError({"writeErrors": [], "writeConcernErrors": [{"code": 64, "errmsg": "waiting for replication timed out"}]})
+    collection = FakeCollection(error)
+    buffer = WriteBehindBuffer()
+    batch = ops(2)
+    await buffer._write("fake", collection, batch)
+
+    assert collection.calls == [batch, batch]
+    assert buffer.counters["retried"] == 1
+    assert buffer.counters["written"] == 2
+
+
+async def test_batch_is_dropped_after_max_attempts():
+    collection = FakeCollection(AutoReconnect("down"), AutoReconnect("down"))
+    buffer = WriteBehindBuffer(max_attempts=2)
+    await buffer._write("fake", collection, ops(3))
+
+    assert len(collection.calls) == 2
+    assert buffer.counters["retried"] == 1
+    assert buffer.counters["dropped"] == 3
+    assert buffer.counters["written"] == 0
+
+
+async def test_ops_for_one_collection_keep_queue_order():
+    collection = FakeCollection()
+    buffer = WriteBehindBuffer(enabled=True, max_batch=2, flush_ms=10_000)
+    buffer.start()
+    try:
+        updates = [UpdateOne({"_id": 1}, {"$set": {"step": i}}) for i in range(5)]
+        for op in updates:
+            await buffer._queue(collection, op)
+        await buffer.flush("fake")
+    finally:
+        await buffer.stop()
+    assert [op for call in collection.calls for op in call] == updates
+    assert all(len(call) <= 2 for call in collection.calls)